@@ -2,25 +2,56 @@ import os
 import io
 import csv
 import re
+import sys
+import gzip
+import json
+import socket
+import mimetypes
+import hashlib
+import hmac
+import cProfile
+import tempfile
+import threading
+import unicodedata
+import queue
+import selectors
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from time import perf_counter, sleep
 from sqlalchemy import text  # <-- pon este import junto a los demás de SQLAlchemy
 from statistics import mean
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date, time, timedelta, timezone
 
 from flask import (
     Flask, render_template, request, redirect, url_for,
-    flash, send_file, jsonify
+    flash, send_file, send_from_directory, jsonify, Response, g, has_request_context, session
 )
 
 # ---------- BD ----------
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Date, DateTime, Time, Float, Text
+    create_engine, Column, Integer, String, Date, DateTime, Time, Float, Text, select,
+    update, delete, event, inspect, or_, func, cast, literal, type_coerce, union_all
 )
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, DisconnectionError, OperationalError
+from sqlalchemy.pool import QueuePool, NullPool
+
+from markupsafe import Markup
+from werkzeug.datastructures import MultiDict
 
 # Excel
 from openpyxl import Workbook, load_workbook
 
+try:
+    import fcntl
+except ImportError:  # Windows: el archivo de eventos se escribe sin lock
+    fcntl = None
+try:
+    import brotli  # opcional: sin él se comprime solo con gzip
+except ImportError:
+    brotli = None
+
 
 # -----------------------------------------------------------------------------
 # App / Config
@@ -28,10 +59,18 @@ from openpyxl import Workbook, load_workbook
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret")
 
+# Token para los endpoints /admin/* (si no está definido, quedan deshabilitados)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
 
 def normalize_db_url(url: str) -> str:
     """Render / Supabase suelen dar postgres://; SQLAlchemy espera postgresql+psycopg2://
-       y en entornos gestionados pedimos sslmode=require por defecto."""
+       y en entornos gestionados pedimos sslmode=require por defecto.
+       sqlite:///ruta.db (modo local sin red) se deja tal cual."""
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            raise RuntimeError("SQLite necesita un archivo (sqlite:///ruta.db): cada worker tendría su propia BD en memoria")
+        return url
     if url.startswith("postgres://"):
         url = url.replace("postgres://", "postgresql+psycopg2://", 1)
     elif url.startswith("postgresql://"):
@@ -43,79 +82,615 @@ def normalize_db_url(url: str) -> str:
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 if not DATABASE_URL:
-    raise RuntimeError("Falta la variable de entorno DATABASE_URL")
+    raise RuntimeError("Falta la variable de entorno DATABASE_URL (Postgres, o sqlite:///5s.db para modo local)")
+
+# --- Pool de conexiones (uno por worker; lo comparten sus hilos gthread) ---
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))          # = --threads de render.yaml
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # seg. esperando una conexión libre
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # seg.; -1 = nunca
+# always: ping en cada checkout | idle: solo si la conexión estuvo ociosa > DB_PRE_PING_IDLE_S | never
+DB_PRE_PING = os.environ.get("DB_PRE_PING", "idle")
+DB_PRE_PING_IDLE_S = float(os.environ.get("DB_PRE_PING_IDLE_S", "30"))
+# PgBouncer en modo transaction: el pooling lo hace PgBouncer, la app abre y cierra por uso
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "0") == "1"
+if DB_PRE_PING not in ("always", "idle", "never"):
+    raise RuntimeError("DB_PRE_PING debe ser always, idle o never")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout (incluye abrir una conexión nueva)."""
+
+    db_label = "primary"
+
+    def _do_get(self):
+        t0 = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            METRICS.observe("app_db_pool_wait_seconds", {"db": self.db_label}, perf_counter() - t0)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.db_label = self.db_label
+        return pool
+
+
+def engine_options(url):
+    if url.startswith("sqlite"):
+        # archivo local: sin reciclado ni pre-ping; el pool solo evita reabrir el archivo
+        return {"poolclass": TimedQueuePool, "pool_size": DB_POOL_SIZE,
+                "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_PRE_PING == "always",
+    }
 
-ENGINE = create_engine(normalize_db_url(DATABASE_URL), pool_pre_ping=True)
+
+# --- SQLite (sitios sin buena conectividad): WAL + pragmas en cada conexión nueva ---
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",       # lectores y escritor no se bloquean entre sí (varios workers)
+    "PRAGMA synchronous=NORMAL",     # con WAL no se corrompe; solo fsync en checkpoints
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",  # esperar al escritor en vez de fallar con 'locked'
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA cache_size=-32000",      # ~32 MB de caché de páginas por conexión
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",    # lecturas vía mmap (256 MB)
+)
+
+
+def sqlite_pragmas(dbapi_conn, record):
+    cur = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cur.execute(pragma)
+    cur.close()
+
+
+def sqlite_clear_deadline(dbapi_conn, record):
+    """Quita el corte por tiempo de la ruta anterior al devolver la conexión al pool."""
+    if dbapi_conn is not None:
+        dbapi_conn.set_progress_handler(None, 0)
+
+
+def make_engine(url):
+    url = normalize_db_url(url)
+    engine = create_engine(url, **engine_options(url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", sqlite_pragmas)
+        event.listen(engine, "checkin", sqlite_clear_deadline)
+    return engine
+
+
+ENGINE = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=ENGINE, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 
+# -----------------------------------------------------------------------------
+# Observabilidad: métricas por request y por sentencia SQL (expuestas en /metrics)
+# -----------------------------------------------------------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WORKER_PID = str(os.getpid())
+
+
+class Metrics:
+    """Contadores e histogramas en memoria con formato de exposición Prometheus.
+       Un lock protege las escrituras: los hilos gthread de un worker comparten la
+       instancia. Cada serie lleva la etiqueta worker (pid), así los scrapes que caen
+       en distintos workers no se mezclan; se agregan con sum by (...)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (nombre, labels) -> valor
+        self.histograms = {}  # (nombre, labels) -> [conteos por bucket..., suma, total]
+        self.meta = {}        # nombre -> (tipo, ayuda, buckets)
+
+    def describe(self, name, kind, help_text, buckets=LATENCY_BUCKETS):
+        self.meta[name] = (kind, help_text, buckets)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(labels.items()) + (("worker", WORKER_PID),))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        key = (name, tuple(labels.items()) + (("worker", WORKER_PID),))
+        with self.lock:
+            self.counters[key] = value
+
+    def observe(self, name, labels, value):
+        buckets = self.meta[name][2]
+        key = (name, tuple(labels.items()) + (("worker", WORKER_PID),))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, le in enumerate(buckets):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self):
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+        out = []
+        for name, (kind, help_text, buckets) in self.meta.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for (n, labels), h in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    for le, c in zip(buckets, h):
+                        out.append(f"{name}_bucket{fmt(labels, [('le', le)])} {c}")
+                    out.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {h[-1]}")
+                    out.append(f"{name}_sum{fmt(labels)} {h[-2]:.6f}")
+                    out.append(f"{name}_count{fmt(labels)} {h[-1]}")
+            else:
+                for (n, labels), v in sorted(counters.items()):
+                    if n == name:
+                        out.append(f"{name}{fmt(labels)} {v:.6f}" if isinstance(v, float) else f"{name}{fmt(labels)} {v}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+METRICS.describe("app_http_requests_total", "counter", "Requests atendidos por endpoint, método y status.")
+METRICS.describe("app_http_request_duration_seconds", "histogram", "Tiempo de pared por request (hasta armar la respuesta).")
+METRICS.describe("app_http_response_bytes_total", "counter", "Bytes de cuerpo enviados (0 si el largo no se conoce, p.ej. NDJSON).")
+METRICS.describe("app_http_compression_saved_bytes_total", "counter", "Bytes ahorrados por la compresión de respuestas, por encoding.")
+METRICS.describe("app_db_statements_total", "counter", "Sentencias SQL ejecutadas, por endpoint.")
+METRICS.describe("app_db_time_seconds_total", "counter", "Tiempo total en la BD (cursor.execute), por endpoint.")
+METRICS.describe("app_db_pool_wait_seconds", "histogram", "Espera por una conexión del pool en cada checkout.",
+                 buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0))
+METRICS.describe("app_db_pool_checked_out", "gauge", "Conexiones prestadas en este momento.")
+METRICS.describe("app_db_pool_size", "gauge", "Tamaño configurado del pool (pool_size y max_overflow).")
+METRICS.describe("app_db_connection_age_seconds", "histogram", "Antigüedad de la conexión entregada en cada checkout.",
+                 buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200))
+METRICS.describe("app_db_connections_opened_total", "counter", "Conexiones físicas abiertas contra la BD.")
+METRICS.describe("app_db_connection_hold_seconds", "histogram", "Tiempo que un request retiene la conexión (checkout → checkin), por endpoint.")
+METRICS.describe("app_fragment_cache_requests_total", "counter", "Búsquedas en el cache de fragmentos por resultado (hit / miss).")
+METRICS.describe("app_sse_clients", "gauge", "Clientes conectados a /events en este worker.")
+METRICS.describe("app_fragment_cache_entries", "gauge", "Fragmentos guardados en el cache de este worker.")
+METRICS.describe("app_db_pre_pings_total", "counter", "Pings de pre-checkout por resultado (ok / caida).")
+
+# Acumuladores del request en curso; las sentencias corren en el mismo hilo que el request
+_req_stats = threading.local()
+
+
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_t0", []).append(perf_counter())
+
+
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["sql_t0"].pop()
+    st = getattr(_req_stats, "current", None)
+    if st is not None:
+        st["statements"] += 1
+        st["db_time"] += elapsed
+    if (SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS
+            and not context.execution_options.get("skip_slow_log")):
+        record_slow_query(conn.engine, statement, parameters, elapsed, executemany)
+
+
+def instrument_engine(engine, db):
+    """Métricas de SQL y de pool para un engine; db (primary | replica) va como etiqueta del pool."""
+    labels = {"db": db}
+    ping_idle = DB_PRE_PING == "idle" and not DB_PGBOUNCER and engine.dialect.name != "sqlite"
+    event.listen(engine, "before_cursor_execute", _sql_start)
+    event.listen(engine, "after_cursor_execute", _sql_end)
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.db_label = db
+        METRICS.set("app_db_pool_size", {**labels, "kind": "pool_size"}, DB_POOL_SIZE)
+        METRICS.set("app_db_pool_size", {**labels, "kind": "max_overflow"}, DB_MAX_OVERFLOW)
+    METRICS.set("app_db_pool_checked_out", labels, 0)
+
+    # conexiones abiertas, prestadas, antigüedad y pre-ping por ociosidad
+    @event.listens_for(engine, "connect")
+    def _pool_connect(dbapi_conn, record):
+        record.info["connected_at"] = perf_counter()
+        METRICS.inc("app_db_connections_opened_total", labels)
+
+    @event.listens_for(engine, "checkout")
+    def _pool_checkout(dbapi_conn, record, proxy):
+        now = perf_counter()
+        idle = now - record.info.get("checkin_at", now)
+        if ping_idle and idle > DB_PRE_PING_IDLE_S:
+            try:
+                engine.dialect.do_ping(dbapi_conn)
+            except Exception:
+                METRICS.inc("app_db_pre_pings_total", {**labels, "result": "caida"})
+                raise DisconnectionError()  # el pool descarta la conexión y reintenta con otra
+            METRICS.inc("app_db_pre_pings_total", {**labels, "result": "ok"})
+        METRICS.observe("app_db_connection_age_seconds", labels, now - record.info.get("connected_at", now))
+        METRICS.inc("app_db_pool_checked_out", labels)
+        record.info["checkout_at"] = now
+        record.info["checkout_endpoint"] = (request.endpoint if has_request_context() else None) or "sin_ruta"
+
+    @event.listens_for(engine, "checkin")
+    def _pool_checkin(dbapi_conn, record):
+        now = record.info["checkin_at"] = perf_counter()
+        METRICS.inc("app_db_pool_checked_out", labels, -1)
+        if "checkout_at" in record.info:
+            METRICS.observe("app_db_connection_hold_seconds",
+                            {**labels, "endpoint": record.info.pop("checkout_endpoint", "sin_ruta")},
+                            now - record.info.pop("checkout_at"))
+
+
+instrument_engine(ENGINE, "primary")
+
+
+# --- Log de sentencias lentas (+ EXPLAIN opcional fuera del request) ---
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "500"))         # <= 0 desactiva
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "0") == "1"  # EXPLAIN (ANALYZE, BUFFERS)
+SLOW_QUERY_KEEP = 200
+SLOW_QUERIES = deque(maxlen=SLOW_QUERY_KEEP)
+_slow_lock = threading.Lock()
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+_explain_pending = threading.BoundedSemaphore(4)  # si hay más en cola, se omite el plan
+
+
+def record_slow_query(engine, statement, parameters, elapsed, executemany):
+    entry = {
+        "at": datetime.utcnow().isoformat(timespec="seconds"),
+        "ms": round(elapsed * 1000, 1),
+        "route": request.endpoint if has_request_context() else None,
+        "statement": statement,
+        "params": repr(parameters)[:2000],
+        "plan": None,
+    }
+    app.logger.warning("SQL lenta (%.0f ms) en %s: %s | params=%s",
+                       entry["ms"], entry["route"], " ".join(statement.split()), entry["params"])
+    with _slow_lock:
+        SLOW_QUERIES.append(entry)
+    if (SLOW_QUERY_EXPLAIN and not executemany and engine.dialect.name == "postgresql"
+            and statement.lstrip().upper().startswith("SELECT")
+            and _explain_pending.acquire(blocking=False)):
+        _explain_pool.submit(_explain_slow_query, engine, entry, statement, parameters)
+
+
+def _explain_slow_query(engine, entry, statement, parameters):
+    """Corre en el hilo 'explain' con su propia conexión (del mismo engine que ejecutó la
+       sentencia); ANALYZE re-ejecuta el SELECT."""
+    try:
+        with engine.connect() as conn:
+            conn = conn.execution_options(skip_slow_log=True)
+            conn.exec_driver_sql("SET LOCAL statement_timeout = 30000")
+            rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).all()
+            conn.rollback()
+        plan = "\n".join(r[0] for r in rows)
+    except Exception as e:
+        plan = f"(EXPLAIN falló: {e})"
+    finally:
+        _explain_pending.release()
+    with _slow_lock:
+        entry["plan"] = plan
+
+
+@app.before_request
+def _metrics_start():
+    g.t0 = perf_counter()
+    _req_stats.current = {"statements": 0, "db_time": 0.0}
+
+
+@app.after_request
+def _metrics_record(response):
+    st = getattr(_req_stats, "current", None)
+    if st is None or "t0" not in g:
+        return response
+    endpoint = request.endpoint or "sin_ruta"
+    labels = {"endpoint": endpoint}
+    METRICS.inc("app_http_requests_total",
+                {"endpoint": endpoint, "method": request.method, "status": str(response.status_code)})
+    METRICS.observe("app_http_request_duration_seconds", labels, perf_counter() - g.t0)
+    size = response.content_length
+    if size is None and not response.is_streamed:
+        size = response.calculate_content_length()
+    METRICS.inc("app_http_response_bytes_total", labels, size or 0)
+    METRICS.inc("app_db_statements_total", labels, st["statements"])
+    METRICS.inc("app_db_time_seconds_total", labels, st["db_time"])
+    return response
+
+
+@app.teardown_request
+def _metrics_clear(exc):
+    _req_stats.current = None
+
+
+# -----------------------------------------------------------------------------
+# Réplica de lectura (opcional): las rutas que solo leen piden get_read_db()
+# -----------------------------------------------------------------------------
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_S = float(os.environ.get("REPLICA_MAX_LAG_S", "5"))   # más atraso → se lee del primario
+REPLICA_CHECK_S = float(os.environ.get("REPLICA_CHECK_S", "5"))       # cada cuánto se vuelve a medir
+REPLICA_STICKY_S = float(os.environ.get("REPLICA_STICKY_S", "10"))    # tras un POST, el cliente lee del primario
+
+# 0 si la réplica ya aplicó todo lo recibido (un primario sin escrituras no cuenta como atraso)
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+METRICS.describe("app_db_replica_lag_seconds", "gauge", "Último atraso medido de la réplica de lectura.")
+METRICS.describe("app_db_read_routing_total", "counter", "Sesiones de lectura por destino y motivo.")
+
+REPLICA_ENGINE = None
+ReadSessionLocal = SessionLocal
+if DATABASE_REPLICA_URL:
+    REPLICA_ENGINE = make_engine(DATABASE_REPLICA_URL)
+    instrument_engine(REPLICA_ENGINE, "replica")
+    ReadSessionLocal = sessionmaker(bind=REPLICA_ENGINE, autocommit=False, autoflush=False)
+
+_replica_state = {"checked": None, "ok": False, "lag": None}
+_replica_lock = threading.Lock()
+
+
+def replica_lag():
+    """Segundos de atraso de la réplica (0 si no es Postgres); None si no responde."""
+    try:
+        with REPLICA_ENGINE.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return 0.0
+            return float(conn.execute(REPLICA_LAG_SQL).scalar() or 0)
+    except SQLAlchemyError as e:
+        app.logger.warning("Réplica de lectura no disponible: %s", e)
+        return None
+
+
+def replica_usable():
+    """Estado cacheado por REPLICA_CHECK_S: un solo hilo vuelve a medir, el resto usa el último valor."""
+    checked = _replica_state["checked"]
+    if (checked is None or perf_counter() - checked >= REPLICA_CHECK_S) and _replica_lock.acquire(blocking=False):
+        try:
+            lag = replica_lag()
+            _replica_state.update(checked=perf_counter(), lag=lag,
+                                  ok=lag is not None and lag <= REPLICA_MAX_LAG_S)
+            if lag is not None:
+                METRICS.set("app_db_replica_lag_seconds", {}, lag)
+        finally:
+            _replica_lock.release()
+    return _replica_state["ok"]
+
+
+def read_session_factory():
+    """Sessionmaker para rutas de solo lectura: la réplica si existe, está al día y el cliente no
+       escribió hace menos de REPLICA_STICKY_S (así ve sus propios cambios); si no, el primario."""
+    if REPLICA_ENGINE is None:
+        return SessionLocal
+    if datetime.now().timestamp() - session.get("wrote_at", 0) < REPLICA_STICKY_S:
+        target, reason = SessionLocal, "escritura_reciente"
+    elif not replica_usable():
+        target, reason = SessionLocal, "replica_atrasada"
+    else:
+        target, reason = ReadSessionLocal, "ok"
+    METRICS.inc("app_db_read_routing_total",
+                {"db": "replica" if target is ReadSessionLocal else "primary", "reason": reason})
+    return target
+
+
+def _mark_write(response):
+    if request.method == "POST" and response.status_code < 400:
+        session["wrote_at"] = datetime.now().timestamp()
+    return response
+
+
+if REPLICA_ENGINE is not None:
+    app.after_request(_mark_write)
+
+
+# -----------------------------------------------------------------------------
+# Sesión por request: get_db() / get_read_db() la abren al primer uso y el teardown
+# la cierra. release_db() la cierra antes, para no retener la conexión del pool
+# mientras se arma el CSV o se renderiza el template.
+# -----------------------------------------------------------------------------
+def get_db():
+    """Sesión del primario para el request en curso (escrituras)."""
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+
+def get_read_db():
+    """Sesión de lectura del request: réplica o primario según read_session_factory()."""
+    if "read_db" not in g:
+        g.read_db = read_session_factory()()
+    return g.read_db
+
+
+def release_db():
+    """Cierra las sesiones del request y devuelve la conexión al pool. Las filas ya
+       leídas (y los objetos cargados) siguen disponibles para el template."""
+    for key in ("db", "read_db"):
+        db = g.pop(key, None)
+        if db is not None:
+            db.close()
+
+
+@app.teardown_request
+def _close_db(exc):
+    release_db()
+
+
+# -----------------------------------------------------------------------------
+# Límites de las rutas pesadas: timeout por sentencia, rango máximo, paginación
+# y cancelación de la consulta si el cliente se desconecta
+# -----------------------------------------------------------------------------
+LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", "500"))      # filas por página en /registros
+MAX_RANGE_DAYS = int(os.environ.get("MAX_RANGE_DAYS", "400"))      # rango desde/hasta máximo; 0 = sin límite
+DOWNLOAD_MAX_ROWS = int(os.environ.get("DOWNLOAD_MAX_ROWS", "100000"))  # filas por CSV de /download; 0 = sin límite
+# endpoint → ms por sentencia (Postgres) o por transacción (SQLite); override con
+# ROUTE_STATEMENT_TIMEOUTS="registros=5000,dashboard=10000"
+ROUTE_STATEMENT_TIMEOUTS = {"registros": 15000, "dashboard": 20000, "api_dashboard": 20000,
+                            "api_scorecard": 20000, "api_personas": 10000, "download_entity": 60000,
+                            "api_list": 10000}
+for _item in filter(None, os.environ.get("ROUTE_STATEMENT_TIMEOUTS", "").split(",")):
+    _endpoint, _, _ms = _item.partition("=")
+    ROUTE_STATEMENT_TIMEOUTS[_endpoint.strip()] = int(_ms)
+DISCONNECT_POLL_S = 0.5
+PG_QUERY_CANCELED = "57014"  # SQLSTATE de statement_timeout y de cancel()
+
+METRICS.describe("app_db_queries_cancelled_total", "counter",
+                 "Requests cuya consulta se cortó, por endpoint y motivo (timeout / desconexion).")
+
+
+def clamp_range(d_from, d_to, notify=True):
+    """Acota [d_from, d_to] a MAX_RANGE_DAYS (conserva d_to) y avisa con un flash
+       (notify=False en la API: el flash quedaría para la próxima página)."""
+    if MAX_RANGE_DAYS and d_from and d_to and (d_to - d_from).days >= MAX_RANGE_DAYS:
+        d_from = d_to - timedelta(days=MAX_RANGE_DAYS - 1)
+        if notify:
+            flash(f"El rango se acotó a {MAX_RANGE_DAYS} días: desde {d_from.isoformat()} hasta {d_to.isoformat()}.")
+    return d_from, d_to
+
+
+def client_gone(sock):
+    """True si el cliente cerró la conexión (EOF al espiar el socket sin consumir datos)."""
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, InterruptedError):
+        return False
+    except ValueError:   # sockets TLS no aceptan flags
+        return False
+    except OSError:
+        return True
+
+
+# conexión DBAPI → (socket del cliente, estado del request); la entrada se quita cuando la
+# conexión vuelve al pool, así el watchdog nunca cancela una conexión que ya usa otro request
+_inflight = {}
+_inflight_lock = threading.Lock()
+_watchdog = None
+_watchdog_stop = threading.Event()  # set() termina el hilo del watchdog
+
+
+def _watch_disconnects():
+    while not _watchdog_stop.wait(DISCONNECT_POLL_S):
+        with _inflight_lock:
+            items = list(_inflight.items())
+        for dbapi_conn, (sock, state) in items:
+            if state["gone"] or client_gone(sock):
+                state["gone"] = True
+                try:  # psycopg2: cancel(); sqlite3: interrupt(); ambos se pueden llamar desde otro hilo
+                    (getattr(dbapi_conn, "cancel", None) or dbapi_conn.interrupt)()
+                except Exception:
+                    pass
+
+
+def watch_request(dbapi_conn):
+    global _watchdog
+    sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    if sock is None or not hasattr(socket, "MSG_DONTWAIT"):
+        return
+    with _inflight_lock:
+        if _watchdog is None:  # se arranca en el worker (los hilos no sobreviven al fork de gunicorn)
+            _watchdog = threading.Thread(target=_watch_disconnects, name="disconnect-watchdog", daemon=True)
+            _watchdog.start()
+        _inflight[dbapi_conn] = (sock, g.setdefault("db_guard", {"gone": False}))
+
+
+def unwatch_connection(dbapi_conn, record):
+    """Deja de vigilar la conexión al devolverla al pool (release_db() o fin del request)."""
+    with _inflight_lock:
+        _inflight.pop(dbapi_conn, None)
+
+
+for _engine in filter(None, (ENGINE, REPLICA_ENGINE)):
+    event.listen(_engine, "checkin", unwatch_connection)
+
+
+@event.listens_for(Session, "after_begin")
+def _guard_begin(session, transaction, connection):
+    if not has_request_context() or request.endpoint not in ROUTE_STATEMENT_TIMEOUTS:
+        return
+    ms = ROUTE_STATEMENT_TIMEOUTS[request.endpoint]
+    dbapi_conn = connection.connection.dbapi_connection
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(ms)}")
+    elif connection.dialect.name == "sqlite":
+        deadline = perf_counter() + ms / 1000
+        dbapi_conn.set_progress_handler(lambda: perf_counter() > deadline, 10000)
+    watch_request(dbapi_conn)
+
+
+@app.teardown_request
+def _guard_end(exc):
+    state = g.get("db_guard")
+    if state is None:
+        return
+    with _inflight_lock:
+        for dbapi_conn in [c for c, (_, st) in _inflight.items() if st is state]:
+            del _inflight[dbapi_conn]
+
+
+def query_cancelled(exc):
+    orig = getattr(exc, "orig", None)
+    return getattr(orig, "pgcode", None) == PG_QUERY_CANCELED or str(orig) == "interrupted"
+
+
+@app.errorhandler(OperationalError)
+def db_operational_error(exc):
+    if not query_cancelled(exc):
+        raise exc
+    reason = "desconexion" if g.get("db_guard", {}).get("gone") else "timeout"
+    METRICS.inc("app_db_queries_cancelled_total", {"endpoint": request.endpoint or "sin_ruta", "reason": reason})
+    msg = "La consulta tardó demasiado y se canceló. Acote el rango de fechas o elija una semana."
+    if request.path.startswith("/api/"):
+        return api_error(msg, 503)
+    flash(msg)
+    back = request.referrer
+    return redirect(back if back and back != request.url else url_for("panel", tab="censo"))
+
+
 # -----------------------------------------------------------------------------
 # Semanas / Utilidades tiempo
 # -----------------------------------------------------------------------------
-WEEK_MAP = {
-    42: ("2025-10-13", "2025-10-19"),
-    43: ("2025-10-20", "2025-10-26"),
-    44: ("2025-10-27", "2025-11-02"),
-    45: ("2025-11-03", "2025-11-09"),
-    46: ("2025-11-10", "2025-11-16"),
-    47: ("2025-11-17", "2025-11-23"),
-    48: ("2025-11-24", "2025-11-30"),
-    49: ("2025-12-01", "2025-12-07"),
-    50: ("2025-12-08", "2025-12-14"),
-    51: ("2025-12-15", "2025-12-21"),
-    52: ("2025-12-22", "2025-12-28"),
-    53: ("2025-12-29", "2026-01-04"),
-    54: ("2026-01-05", "2026-01-11"),
-    55: ("2026-01-12", "2026-01-18"),
-    56: ("2026-01-19", "2026-01-25"),
-    57: ("2026-01-26", "2026-02-01"),
-    58: ("2026-02-02", "2026-02-08"),
-    59: ("2026-02-09", "2026-02-15"),
-    60: ("2026-02-16", "2026-02-22"),
-    61: ("2026-02-23", "2026-03-01"),
-    62: ("2026-03-02", "2026-03-08"),
-    63: ("2026-03-09", "2026-03-15"),
-    64: ("2026-03-16", "2026-03-22"),
-    65: ("2026-03-23", "2026-03-29"),
-    66: ("2026-03-30", "2026-04-05"),
-    67: ("2026-04-06", "2026-04-12"),
-    68: ("2026-04-13", "2026-04-19"),
-    69: ("2026-04-20", "2026-04-26"),
-    70: ("2026-04-27", "2026-05-03"),
-    71: ("2026-05-04", "2026-05-10"),
-    72: ("2026-05-11", "2026-05-17"),
-    73: ("2026-05-18", "2026-05-24"),
-    74: ("2026-05-25", "2026-05-31"),
-    75: ("2026-06-01", "2026-06-07"),
-    76: ("2026-06-08", "2026-06-14"),
-    77: ("2026-06-15", "2026-06-21"),
-    78: ("2026-06-22", "2026-06-28"),
-    79: ("2026-06-29", "2026-07-05"),
-    80: ("2026-07-06", "2026-07-12"),
-    81: ("2026-07-13", "2026-07-19"),
-    82: ("2026-07-20", "2026-07-26"),
-    83: ("2026-07-27", "2026-08-02"),
-    84: ("2026-08-03", "2026-08-09"),
-    85: ("2026-08-10", "2026-08-16"),
-    86: ("2026-08-17", "2026-08-23"),
-    87: ("2026-08-24", "2026-08-30"),
-    88: ("2026-08-31", "2026-09-06"),
-    89: ("2026-09-07", "2026-09-13"),
-    90: ("2026-09-14", "2026-09-20"),
-    91: ("2026-09-21", "2026-09-27"),
-    92: ("2026-09-28", "2026-10-04"),
-    93: ("2026-10-05", "2026-10-11"),
-    94: ("2026-10-12", "2026-10-18"),
-    95: ("2026-10-19", "2026-10-25"),
-    96: ("2026-10-26", "2026-11-01"),
-}
+# Semanas de lunes a domingo numeradas desde la 42 (13-10-2025), sin fin fijo: el número
+# sale de la diferencia en días con el ancla, sin tabla que mantener
+WEEK_ANCHOR = date(2025, 10, 13)
+WEEK_FIRST = 42
+WEEKS_AHEAD = int(os.environ.get("WEEKS_AHEAD", "8"))  # semanas futuras que ofrecen los selectores
+
+
+def week_of(d):
+    """Número de semana de una fecha (date o datetime); None si es anterior a la primera."""
+    if isinstance(d, datetime):
+        d = d.date()
+    n = WEEK_FIRST + (d - WEEK_ANCHOR).days // 7
+    return n if n >= WEEK_FIRST else None
+
 
 def week_range(week_number: int):
-    if week_number not in WEEK_MAP:
+    if not isinstance(week_number, int) or week_number < WEEK_FIRST:
+        return (None, None)
+    try:
+        start = WEEK_ANCHOR + timedelta(weeks=week_number - WEEK_FIRST)
+        return (start, start + timedelta(days=6))
+    except OverflowError:
         return (None, None)
-    s, e = WEEK_MAP[week_number]
-    return (date.fromisoformat(s), date.fromisoformat(e))
+
+
+@lru_cache(maxsize=4)
+def _week_map(last):
+    return {n: tuple(d.isoformat() for d in week_range(n)) for n in range(WEEK_FIRST, last + 1)}
+
+
+def week_map():
+    """{semana: (inicio ISO, fin ISO)} desde la primera hasta WEEKS_AHEAD semanas después de
+       la actual, para los selectores (se regenera solo cuando cambia la semana)."""
+    return _week_map((week_of(date.today()) or WEEK_FIRST) + WEEKS_AHEAD)
 
 
 # Tiempo mm:ss
@@ -233,6 +808,51 @@ def normalize_header(header):
         header = header.replace('__', '_')
     return header
 
+# Sufijos societarios que no distinguen empresas ("SALFA MONTAJES S.A." = "Salfa Montajes")
+EMPRESA_SUFIJOS = {"sa", "spa", "ltda", "limitada", "eirl", "cia", "y"}
+
+
+def normalize_empresa(nombre):
+    """Clave de empresa para agrupar entre módulos: sin tildes, minúsculas, sin puntuación
+       ni sufijo societario. '' si no queda nada (sin empresa); None solo si viene None."""
+    if nombre is None:
+        return None
+    s = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode().lower()
+    words = re.sub(r"[^a-z0-9]+", " ", s.replace(".", "")).split()
+    while len(words) > 1 and words[-1] in EMPRESA_SUFIJOS:
+        words.pop()
+    return " ".join(words)[:200]
+
+
+def rut_dv(numero):
+    """Dígito verificador (módulo 11) del cuerpo numérico de un RUT."""
+    total, factor = 0, 2
+    for d in reversed(str(numero)):
+        total += int(d) * factor
+        factor = 2 if factor == 7 else factor + 1
+    dv = 11 - total % 11
+    return "0" if dv == 11 else "K" if dv == 10 else str(dv)
+
+
+def normalize_rut(rut):
+    """RUT canónico '12345678-5' (sin puntos ni ceros a la izquierda, K mayúscula) si el
+       dígito verificador cuadra; '' si no es un RUT válido; None solo si viene None."""
+    if rut is None:
+        return None
+    s = re.sub(r"[^0-9K]", "", str(rut).upper())
+    if len(s) < 2 or not s[:-1].isdigit() or int(s[:-1]) == 0:
+        return ""
+    numero, dv = int(s[:-1]), s[-1]
+    return f"{numero}-{dv}" if rut_dv(numero) == dv else ""
+
+
+def normalize_id_interno(valor):
+    """ID interno comparable entre módulos: mayúsculas, sin espacios, puntos ni guiones
+       ('id-00123 ' = 'ID00123'). '' si no queda nada; None solo si viene None."""
+    if valor is None:
+        return None
+    return re.sub(r"[\s.\-]+", "", str(valor)).upper()[:100]
+
 def safe_convert_date(date_str):
     """
     Convierte strings de fecha en objetos date, manejando múltiples formatos.
@@ -387,6 +1007,7 @@ class CensusEntry(Base):
     censo_noche = Column(Integer, nullable=False, default=0)
     total = Column(Integer, nullable=False, default=0)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class EventSeguridad(Base):
     __tablename__ = "eventos_seguridad"
@@ -397,6 +1018,7 @@ class EventSeguridad(Base):
     nombre_afectado = Column(String(200), nullable=True)
     accion = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class DuplicidadEntry(Base):
     __tablename__ = "duplicidades"
@@ -404,7 +1026,9 @@ class DuplicidadEntry(Base):
     semana = Column(Integer, nullable=False)
     fecha = Column(Date, nullable=False)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     empresa_contratista = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa_contratista)
     descripcion_problema = Column(Text, nullable=True)
     tipo_riesgo = Column(String(200), nullable=True)
     pabellon = Column(String(100), nullable=True)
@@ -417,6 +1041,7 @@ class DuplicidadEntry(Base):
     plan_accion = Column(Text, nullable=True)
     fecha_cierre = Column(Date, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class EncuestaEntry(Base):
     __tablename__ = "encuestas"
@@ -436,6 +1061,7 @@ class EncuestaEntry(Base):
     promedio = Column(Float, nullable=True)
     comentarios = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class AtencionEntry(Base):
     __tablename__ = "atencion_publico"
@@ -444,6 +1070,7 @@ class AtencionEntry(Base):
     tiempo_promedio_sec = Column(Integer, nullable=False, default=0)  # mm:ss -> seg
     cantidad = Column(Integer, nullable=False, default=0)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 # --- Módulos agregados previamente ---
 class RoboHurtoEntry(Base):
@@ -454,13 +1081,16 @@ class RoboHurtoEntry(Base):
     modulo = Column(String(100), nullable=True)
     habitacion = Column(String(100), nullable=True)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     nombre_cliente = Column(String(200), nullable=True)
     rut = Column(String(50), nullable=True)
+    rut_norm = Column(String(12), nullable=True)  # normalize_rut(rut)
     medio_reclamo = Column(String(200), nullable=True)
     especies = Column(Text, nullable=True)
     observaciones = Column(Text, nullable=True)
     recepciona = Column(String(200), nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class MiscelaneoEntry(Base):
     __tablename__ = "miscelaneo"
@@ -474,6 +1104,7 @@ class MiscelaneoEntry(Base):
     especialidad = Column(String(200), nullable=True)
     falla = Column(String(200), nullable=True)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     fecha_creacion = Column(Date, nullable=True)
     fecha_inicio = Column(Date, nullable=True)
     fecha_termino = Column(Date, nullable=True)
@@ -481,6 +1112,7 @@ class MiscelaneoEntry(Base):
     estado = Column(String(100), nullable=True)
     comentario = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class DesviacionEntry(Base):
     __tablename__ = "desviaciones"
@@ -488,7 +1120,9 @@ class DesviacionEntry(Base):
     n_solicitud = Column(String(100), nullable=True)
     fecha = Column(Date, nullable=False)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     empresa_contratista = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa_contratista)
     descripcion_problema = Column(Text, nullable=True)
     tipo_riesgo = Column(String(200), nullable=True)
     tipo_solicitud = Column(String(200), nullable=True)
@@ -499,6 +1133,7 @@ class DesviacionEntry(Base):
     riesgo_material = Column(String(200), nullable=True)
     correo_destino = Column(String(200), nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class SolicitudOTEntry(Base):
     __tablename__ = "solicitudes_ot"
@@ -521,6 +1156,7 @@ class SolicitudOTEntry(Base):
     motivo = Column(String(200), nullable=True)
     observacion = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class ReclamoUsuarioEntry(Base):
     __tablename__ = "reclamos_usuarios"
@@ -528,7 +1164,9 @@ class ReclamoUsuarioEntry(Base):
     n_solicitud = Column(String(100), nullable=True)
     fecha = Column(Date, nullable=False)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     empresa_contratista = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa_contratista)
     descripcion_problema = Column(Text, nullable=True)
     tipo_solicitud = Column(String(200), nullable=True)
     pabellon = Column(String(100), nullable=True)
@@ -541,6 +1179,7 @@ class ReclamoUsuarioEntry(Base):
     notificacion_usuario = Column(String(200), nullable=True)
     plan_accion = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 # ---------------- NUEVOS 5 MÓDULOS ----------------
 class ActivacionAlarmaEntry(Base):
@@ -551,7 +1190,9 @@ class ActivacionAlarmaEntry(Base):
     nombre_recepcionista = Column(String(200), nullable=True)
     fecha = Column(Date, nullable=False)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     co = Column(String(100), nullable=True)
     aviso_mantencion_h = Column(Float, nullable=True)
     llegada_mantencion_h = Column(Float, nullable=True)
@@ -564,13 +1205,16 @@ class ActivacionAlarmaEntry(Base):
     turno_recepcion_ingresos = Column(String(200), nullable=True)
     observaciones = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class ExtensionExcepcionEntry(Base):
     __tablename__ = "extension_excepcion"
     id = Column(Integer, primary_key=True)
     fecha_solicitud = Column(Date, nullable=False)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     co = Column(String(100), nullable=True)
     gerencia = Column(String(200), nullable=True)
     proyecto = Column(String(200), nullable=True)
@@ -580,6 +1224,7 @@ class ExtensionExcepcionEntry(Base):
     aprobador = Column(String(200), nullable=True)
     observacion = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class OnboardingEntry(Base):
     __tablename__ = "onboarding"
@@ -587,10 +1232,14 @@ class OnboardingEntry(Base):
     fecha_hora = Column(DateTime, nullable=False)
     nombre = Column(String(200), nullable=True)
     rut = Column(String(50), nullable=True)
+    rut_norm = Column(String(12), nullable=True)  # normalize_rut(rut)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     archivo_pdf = Column(String(300), nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class AperturaHabitacionEntry(Base):
     __tablename__ = "apertura_habitacion"
@@ -601,35 +1250,569 @@ class AperturaHabitacionEntry(Base):
     responsable = Column(String(200), nullable=True)
     estado_chapa = Column(Text, nullable=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
 
 class CumplimientoEECCEntry(Base):
     __tablename__ = "cumplimiento_eecc"
     id = Column(Integer, primary_key=True)
     empresa = Column(String(200), nullable=True)
+    empresa_norm = Column(String(200), nullable=True)  # normalize_empresa(empresa)
     n_contrato = Column(String(100), nullable=True)
     co = Column(String(100), nullable=True)
     correo_electronico = Column(String(200), nullable=True)
     id_interno = Column(String(100), nullable=True)
+    id_norm = Column(String(100), nullable=True)  # normalize_id_interno(id_interno)
     turno = Column(String(100), nullable=True)
     # fecha de negocio para filtros/dashboard
     fecha = Column(Date, nullable=False, index=True)
     creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    deleted_at = Column(DateTime, nullable=True)  # borrado lógico
+
+# ---------------- Tablas de soporte ----------------
+class ApiIdempotencia(Base):
+    """Respuesta guardada de cada POST /api/<entidad>/bulk con Idempotency-Key,
+       para que un reenvío (tablet que reintenta) no duplique registros."""
+    __tablename__ = "api_idempotencia"
+    clave = Column(String(200), primary_key=True)
+    entidad = Column(String(50), nullable=False)
+    respuesta = Column(Text, nullable=False)
+    creado = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ModuleVersion(Base):
+    """Contador de cambios por módulo: sube con cada alta, edición o borrado y
+       de él salen el ETag y el Last-Modified de las vistas de ese módulo."""
+    __tablename__ = "module_versions"
+    modulo = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    actualizado = Column(DateTime, nullable=False, default=datetime.utcnow)
+    ultimo_borrado = Column(DateTime, nullable=True)  # último DELETE físico (el refresco incremental no lo ve)
+
+
+# --- Mapa entidad → Modelo (listados, descargas, API y eliminar) ---
+ENTITY_MODEL = {
+    "censo": CensusEntry,
+    "eventos": EventSeguridad,
+    "duplicidades": DuplicidadEntry,
+    "encuestas": EncuestaEntry,
+    "atencion": AtencionEntry,
+    "robos": RoboHurtoEntry,
+    "miscelaneo": MiscelaneoEntry,
+    "desviaciones": DesviacionEntry,
+    "solicitud_ot": SolicitudOTEntry,
+    "reclamos": ReclamoUsuarioEntry,
+    # nuevos
+    "alarmas": ActivacionAlarmaEntry,
+    "extensiones": ExtensionExcepcionEntry,
+    "onboarding": OnboardingEntry,
+    "apertura": AperturaHabitacionEntry,
+    "cumplimiento": CumplimientoEECCEntry,
+}
+
+# --- Columna de fecha de negocio por entidad (la misma que usan los filtros) ---
+ENTITY_DATE_COLUMN = {
+    "censo": CensusEntry.fecha,
+    "eventos": EventSeguridad.fecha,
+    "duplicidades": DuplicidadEntry.fecha,
+    "encuestas": EncuestaEntry.fecha_hora,
+    "atencion": AtencionEntry.fecha,
+    "robos": RoboHurtoEntry.fecha,
+    "miscelaneo": MiscelaneoEntry.fecha_creacion,
+    "desviaciones": DesviacionEntry.fecha,
+    "solicitud_ot": SolicitudOTEntry.fecha_inicio,
+    "reclamos": ReclamoUsuarioEntry.fecha,
+    "alarmas": ActivacionAlarmaEntry.fecha,
+    "extensiones": ExtensionExcepcionEntry.fecha_solicitud,
+    "onboarding": OnboardingEntry.fecha_hora,
+    "apertura": AperturaHabitacionEntry.fecha,
+    "cumplimiento": CumplimientoEECCEntry.fecha,
+}
+
+# --- Columna de empresa por entidad (scorecard) ---
+EMPRESA_COLUMN = {
+    "duplicidades": DuplicidadEntry.empresa_contratista,
+    "robos": RoboHurtoEntry.empresa,
+    "miscelaneo": MiscelaneoEntry.empresa,
+    "desviaciones": DesviacionEntry.empresa_contratista,
+    "reclamos": ReclamoUsuarioEntry.empresa_contratista,
+    "alarmas": ActivacionAlarmaEntry.empresa,
+    "extensiones": ExtensionExcepcionEntry.empresa,
+    "onboarding": OnboardingEntry.empresa,
+    "cumplimiento": CumplimientoEECCEntry.empresa,
+}
+
+# --- Columnas que identifican a una persona (búsqueda por RUT / ID interno) ---
+RUT_COLUMN = {
+    "robos": RoboHurtoEntry.rut,
+    "onboarding": OnboardingEntry.rut,
+}
+ID_COLUMN = {
+    "duplicidades": DuplicidadEntry.id_interno,
+    "desviaciones": DesviacionEntry.id_interno,
+    "reclamos": ReclamoUsuarioEntry.id_interno,
+    "alarmas": ActivacionAlarmaEntry.id_interno,
+    "extensiones": ExtensionExcepcionEntry.id_interno,
+    "onboarding": OnboardingEntry.id_interno,
+    "cumplimiento": CumplimientoEECCEntry.id_interno,
+}
+
+# --- Claves normalizadas: Modelo → [(columna origen, columna *_norm, normalizador, tipo DDL)];
+#     se completan al guardar (y al arrancar, para las filas que ya existían) ---
+NORM_COLUMNS = {}
+for _columns, _norm, _fn, _ddl in ((EMPRESA_COLUMN, "empresa_norm", normalize_empresa, "varchar(200)"),
+                                   (RUT_COLUMN, "rut_norm", normalize_rut, "varchar(12)"),
+                                   (ID_COLUMN, "id_norm", normalize_id_interno, "varchar(100)")):
+    for _col in _columns.values():
+        NORM_COLUMNS.setdefault(_col.class_, []).append((_col.key, _norm, _fn, _ddl))
+NORM_COLUMN_NAMES = {"empresa_norm", "rut_norm", "id_norm"}
+
+
+def _fill_norm_columns(mapper, connection, target):
+    for source, norm, fn, _ in NORM_COLUMNS[type(target)]:
+        setattr(target, norm, fn(getattr(target, source)))
+
+
+for _Model in NORM_COLUMNS:
+    event.listen(_Model, "before_insert", _fill_norm_columns)
+    event.listen(_Model, "before_update", _fill_norm_columns)
 
 
 # Crear tablas si no existen
 Base.metadata.create_all(ENGINE)
 
+def ensure_column(conn, table, column, ddl_type):
+    """ADD COLUMN si falta (SQLite no admite ADD COLUMN IF NOT EXISTS)."""
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
 # Asegura columna 'fecha' en cumplimiento_eecc si la tabla ya existía sin ella
 with ENGINE.begin() as conn:
-    conn.execute(text("ALTER TABLE cumplimiento_eecc ADD COLUMN IF NOT EXISTS fecha date"))
+    ensure_column(conn, "cumplimiento_eecc", "fecha", "date")
     conn.execute(text("""
         UPDATE cumplimiento_eecc
         SET fecha = COALESCE(date(creado), CURRENT_DATE)
         WHERE fecha IS NULL
     """))
     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_cumplimiento_eecc_fecha ON cumplimiento_eecc (fecha)"))
-    # Si ya hay datos, ahora sí podemos exigir NOT NULL
-    conn.execute(text("ALTER TABLE cumplimiento_eecc ALTER COLUMN fecha SET NOT NULL"))
+    # Si ya hay datos, ahora sí podemos exigir NOT NULL (SQLite no altera columnas;
+    # ahí la tabla nueva ya nace NOT NULL desde el modelo)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE cumplimiento_eecc ALTER COLUMN fecha SET NOT NULL"))
+
+    # Borrado lógico: columna deleted_at + índice parcial por fecha de negocio sobre las filas
+    # vigentes (es el predicado que usan listados, descargas, API y dashboard)
+    for entity, Model in ENTITY_MODEL.items():
+        t = Model.__tablename__
+        ensure_column(conn, t, "deleted_at", "timestamp")
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{t}_vigentes "
+                          f"ON {t} ({ENTITY_DATE_COLUMN[entity].key}) WHERE deleted_at IS NULL"))
+
+    # Claves normalizadas (scorecard por empresa, búsqueda por RUT / ID) con índice (clave, fecha)
+    # sobre las vigentes. Las filas anteriores a la columna se completan una vez, con un UPDATE
+    # por valor distinto; lo que no normaliza queda en '' para no volver a revisarlo
+    for entity, Model in ENTITY_MODEL.items():
+        t = Model.__tablename__
+        for source, norm, fn, ddl in NORM_COLUMNS.get(Model, []):
+            ensure_column(conn, t, norm, ddl)
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{t}_{norm.removesuffix('_norm')} ON {t} "
+                              f"({norm}, {ENTITY_DATE_COLUMN[entity].key}) WHERE deleted_at IS NULL"))
+            values = conn.execute(text(f"SELECT DISTINCT {source} FROM {t} "
+                                       f"WHERE {norm} IS NULL AND {source} IS NOT NULL")).scalars().all()
+            if values:
+                conn.execute(text(f"UPDATE {t} SET {norm} = :norm WHERE {source} = :value AND {norm} IS NULL"),
+                             [{"norm": fn(v), "value": v} for v in values])
+
+# Una fila por módulo en module_versions (otro worker puede haberlas creado al mismo tiempo)
+try:
+    with ENGINE.begin() as conn:
+        ensure_column(conn, "module_versions", "ultimo_borrado", "timestamp")
+        existing = set(conn.execute(select(ModuleVersion.modulo)).scalars())
+        missing = [{"modulo": e, "version": 0, "actualizado": datetime.utcnow()}
+                   for e in ENTITY_MODEL if e not in existing]
+        if missing:
+            conn.execute(ModuleVersion.__table__.insert(), missing)
+except IntegrityError:
+    pass
+
+
+# -----------------------------------------------------------------------------
+# Versiones por módulo y GET condicional (ETag / Last-Modified → 304)
+# -----------------------------------------------------------------------------
+TABLE_ENTITY = {Model.__tablename__: entity for entity, Model in ENTITY_MODEL.items()}
+# Cambia con cada deploy: un template nuevo no debe responderse con 304
+APP_VERSION = os.environ.get("RENDER_GIT_COMMIT") or str(int(os.path.getmtime(__file__)))
+
+
+def touch_modules(conn, modules, deleted=False):
+    """Sube la versión de los módulos indicados, en la misma transacción que el cambio.
+       deleted=True marca además un DELETE físico (filas que ya no se pueden consultar)."""
+    if modules:
+        now = datetime.utcnow()
+        values = {"version": ModuleVersion.version + 1, "actualizado": now}
+        if deleted:
+            values["ultimo_borrado"] = now
+        conn.execute(update(ModuleVersion)
+                     .where(ModuleVersion.modulo.in_(sorted(modules)))
+                     .values(**values))
+
+
+@event.listens_for(Session, "after_flush")
+def _touch_flushed(session, flush_context):
+    def entities(objs):
+        return {TABLE_ENTITY[o.__table__.name] for o in objs
+                if hasattr(o, "__table__") and o.__table__.name in TABLE_ENTITY}
+    deleted = entities(session.deleted)
+    touch_modules(session.connection(), entities((*session.new, *session.dirty)) - deleted)
+    touch_modules(session.connection(), deleted, deleted=True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _touch_bulk(state):
+    # UPDATE/DELETE masivos (delete_rows) no pasan por el flush
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+        entity = TABLE_ENTITY.get(state.bind_mapper.local_table.name)
+        if entity:
+            touch_modules(state.session.connection(), {entity}, deleted=state.is_delete)
+
+
+def module_versions(modules):
+    """{módulo: fila (version, actualizado, ultimo_borrado)} leída de module_versions una
+       sola vez por request."""
+    known = g.setdefault("module_versions", {})
+    missing = sorted(set(modules) - set(known))
+    if missing:
+        for r in get_read_db().execute(
+                select(ModuleVersion.modulo, ModuleVersion.version, ModuleVersion.actualizado,
+                       ModuleVersion.ultimo_borrado)
+                .where(ModuleVersion.modulo.in_(missing))):
+            known[r.modulo] = r
+    return {m: known[m] for m in sorted(modules) if m in known}
+
+
+def not_modified(modules):
+    """Calcula ETag / Last-Modified de la vista a partir de las versiones de sus módulos
+       (una lectura de module_versions, sin tocar las tablas). Si el navegador ya tiene
+       esa versión devuelve la respuesta 304; si no, deja los validadores en g para
+       _set_validators y devuelve None."""
+    if session.get("_flashes"):
+        return None  # hay un aviso pendiente que la copia del navegador no muestra
+    versions = module_versions(modules)
+    # la semana en curso también: el selector de semanas (week_map) crece al empezar una nueva
+    week = week_of(date.today())
+    key = "|".join([APP_VERSION, request.full_path, f"semana:{week}"]
+                   + [f"{m}:{r.version}" for m, r in versions.items()])
+    g.etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+    g.last_modified = max((r.actualizado for r in versions.values()), default=None)
+    if g.last_modified is not None:
+        g.last_modified = g.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+        if week is not None:  # inicio de la semana (hora local) en UTC
+            g.last_modified = max(g.last_modified,
+                                  datetime.combine(week_range(week)[0], time.min).astimezone(timezone.utc))
+
+    if request.if_none_match:
+        hit = request.if_none_match.contains_weak(g.etag)
+    else:
+        hit = (g.last_modified is not None and request.if_modified_since is not None
+               and g.last_modified <= request.if_modified_since)
+    return Response(status=304) if hit else None
+
+
+@app.after_request
+def _set_validators(response):
+    if "etag" in g and response.status_code in (200, 304):
+        response.set_etag(g.etag, weak=True)
+        if g.last_modified is not None:
+            response.last_modified = g.last_modified
+        response.headers["Cache-Control"] = "private, no-cache"  # siempre revalidar
+    return response
+
+
+# -----------------------------------------------------------------------------
+# Compresión de respuestas y assets estáticos con hash (tools/build_static.py)
+# -----------------------------------------------------------------------------
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))  # debajo de esto no conviene
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))  # 11 es demasiado lento en línea
+COMPRESSIBLE_TYPES = {"text/html", "application/json", "text/csv"}
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+STATIC_DIST = os.path.join(app.static_folder, "dist")
+try:
+    with open(os.path.join(STATIC_DIST, "manifest.json"), encoding="utf-8") as f:
+        STATIC_MANIFEST = json.load(f)
+except FileNotFoundError:
+    STATIC_MANIFEST = {}  # sin build: se sirven los originales, con el cache por defecto
+# asset con hash -> encodings precomprimidos disponibles junto a él
+STATIC_VARIANTS = {
+    hashed: [enc for enc, ext in (("br", ".br"), ("gzip", ".gz"))
+             if os.path.exists(os.path.join(app.static_folder, hashed + ext))]
+    for hashed in STATIC_MANIFEST.values()
+}
+
+
+def accepted_encoding(available):
+    """El encoding de available que el cliente acepta con mayor q (a igualdad, el primero)."""
+    best, best_q = None, 0
+    for enc in available:
+        q = request.accept_encodings[enc]
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+@app.template_global()
+def static_url(filename):
+    """URL del asset: la versión con hash del manifest si existe, si no el original."""
+    return url_for("static", filename=STATIC_MANIFEST.get(filename, filename))
+
+
+@app.before_request
+def _static_precompressed():
+    if request.endpoint != "static":
+        return None
+    filename = request.view_args.get("filename", "")
+    enc = accepted_encoding(STATIC_VARIANTS.get(filename, ()))
+    if enc is None:
+        return None
+    response = send_from_directory(app.static_folder, filename + (".br" if enc == "br" else ".gz"),
+                                   mimetype=mimetypes.guess_type(filename)[0])
+    response.headers["Content-Encoding"] = enc
+    return response
+
+
+@app.after_request
+def _static_cache(response):
+    if request.endpoint == "static":
+        filename = request.view_args.get("filename", "")
+        if filename in STATIC_VARIANTS:
+            # el nombre cambia con el contenido: el navegador no necesita revalidar nunca
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+            if STATIC_VARIANTS[filename]:
+                response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.after_request
+def _compress(response):
+    """gzip/brotli de HTML, JSON y CSV por encima de COMPRESS_MIN_BYTES. Las respuestas en
+       streaming (NDJSON) y los estáticos (precomprimidos en el build) se dejan como están."""
+    streamed = response.is_streamed and not response.direct_passthrough
+    if (response.status_code != 200 or streamed or request.endpoint == "static"
+            or response.mimetype not in COMPRESSIBLE_TYPES or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    enc = accepted_encoding(("br", "gzip") if brotli is not None else ("gzip",))
+    if enc is None:
+        return response
+    response.direct_passthrough = False  # send_file de un BytesIO (CSV): se lee a memoria
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    if enc == "br":
+        body = brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    else:
+        body = gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = enc
+    METRICS.inc("app_http_compression_saved_bytes_total", {"encoding": enc}, len(data) - len(body))
+    return response
+
+# -----------------------------------------------------------------------------
+# Avisos en vivo (SSE): cada commit que toca un módulo publica {module, fecha, delta}
+# -----------------------------------------------------------------------------
+# Bus entre workers: NOTIFY/LISTEN en Postgres; en SQLite, un archivo de eventos compartido
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "3"))  # por worker; cada cliente ocupa un hilo. 0 = apagado
+SSE_MAX_AGE_S = int(os.environ.get("SSE_MAX_AGE_S", "300"))    # luego se corta y EventSource reconecta (libera el hilo)
+SSE_HEARTBEAT_S = int(os.environ.get("SSE_HEARTBEAT_S", "15"))
+SSE_CHANNEL = "cambios_5s"
+# LISTEN necesita una sesión propia: con PgBouncer en modo transaction, la URL directa a Postgres
+SSE_LISTEN_URL = os.environ.get("SSE_LISTEN_URL") or DATABASE_URL
+SSE_FILE = os.environ.get("SSE_FILE") or (
+    (ENGINE.url.database or "5s.db") + ".events" if ENGINE.dialect.name == "sqlite" else None)
+SSE_FILE_MAX_BYTES = 1024 * 1024   # se trunca al pasar este tamaño; los lectores vuelven al inicio
+SSE_PAYLOAD_MAX = 7000             # NOTIFY admite hasta 8000 bytes por mensaje
+
+
+def record_changes(session, entity, days, delta):
+    """Acumula en la sesión el cambio neto por (módulo, día) hasta el commit; days trae
+       un día ISO por fila."""
+    pending = session.info.setdefault("sse_changes", {})
+    for day in days:
+        pending[(entity, day)] = pending.get((entity, day), 0) + delta
+
+
+def _row_day(obj, entity):
+    try:
+        return dashboard_day(getattr(obj, ENTITY_DATE_COLUMN[entity].key), obj.creado)
+    except (AttributeError, TypeError):
+        return None
+
+
+@event.listens_for(Session, "after_flush")
+def _changes_flushed(session, flush_context):
+    for objs, delta in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            entity = TABLE_ENTITY.get(getattr(obj, "__tablename__", None))
+            if entity:
+                record_changes(session, entity, [_row_day(obj, entity)], delta)
+
+
+@event.listens_for(Session, "after_commit")
+def _changes_commit(session):
+    pending = session.info.pop("sse_changes", None)
+    if pending:
+        changes = [{"module": e, "fecha": d, "delta": n} for (e, d), n in pending.items() if n]
+        if changes:
+            try:
+                publish_changes(changes)
+            except Exception as e:  # el aviso es best-effort: el cambio ya quedó confirmado
+                app.logger.warning("No se pudo publicar el aviso de cambios: %s", e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _changes_rollback(session):
+    session.info.pop("sse_changes", None)
+
+
+def publish_changes(changes):
+    """Manda la lista de cambios de un commit a todos los workers (también a este)."""
+    payload = json.dumps(changes, separators=(",", ":"))
+    if SSE_FILE:
+        with open(SSE_FILE, "a+", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            if f.tell() > SSE_FILE_MAX_BYTES:
+                f.truncate(0)
+            f.write(payload + "\n")
+        return
+    if len(payload) > SSE_PAYLOAD_MAX:
+        # una importación grande toca muchos días: se avisa por módulo, sin el detalle
+        modules = sorted({c["module"] for c in changes})
+        payload = json.dumps([{"module": e, "fecha": None, "delta": None} for e in modules],
+                             separators=(",", ":"))
+    with ENGINE.connect() as conn:
+        conn.execute(select(func.pg_notify(SSE_CHANNEL, payload)))
+        conn.commit()
+
+
+class ChangeFeed:
+    """Reparte los avisos del bus a los clientes SSE conectados a este worker. El hilo
+       que escucha el bus se arranca con el primer cliente (después del fork de gunicorn)."""
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self):
+        with self.lock:
+            if len(self.clients) >= self.max_clients:
+                return None
+            q = queue.Queue(maxsize=100)
+            self.clients.add(q)
+            if self.thread is None or not self.thread.is_alive():
+                target = self._tail_file if SSE_FILE else self._listen_pg
+                self.thread = threading.Thread(target=target, name="sse-feed", daemon=True)
+                self.thread.start()
+            METRICS.set("app_sse_clients", {}, len(self.clients))
+            return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.clients.discard(q)
+            METRICS.set("app_sse_clients", {}, len(self.clients))
+
+    def dispatch(self, payload):
+        try:
+            changes = json.loads(payload)
+        except ValueError:
+            return
+        with self.lock:
+            clients = list(self.clients)
+        for q in clients:
+            try:
+                q.put_nowait(changes)
+            except queue.Full:  # cliente lento: pierde avisos, la página igual hace polling
+                pass
+
+    def _listen_pg(self):
+        listen_engine = create_engine(normalize_db_url(SSE_LISTEN_URL), poolclass=NullPool)
+        while True:
+            try:
+                raw = listen_engine.raw_connection()
+                try:
+                    conn = raw.driver_connection
+                    conn.autocommit = True
+                    conn.cursor().execute(f"LISTEN {SSE_CHANNEL}")
+                    sel = selectors.DefaultSelector()
+                    sel.register(conn, selectors.EVENT_READ)
+                    while True:
+                        if sel.select(timeout=SSE_HEARTBEAT_S):
+                            conn.poll()
+                            while conn.notifies:
+                                self.dispatch(conn.notifies.pop(0).payload)
+                        else:
+                            conn.cursor().execute("SELECT 1")  # detecta una conexión caída
+                finally:
+                    raw.close()
+            except Exception as e:
+                app.logger.warning("SSE: se perdió el LISTEN (%s); reintento en 5 s", e)
+                sleep(5)
+
+    def _tail_file(self):
+        offset = os.path.getsize(SSE_FILE) if os.path.exists(SSE_FILE) else 0
+        buf = ""
+        while True:
+            sleep(0.5)
+            try:
+                size = os.path.getsize(SSE_FILE)
+                if size < offset:  # truncado por publish_changes
+                    offset, buf = 0, ""
+                if size == offset:
+                    continue
+                with open(SSE_FILE, encoding="utf-8") as f:
+                    f.seek(offset)
+                    buf += f.read()
+                    offset = f.tell()
+            except OSError:
+                continue
+            *lines, buf = buf.split("\n")
+            for line in lines:
+                self.dispatch(line)
+
+
+CHANGE_FEED = ChangeFeed(SSE_MAX_CLIENTS)
+
+
+@app.get("/events")
+def events():
+    """text/event-stream con un evento 'cambio' por commit: data = [{module, fecha, delta}].
+       fecha / delta nulos: el módulo cambió pero no se sabe en qué días (borrado físico
+       masivo o importación muy grande)."""
+    q = CHANGE_FEED.subscribe() if SSE_MAX_CLIENTS > 0 else None
+    if q is None:
+        # EventSource no reintenta ante un error HTTP: la página sigue con su polling
+        return Response("Sin cupo para avisos en vivo.", status=503, mimetype="text/plain")
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            deadline = perf_counter() + SSE_MAX_AGE_S
+            while perf_counter() < deadline:
+                try:
+                    changes = q.get(timeout=SSE_HEARTBEAT_S)
+                except queue.Empty:
+                    yield ": ping\n\n"  # si el cliente se fue, la escritura falla y se libera el hilo
+                    continue
+                yield f"event: cambio\ndata: {json.dumps(changes, separators=(',', ':'))}\n\n"
+        finally:
+            CHANGE_FEED.unsubscribe(q)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 # -----------------------------------------------------------------------------
 # Helpers filtros
@@ -638,13 +1821,60 @@ def resolve_filters(args):
     semana = args.get("semana", type=int)
     d_from = args.get("from")
     d_to = args.get("to")
-    if semana and semana in WEEK_MAP:
+    if semana and week_range(semana)[0] is not None:
         return *week_range(semana), semana
     df = date.fromisoformat(d_from) if d_from else None
     dt = date.fromisoformat(d_to) if d_to else None
     return df, dt, None
 
 
+def date_criteria(col, d_from, d_to):
+    """Condiciones del rango [d_from, d_to]; si la columna es DateTime se extiende al
+       día completo, igual que en registros() y dashboard()."""
+    if isinstance(col.type, DateTime):
+        d_from = d_from and datetime.combine(d_from, time.min)
+        d_to = d_to and datetime.combine(d_to, time.max)
+    crit = []
+    if d_from: crit.append(col >= d_from)
+    if d_to:   crit.append(col <= d_to)
+    return crit
+
+def filter_dates(q, col, d_from, d_to):
+    """Aplica el rango [d_from, d_to] a una query/select."""
+    return q.filter(*date_criteria(col, d_from, d_to))
+
+def vigentes(db, Model):
+    """db.query(Model) sin las filas con borrado lógico (usa el índice parcial *_vigentes)."""
+    return db.query(Model).filter(Model.deleted_at.is_(None))
+
+# Columnas exportadas a CSV/NDJSON: todas menos las internas
+EXPORT_COLUMNS = {
+    entity: [c.name for c in Model.__table__.columns if c.name not in ("id", "creado", "deleted_at", *NORM_COLUMN_NAMES)]
+    for entity, Model in ENTITY_MODEL.items()
+}
+
+def read_rows(db, entity, names, d_from=None, d_to=None, order_by=(), limit=None, offset=0):
+    """Lectura por tuplas: SELECT solo de las columnas indicadas, sin entidades ORM
+       (sin identity map ni instrumentación por fila). Las filas se leen como r.columna.
+       Con limit se pagina; el id desempata el orden para que las páginas no se pisen."""
+    table = ENTITY_MODEL[entity].__table__
+    stmt = select(*[table.c[n] for n in names]).where(table.c.deleted_at.is_(None))
+    stmt = filter_dates(stmt, ENTITY_DATE_COLUMN[entity], d_from, d_to)
+    if limit is not None:
+        stmt = stmt.order_by(*order_by, table.c.id.desc()).limit(limit).offset(offset)
+    else:
+        stmt = stmt.order_by(*order_by)
+    return db.execute(stmt).all()
+
+
+def load_rows(entity, names, d_from=None, d_to=None, order_by=(), limit=None, offset=0):
+    """read_rows() con la sesión de lectura del request, liberada apenas llegan las filas."""
+    try:
+        return read_rows(get_read_db(), entity, names, d_from, d_to, order_by, limit, offset)
+    finally:
+        release_db()
+
+
 # -----------------------------------------------------------------------------
 # Rutas básicas
 # -----------------------------------------------------------------------------
@@ -652,6 +1882,165 @@ def resolve_filters(args):
 def health():
     return jsonify(status="ok"), 200
 
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+# -----------------------------------------------------------------------------
+# Administración (requiere ADMIN_TOKEN en el header X-Admin-Token)
+# -----------------------------------------------------------------------------
+def admin_denied():
+    """None si el request trae el token de administración; si no, la respuesta de error."""
+    if not ADMIN_TOKEN:
+        return jsonify(error="Administración deshabilitada (falta ADMIN_TOKEN)."), 404
+    # solo por header: en la query string el token quedaría en los logs de acceso y el historial
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify(error="Token de administración inválido."), 403
+    return None
+
+@app.get("/admin/slow-queries")
+def admin_slow_queries():
+    denied = admin_denied()
+    if denied:
+        return denied
+    limit = request.args.get("limit", 50, type=int)
+    with _slow_lock:
+        entries = [dict(e) for e in reversed(SLOW_QUERIES)][:limit]
+    return jsonify(threshold_ms=SLOW_QUERY_MS, explain=SLOW_QUERY_EXPLAIN, entries=entries)
+
+
+# -----------------------------------------------------------------------------
+# Profiling bajo demanda: con PROFILING_ENABLED=1, cualquier ruta llamada con
+# ?_profile=cprofile|stack (o header X-Profile) y el token de administración se
+# ejecuta bajo el profiler y deja el resultado en PROFILE_DIR. Apagado, los hooks
+# ni siquiera se registran.
+# -----------------------------------------------------------------------------
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "5s-profiles"))
+PROFILE_KEEP = 50
+PROFILE_SAMPLE_INTERVAL = 0.005  # segundos entre muestras del modo stack
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.(prof|folded)$")
+_profile_lock = threading.Lock()  # un request perfilado a la vez (cProfile es global en 3.12+)
+
+
+class StackSampler(threading.Thread):
+    """Muestrea la pila del hilo del request cada PROFILE_SAMPLE_INTERVAL y acumula
+       stacks colapsados ("a;b;c N"), el formato de flamegraph.pl y speedscope."""
+
+    def __init__(self, thread_id):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.stacks = {}
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        return "".join(f"{k} {v}\n" for k, v in sorted(self.stacks.items()))
+
+
+def _profile_start():
+    mode = request.args.get("_profile") or request.headers.get("X-Profile")
+    if mode not in ("cprofile", "stack"):
+        return
+    if admin_denied() is not None:
+        g.profile_status = "denied"
+        return
+    if not _profile_lock.acquire(blocking=False):
+        g.profile_status = "busy"
+        return
+    if mode == "cprofile":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        g.profiler = StackSampler(threading.get_ident())
+        g.profiler.start()
+    g.profile_t0 = perf_counter()
+
+
+def _profile_stop(response):
+    """Cierra el perfil al armar la respuesta (el cuerpo de las respuestas en streaming no se mide)."""
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        if "profile_status" in g:
+            response.headers["X-Profile"] = g.profile_status
+        return response
+    try:
+        ms = (perf_counter() - g.profile_t0) * 1000
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        base = f"{stamp}-{request.endpoint or 'sin_ruta'}-{int(ms)}ms-{os.urandom(3).hex()}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            name = base + ".prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        else:
+            name = base + ".folded"
+            with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+                f.write(profiler.stop())
+    finally:
+        _profile_lock.release()
+    for old in sorted(n for n in os.listdir(PROFILE_DIR) if PROFILE_NAME_RE.match(n))[:-PROFILE_KEEP]:
+        os.remove(os.path.join(PROFILE_DIR, old))
+    response.headers["X-Profile"] = name
+    return response
+
+
+def _profile_abort(exc):
+    """Si el request terminó sin pasar por after_request, se descarta el perfil y se libera el lock."""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        _profile_lock.release()
+
+
+if PROFILING_ENABLED:
+    app.before_request(_profile_start)
+    app.after_request(_profile_stop)
+    app.teardown_request(_profile_abort)
+
+
+@app.get("/admin/profiles")
+def admin_profiles():
+    denied = admin_denied()
+    if denied:
+        return denied
+    if not PROFILING_ENABLED:
+        return jsonify(error="Profiling deshabilitado (PROFILING_ENABLED=1)."), 404
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if PROFILE_NAME_RE.match(n)), reverse=True) \
+        if os.path.isdir(PROFILE_DIR) else []
+    return jsonify(profiles=[
+        {"name": n, "bytes": os.path.getsize(os.path.join(PROFILE_DIR, n)),
+         "url": url_for("admin_profile_file", name=n)} for n in names])
+
+@app.get("/admin/profiles/<string:name>")
+def admin_profile_file(name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    path = os.path.join(PROFILE_DIR, name)
+    if not PROFILING_ENABLED or not PROFILE_NAME_RE.match(name) or not os.path.isfile(path):
+        return jsonify(error="Perfil no encontrado."), 404
+    mimetype = "application/octet-stream" if name.endswith(".prof") else "text/plain"
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
+
 @app.get("/")
 def home():
     return redirect(url_for("panel", tab="censo"))
@@ -659,714 +2048,754 @@ def home():
 # -----------------------------------------------------------------------------
 # PANEL (maneja formularios e importaciones por pestaña)
 # -----------------------------------------------------------------------------
+# Un parser por pestaña: arma el registro a partir de un formulario (request.form
+# o un dict con las mismas claves, como los que llegan a /api/<entidad>/bulk).
+
+# -------------------- CENSO --------------------
+def form_censo(form):
+    fecha = safe_convert_date(form["fecha"])
+    cd = int(form.get("censo_dia", 0) or 0)
+    cn = int(form.get("censo_noche", 0) or 0)
+    total = int(form.get("total", cd + cn) or (cd + cn))
+    return CensusEntry(fecha=fecha, censo_dia=cd, censo_noche=cn, total=total)
+
+# -------------------- EVENTOS --------------------
+def form_eventos(form):
+    fecha = safe_convert_date(form["fecha"])
+    horario = form.get("horario", "").strip()
+    que = form.get("que_ocurrio", "").strip()
+    nom = form.get("nombre_afectado", "").strip()
+    accion = form.get("accion", "").strip()
+    return EventSeguridad(fecha=fecha, horario=horario, que_ocurrio=que,
+                          nombre_afectado=nom, accion=accion)
+
+# -------------------- DUPLICIDADES --------------------
+def form_duplicidades(form):
+    semana = int(form["semana"])
+    fecha = safe_convert_date(form["fecha"])
+    return DuplicidadEntry(
+        semana=semana,
+        fecha=fecha,
+        id_interno=form.get("id", "").strip(),
+        empresa_contratista=form.get("empresa_contratista", "").strip(),
+        descripcion_problema=form.get("descripcion_problema", "").strip(),
+        tipo_riesgo=form.get("tipo_riesgo", "").strip(),
+        pabellon=form.get("pabellon", "").strip(),
+        habitacion=form.get("habitacion", "").strip(),
+        ingresar_contacto=form.get("ingresar_contacto", "").strip(),
+        nombre_usuario=form.get("nombre_usuario", "").strip(),
+        responsable=form.get("responsable", "").strip(),
+        estatus=form.get("estatus", "").strip(),
+        notificacion_usuario=form.get("notificacion_usuario", "").strip(),
+        plan_accion=form.get("plan_accion", "").strip(),
+        fecha_cierre=safe_convert_date(form.get("fecha_cierre")),
+    )
+
+# -------------------- ENCUESTA --------------------
+def form_encuesta(form):
+    fh_raw = form.get("fecha_hora")
+    fecha_hora = safe_convert_datetime(fh_raw)
+    vals = {}
+    total = 0; n = 0
+    for i in range(1,6):
+        r = form.get(f"q{i}_respuesta", "")
+        p = form.get(f"q{i}_puntaje", "")
+        p = int(p) if (str(p).isdigit() or (isinstance(p, str) and p.strip().isdigit())) else None
+        vals[i] = (r, p)
+        if p is not None: total += p; n += 1
+    promedio = (total / n) if n>0 else None
+    return EncuestaEntry(
+        fecha_hora=fecha_hora,
+        q1_respuesta=vals[1][0], q1_puntaje=vals[1][1],
+        q2_respuesta=vals[2][0], q2_puntaje=vals[2][1],
+        q3_respuesta=vals[3][0], q3_puntaje=vals[3][1],
+        q4_respuesta=vals[4][0], q4_puntaje=vals[4][1],
+        q5_respuesta=vals[5][0], q5_puntaje=vals[5][1],
+        total=total if n>0 else None,
+        promedio=round(promedio,2) if promedio is not None else None,
+        comentarios=form.get("comentarios", "").strip(),
+    )
+
+# -------------------- ATENCIÓN --------------------
+def form_atencion(form):
+    fecha = safe_convert_date(form["fecha"])
+    tiempo_input = form.get("tiempo_promedio", "").strip()
+
+    segundos = safe_convert_time(tiempo_input)
+
+    cant = int(form.get("cantidad", 0) or 0)
+    return AtencionEntry(fecha=fecha, tiempo_promedio_sec=segundos, cantidad=cant)
+
+# -------------------- ROBOS / HURTOS --------------------
+def form_robos(form):
+    fecha = safe_convert_date(form["fecha"])
+    hora = form.get("hora", "00:00")
+    hora_obj = safe_time_hhmm(hora)  # Usamos la nueva función robusta
+    return RoboHurtoEntry(
+        fecha=fecha, hora=hora_obj,
+        modulo=form.get("modulo","").strip(),
+        habitacion=form.get("habitacion","").strip(),
+        empresa=form.get("empresa","").strip(),
+        nombre_cliente=form.get("nombre_cliente","").strip(),
+        rut=form.get("rut","").strip(),
+        medio_reclamo=form.get("medio_reclamo","").strip(),
+        especies=form.get("especies","").strip(),
+        observaciones=form.get("observaciones","").strip(),
+        recepciona=form.get("recepciona","").strip(),
+    )
+
+# -------------------- MISCELÁNEO --------------------
+def form_miscelaneo(form):
+    return MiscelaneoEntry(
+        ot=form.get("ot","").strip(),
+        division=form.get("division","").strip(),
+        area=form.get("area","").strip(),
+        lugar=form.get("lugar","").strip(),
+        ubicacion=form.get("ubicacion","").strip(),
+        disciplina=form.get("disciplina","").strip(),
+        especialidad=form.get("especialidad","").strip(),
+        falla=form.get("falla","").strip(),
+        empresa=form.get("empresa","").strip(),
+        fecha_creacion=safe_convert_date(form.get("fecha_creacion")),
+        fecha_inicio=safe_convert_date(form.get("fecha_inicio")),
+        fecha_termino=safe_convert_date(form.get("fecha_termino")),
+        fecha_aprobacion=safe_convert_date(form.get("fecha_aprobacion")),
+        estado=form.get("estado","").strip(),
+        comentario=form.get("comentario","").strip(),
+    )
+
+# -------------------- DESVIACIONES --------------------
+def form_desviaciones(form):
+    return DesviacionEntry(
+        n_solicitud=form.get("n_solicitud","").strip(),
+        fecha=safe_convert_date(form["fecha"]),
+        id_interno=form.get("id","").strip(),
+        empresa_contratista=form.get("empresa_contratista","").strip(),
+        descripcion_problema=form.get("descripcion_problema","").strip(),
+        tipo_riesgo=form.get("tipo_riesgo","").strip(),
+        tipo_solicitud=form.get("tipo_solicitud","").strip(),
+        pabellon=form.get("pabellon","").strip(),
+        habitacion=form.get("habitacion","").strip(),
+        via_solicitud=form.get("via_solicitud","").strip(),
+        quien_informa=form.get("quien_informa","").strip(),
+        riesgo_material=form.get("riesgo_material","").strip(),
+        correo_destino=form.get("correo_destino","").strip(),
+    )
+
+# -------------------- SOLICITUD / OT USUARIO --------------------
+def form_solicitud_ot(form):
+    def to_secs(v):
+        v = (v or "").strip()
+        return safe_convert_time(v)
+    return SolicitudOTEntry(
+        n_solicitud=form.get("n_solicitud","").strip(),
+        descripcion_problema=form.get("descripcion_problema","").strip(),
+        tipo_solicitud=form.get("tipo_solicitud","").strip(),
+        modulo=form.get("modulo","").strip(),
+        habitacion=form.get("habitacion","").strip(),
+        tipo_turno=form.get("tipo_turno","").strip(),
+        jornada=form.get("jornada","").strip(),
+        via_solicitud=form.get("via_solicitud","").strip(),
+        correo_usuario=form.get("correo_usuario","").strip(),
+        tipo_tarea=form.get("tipo_tarea","").strip(),
+        ot=form.get("ot","").strip(),
+        fecha_inicio=safe_convert_date(form.get("fecha_inicio")),
+        estado=form.get("estado","").strip(),
+        tiempo_respuesta_sec=to_secs(form.get("tiempo_respuesta")),
+        satisfaccion_reclamo=form.get("satisfaccion_reclamo","").strip(),
+        motivo=form.get("motivo","").strip(),
+        observacion=form.get("observacion","").strip(),
+    )
+
+# -------------------- RECLAMOS USUARIOS --------------------
+def form_reclamos(form):
+    return ReclamoUsuarioEntry(
+        n_solicitud=form.get("n_solicitud","").strip(),
+        fecha=safe_convert_date(form["fecha"]),
+        id_interno=form.get("id","").strip(),
+        empresa_contratista=form.get("empresa_contratista","").strip(),
+        descripcion_problema=form.get("descripcion_problema","").strip(),
+        tipo_solicitud=form.get("tipo_solicitud","").strip(),
+        pabellon=form.get("pabellon","").strip(),
+        habitacion=form.get("habitacion","").strip(),
+        via_solicitud=form.get("via_solicitud","").strip(),
+        ingresar_contacto=form.get("ingresar_contacto","").strip(),
+        nombre_usuario=form.get("nombre_usuario","").strip(),
+        responsable=form.get("responsable","").strip(),
+        estatus=form.get("estatus","").strip(),
+        notificacion_usuario=form.get("notificacion_usuario","").strip(),
+        plan_accion=form.get("plan_accion","").strip(),
+    )
+
+# -------------------- ACTIVACIÓN DE ALARMA --------------------
+def form_alarmas(form):
+    fecha = safe_convert_date(form["fecha"])
+    def f2t(v):
+        v = (v or "").strip()
+        return safe_time_hhmm(v)  # Usamos la nueva función robusta
+    def f2float(v):
+        try:
+            return float(v) if (v is not None and str(v).strip()!="") else None
+        except:
+            return None
+    return ActivacionAlarmaEntry(
+        modulo=form.get("modulo","").strip(),
+        n_habitacion=form.get("n_habitacion","").strip(),
+        nombre_recepcionista=form.get("nombre_recepcionista","").strip(),
+        fecha=fecha,
+        empresa=form.get("empresa","").strip(),
+        id_interno=form.get("id_interno","").strip(),
+        co=form.get("co","").strip(),
+        aviso_mantencion_h=f2float(form.get("aviso_mantencion_h")),
+        llegada_mantencion_h=f2float(form.get("llegada_mantencion_h")),
+        aviso_lider_h=f2float(form.get("aviso_lider_h")),
+        llegada_lider_h=f2float(form.get("llegada_lider_h")),
+        hora_reporte_salfa=f2t(form.get("hora_reporte_salfa")),
+        tipo_evento=form.get("tipo_evento","").strip(),
+        tipo_actividad=form.get("tipo_actividad","").strip(),
+        fecha_reporte=safe_convert_date(form.get("fecha_reporte")),
+        turno_recepcion_ingresos=form.get("turno_recepcion_ingresos","").strip(),
+        observaciones=form.get("observaciones","").strip(),
+    )
+
+# -------------------- EXTENSIÓN / EXCEPCIÓN --------------------
+def form_extensiones(form):
+    return ExtensionExcepcionEntry(
+        fecha_solicitud=safe_convert_date(form["fecha_solicitud"]),
+        id_interno=form.get("id_interno","").strip(),
+        empresa=form.get("empresa","").strip(),
+        co=form.get("co","").strip(),
+        gerencia=form.get("gerencia","").strip(),
+        proyecto=form.get("proyecto","").strip(),
+        cant_clientes=(int(form.get("cant_clientes")) if form.get("cant_clientes") else None),
+        desde=safe_convert_date(form.get("desde")),
+        hasta=safe_convert_date(form.get("hasta")),
+        aprobador=form.get("aprobador","").strip(),
+        observacion=form.get("observacion","").strip(),
+    )
+
+# -------------------- ONBOARDING --------------------
+def form_onboarding(form):
+    fh_raw = form.get("fecha_hora")
+    fecha_hora = safe_convert_datetime(fh_raw)
+    return OnboardingEntry(
+        fecha_hora=fecha_hora,
+        nombre=form.get("nombre","").strip(),
+        rut=form.get("rut","").strip(),
+        empresa=form.get("empresa","").strip(),
+        id_interno=form.get("id_interno","").strip(),
+        archivo_pdf=form.get("archivo_pdf","").strip(),
+    )
+
+# -------------------- APERTURA DE HABITACIÓN --------------------
+def form_apertura(form):
+    def f2t(v):
+        v = (v or "").strip()
+        return safe_time_hhmm(v)  # Usamos la nueva función robusta
+    return AperturaHabitacionEntry(
+        fecha=safe_convert_date(form["fecha"]),
+        habitacion=form.get("habitacion","").strip(),
+        hora=f2t(form.get("hora")),
+        responsable=form.get("responsable","").strip(),
+        estado_chapa=form.get("estado_chapa","").strip(),
+    )
+
+# -------------------- CUMPLIMIENTO EECC --------------------
+def form_cumplimiento(form):
+    return CumplimientoEECCEntry(
+        empresa=form.get("empresa","").strip(),
+        n_contrato=form.get("n_contrato","").strip(),
+        co=form.get("co","").strip(),
+        correo_electronico=form.get("correo_electronico","").strip(),
+        id_interno=form.get("id_interno","").strip(),
+        turno=form.get("turno","").strip(),
+
+        # --- NUEVO ---
+        fecha=safe_convert_date(form.get("fecha")),
+    )
+
+
+# pestaña → (parser, mensaje flash)
+PANEL_FORMS = {
+    "censo": (form_censo, "Censo guardado."),
+    "eventos": (form_eventos, "Evento de seguridad guardado."),
+    "duplicidades": (form_duplicidades, "Duplicidad guardada."),
+    "encuesta": (form_encuesta, "Encuesta guardada."),
+    "atencion": (form_atencion, "Atención guardada."),
+    "robos": (form_robos, "Robo/Hurto guardado."),
+    "miscelaneo": (form_miscelaneo, "Misceláneo guardado."),
+    "desviaciones": (form_desviaciones, "Desviación guardada."),
+    "solicitud_ot": (form_solicitud_ot, "Solicitud/OT guardada."),
+    "reclamos": (form_reclamos, "Reclamo de usuario guardado."),
+    "alarmas": (form_alarmas, "Activación de alarma guardada."),
+    "extensiones": (form_extensiones, "Extensión/Excepción guardada."),
+    "onboarding": (form_onboarding, "Onboarding guardado."),
+    "apertura": (form_apertura, "Apertura de habitación guardada."),
+    "cumplimiento": (form_cumplimiento, "Cumplimiento EECC guardado."),
+}
+
+
 @app.route("/panel", methods=["GET", "POST"])
 def panel():
     # tabs: censo | eventos | duplicidades | encuesta | atencion |
     #       robos | miscelaneo | desviaciones | solicitud_ot | reclamos |
     #       alarmas | extensiones | onboarding | apertura | cumplimiento
     tab = request.args.get("tab", "censo")
-    db = SessionLocal()
-    try:
-        if request.method == "POST":
-            # -------------------- CENSO --------------------
-            if tab == "censo":
-                fecha = safe_convert_date(request.form["fecha"])
-                cd = int(request.form.get("censo_dia", 0) or 0)
-                cn = int(request.form.get("censo_noche", 0) or 0)
-                total = int(request.form.get("total", cd + cn) or (cd + cn))
-                db.add(CensusEntry(fecha=fecha, censo_dia=cd, censo_noche=cn, total=total))
-                db.commit(); flash("Censo guardado.")
-
-            # -------------------- EVENTOS --------------------
-            elif tab == "eventos":
-                fecha = safe_convert_date(request.form["fecha"])
-                horario = request.form.get("horario", "").strip()
-                que = request.form.get("que_ocurrio", "").strip()
-                nom = request.form.get("nombre_afectado", "").strip()
-                accion = request.form.get("accion", "").strip()
-                db.add(EventSeguridad(fecha=fecha, horario=horario, que_ocurrio=que,
-                                      nombre_afectado=nom, accion=accion))
-                db.commit(); flash("Evento de seguridad guardado.")
-
-            # -------------------- DUPLICIDADES --------------------
-            elif tab == "duplicidades":
-                semana = int(request.form["semana"])
-                fecha = safe_convert_date(request.form["fecha"])
-                rec = DuplicidadEntry(
-                    semana=semana,
-                    fecha=fecha,
-                    id_interno=request.form.get("id", "").strip(),
-                    empresa_contratista=request.form.get("empresa_contratista", "").strip(),
-                    descripcion_problema=request.form.get("descripcion_problema", "").strip(),
-                    tipo_riesgo=request.form.get("tipo_riesgo", "").strip(),
-                    pabellon=request.form.get("pabellon", "").strip(),
-                    habitacion=request.form.get("habitacion", "").strip(),
-                    ingresar_contacto=request.form.get("ingresar_contacto", "").strip(),
-                    nombre_usuario=request.form.get("nombre_usuario", "").strip(),
-                    responsable=request.form.get("responsable", "").strip(),
-                    estatus=request.form.get("estatus", "").strip(),
-                    notificacion_usuario=request.form.get("notificacion_usuario", "").strip(),
-                    plan_accion=request.form.get("plan_accion", "").strip(),
-                    fecha_cierre=safe_convert_date(request.form.get("fecha_cierre")),
-                )
-                db.add(rec); db.commit(); flash("Duplicidad guardada.")
-
-            # -------------------- ENCUESTA --------------------
-            elif tab == "encuesta":
-                fh_raw = request.form.get("fecha_hora")
-                fecha_hora = safe_convert_datetime(fh_raw)
-                vals = {}
-                total = 0; n = 0
-                for i in range(1,6):
-                    r = request.form.get(f"q{i}_respuesta", "")
-                    p = request.form.get(f"q{i}_puntaje", "")
-                    p = int(p) if (str(p).isdigit() or (isinstance(p, str) and p.strip().isdigit())) else None
-                    vals[i] = (r, p)
-                    if p is not None: total += p; n += 1
-                promedio = (total / n) if n>0 else None
-                db.add(EncuestaEntry(
-                    fecha_hora=fecha_hora,
-                    q1_respuesta=vals[1][0], q1_puntaje=vals[1][1],
-                    q2_respuesta=vals[2][0], q2_puntaje=vals[2][1],
-                    q3_respuesta=vals[3][0], q3_puntaje=vals[3][1],
-                    q4_respuesta=vals[4][0], q4_puntaje=vals[4][1],
-                    q5_respuesta=vals[5][0], q5_puntaje=vals[5][1],
-                    total=total if n>0 else None,
-                    promedio=round(promedio,2) if promedio is not None else None,
-                    comentarios=request.form.get("comentarios", "").strip(),
-                ))
-                db.commit(); flash("Encuesta guardada.")
-
-            # -------------------- ATENCIÓN --------------------
-            elif tab == "atencion":
-                fecha = safe_convert_date(request.form["fecha"])
-                tiempo_input = request.form.get("tiempo_promedio", "").strip()
-                
-                segundos = safe_convert_time(tiempo_input)
-                
-                cant = int(request.form.get("cantidad", 0) or 0)
-                db.add(AtencionEntry(fecha=fecha, tiempo_promedio_sec=segundos, cantidad=cant))
-                db.commit(); flash("Atención guardada.")
-
-            # -------------------- ROBOS / HURTOS --------------------
-            elif tab == "robos":
-                fecha = safe_convert_date(request.form["fecha"])
-                hora = request.form.get("hora", "00:00")
-                hora_obj = safe_time_hhmm(hora)  # Usamos la nueva función robusta
-                rec = RoboHurtoEntry(
-                    fecha=fecha, hora=hora_obj,
-                    modulo=request.form.get("modulo","").strip(),
-                    habitacion=request.form.get("habitacion","").strip(),
-                    empresa=request.form.get("empresa","").strip(),
-                    nombre_cliente=request.form.get("nombre_cliente","").strip(),
-                    rut=request.form.get("rut","").strip(),
-                    medio_reclamo=request.form.get("medio_reclamo","").strip(),
-                    especies=request.form.get("especies","").strip(),
-                    observaciones=request.form.get("observaciones","").strip(),
-                    recepciona=request.form.get("recepciona","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Robo/Hurto guardado.")
-
-            # -------------------- MISCELÁNEO --------------------
-            elif tab == "miscelaneo":
-                rec = MiscelaneoEntry(
-                    ot=request.form.get("ot","").strip(),
-                    division=request.form.get("division","").strip(),
-                    area=request.form.get("area","").strip(),
-                    lugar=request.form.get("lugar","").strip(),
-                    ubicacion=request.form.get("ubicacion","").strip(),
-                    disciplina=request.form.get("disciplina","").strip(),
-                    especialidad=request.form.get("especialidad","").strip(),
-                    falla=request.form.get("falla","").strip(),
-                    empresa=request.form.get("empresa","").strip(),
-                    fecha_creacion=safe_convert_date(request.form.get("fecha_creacion")),
-                    fecha_inicio=safe_convert_date(request.form.get("fecha_inicio")),
-                    fecha_termino=safe_convert_date(request.form.get("fecha_termino")),
-                    fecha_aprobacion=safe_convert_date(request.form.get("fecha_aprobacion")),
-                    estado=request.form.get("estado","").strip(),
-                    comentario=request.form.get("comentario","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Misceláneo guardado.")
-
-            # -------------------- DESVIACIONES --------------------
-            elif tab == "desviaciones":
-                rec = DesviacionEntry(
-                    n_solicitud=request.form.get("n_solicitud","").strip(),
-                    fecha=safe_convert_date(request.form["fecha"]),
-                    id_interno=request.form.get("id","").strip(),
-                    empresa_contratista=request.form.get("empresa_contratista","").strip(),
-                    descripcion_problema=request.form.get("descripcion_problema","").strip(),
-                    tipo_riesgo=request.form.get("tipo_riesgo","").strip(),
-                    tipo_solicitud=request.form.get("tipo_solicitud","").strip(),
-                    pabellon=request.form.get("pabellon","").strip(),
-                    habitacion=request.form.get("habitacion","").strip(),
-                    via_solicitud=request.form.get("via_solicitud","").strip(),
-                    quien_informa=request.form.get("quien_informa","").strip(),
-                    riesgo_material=request.form.get("riesgo_material","").strip(),
-                    correo_destino=request.form.get("correo_destino","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Desviación guardada.")
-
-            # -------------------- SOLICITUD / OT USUARIO --------------------
-            elif tab == "solicitud_ot":
-                def to_secs(v):
-                    v = (v or "").strip()
-                    return safe_convert_time(v)
-                rec = SolicitudOTEntry(
-                    n_solicitud=request.form.get("n_solicitud","").strip(),
-                    descripcion_problema=request.form.get("descripcion_problema","").strip(),
-                    tipo_solicitud=request.form.get("tipo_solicitud","").strip(),
-                    modulo=request.form.get("modulo","").strip(),
-                    habitacion=request.form.get("habitacion","").strip(),
-                    tipo_turno=request.form.get("tipo_turno","").strip(),
-                    jornada=request.form.get("jornada","").strip(),
-                    via_solicitud=request.form.get("via_solicitud","").strip(),
-                    correo_usuario=request.form.get("correo_usuario","").strip(),
-                    tipo_tarea=request.form.get("tipo_tarea","").strip(),
-                    ot=request.form.get("ot","").strip(),
-                    fecha_inicio=safe_convert_date(request.form.get("fecha_inicio")),
-                    estado=request.form.get("estado","").strip(),
-                    tiempo_respuesta_sec=to_secs(request.form.get("tiempo_respuesta")),
-                    satisfaccion_reclamo=request.form.get("satisfaccion_reclamo","").strip(),
-                    motivo=request.form.get("motivo","").strip(),
-                    observacion=request.form.get("observacion","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Solicitud/OT guardada.")
-
-            # -------------------- RECLAMOS USUARIOS --------------------
-            elif tab == "reclamos":
-                rec = ReclamoUsuarioEntry(
-                    n_solicitud=request.form.get("n_solicitud","").strip(),
-                    fecha=safe_convert_date(request.form["fecha"]),
-                    id_interno=request.form.get("id","").strip(),
-                    empresa_contratista=request.form.get("empresa_contratista","").strip(),
-                    descripcion_problema=request.form.get("descripcion_problema","").strip(),
-                    tipo_solicitud=request.form.get("tipo_solicitud","").strip(),
-                    pabellon=request.form.get("pabellon","").strip(),
-                    habitacion=request.form.get("habitacion","").strip(),
-                    via_solicitud=request.form.get("via_solicitud","").strip(),
-                    ingresar_contacto=request.form.get("ingresar_contacto","").strip(),
-                    nombre_usuario=request.form.get("nombre_usuario","").strip(),
-                    responsable=request.form.get("responsable","").strip(),
-                    estatus=request.form.get("estatus","").strip(),
-                    notificacion_usuario=request.form.get("notificacion_usuario","").strip(),
-                    plan_accion=request.form.get("plan_accion","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Reclamo de usuario guardado.")
-
-            # -------------------- ACTIVACIÓN DE ALARMA --------------------
-            elif tab == "alarmas":
-                fecha = safe_convert_date(request.form["fecha"])
-                def f2t(v):
-                    v = (v or "").strip()
-                    return safe_time_hhmm(v)  # Usamos la nueva función robusta
-                def f2float(v):
-                    try:
-                        return float(v) if (v is not None and str(v).strip()!="") else None
-                    except:
-                        return None
-                rec = ActivacionAlarmaEntry(
-                    modulo=request.form.get("modulo","").strip(),
-                    n_habitacion=request.form.get("n_habitacion","").strip(),
-                    nombre_recepcionista=request.form.get("nombre_recepcionista","").strip(),
-                    fecha=fecha,
-                    empresa=request.form.get("empresa","").strip(),
-                    id_interno=request.form.get("id_interno","").strip(),
-                    co=request.form.get("co","").strip(),
-                    aviso_mantencion_h=f2float(request.form.get("aviso_mantencion_h")),
-                    llegada_mantencion_h=f2float(request.form.get("llegada_mantencion_h")),
-                    aviso_lider_h=f2float(request.form.get("aviso_lider_h")),
-                    llegada_lider_h=f2float(request.form.get("llegada_lider_h")),
-                    hora_reporte_salfa=f2t(request.form.get("hora_reporte_salfa")),
-                    tipo_evento=request.form.get("tipo_evento","").strip(),
-                    tipo_actividad=request.form.get("tipo_actividad","").strip(),
-                    fecha_reporte=safe_convert_date(request.form.get("fecha_reporte")),
-                    turno_recepcion_ingresos=request.form.get("turno_recepcion_ingresos","").strip(),
-                    observaciones=request.form.get("observaciones","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Activación de alarma guardada.")
-
-            # -------------------- EXTENSIÓN / EXCEPCIÓN --------------------
-            elif tab == "extensiones":
-                rec = ExtensionExcepcionEntry(
-                    fecha_solicitud=safe_convert_date(request.form["fecha_solicitud"]),
-                    id_interno=request.form.get("id_interno","").strip(),
-                    empresa=request.form.get("empresa","").strip(),
-                    co=request.form.get("co","").strip(),
-                    gerencia=request.form.get("gerencia","").strip(),
-                    proyecto=request.form.get("proyecto","").strip(),
-                    cant_clientes=(int(request.form.get("cant_clientes")) if request.form.get("cant_clientes") else None),
-                    desde=safe_convert_date(request.form.get("desde")),
-                    hasta=safe_convert_date(request.form.get("hasta")),
-                    aprobador=request.form.get("aprobador","").strip(),
-                    observacion=request.form.get("observacion","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Extensión/Excepción guardada.")
-
-            # -------------------- ONBOARDING --------------------
-            elif tab == "onboarding":
-                fh_raw = request.form.get("fecha_hora")
-                fecha_hora = safe_convert_datetime(fh_raw)
-                rec = OnboardingEntry(
-                    fecha_hora=fecha_hora,
-                    nombre=request.form.get("nombre","").strip(),
-                    rut=request.form.get("rut","").strip(),
-                    empresa=request.form.get("empresa","").strip(),
-                    id_interno=request.form.get("id_interno","").strip(),
-                    archivo_pdf=request.form.get("archivo_pdf","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Onboarding guardado.")
-
-            # -------------------- APERTURA DE HABITACIÓN --------------------
-            elif tab == "apertura":
-                def f2t(v):
-                    v = (v or "").strip()
-                    return safe_time_hhmm(v)  # Usamos la nueva función robusta
-                rec = AperturaHabitacionEntry(
-                    fecha=safe_convert_date(request.form["fecha"]),
-                    habitacion=request.form.get("habitacion","").strip(),
-                    hora=f2t(request.form.get("hora")),
-                    responsable=request.form.get("responsable","").strip(),
-                    estado_chapa=request.form.get("estado_chapa","").strip(),
-                )
-                db.add(rec); db.commit(); flash("Apertura de habitación guardada.")
-
-            # -------------------- CUMPLIMIENTO EECC --------------------
-            elif tab == "cumplimiento":
-                rec = CumplimientoEECCEntry(
-                    empresa=request.form.get("empresa","").strip(),
-                    n_contrato=request.form.get("n_contrato","").strip(),
-                    co=request.form.get("co","").strip(),
-                    correo_electronico=request.form.get("correo_electronico","").strip(),
-                    id_interno=request.form.get("id_interno","").strip(),
-                    turno=request.form.get("turno","").strip(),
-            
-                    # --- NUEVO ---
-                    fecha=safe_convert_date(request.form.get("fecha")),
-                )
-                db.add(rec); db.commit(); flash("Cumplimiento EECC guardado.")
-
-            return redirect(url_for("panel", tab=tab))
-
-        # GET
-        return render_template("panel.html", tab=tab, week_map=WEEK_MAP, current_tab=tab)
-    finally:
-        db.close()
+    if request.method == "POST":
+        if tab in PANEL_FORMS:
+            build, msg = PANEL_FORMS[tab]
+            db = get_db()
+            db.add(build(request.form)); db.commit(); flash(msg)
+
+        return redirect(url_for("panel", tab=tab))
+
+    # GET
+    return render_template("panel.html", tab=tab, week_map=week_map(), current_tab=tab)
 
 
 # -----------------------------------------------------------------------------
 # LISTADOS / REGISTROS + DESCARGAS CSV
 # -----------------------------------------------------------------------------
+# vista → (variable de list.html, columnas que muestra la tabla, orden)
+LIST_VIEWS = {
+    "censo": ("census", ["id", "fecha", "censo_dia", "censo_noche", "total", "creado"],
+              [CensusEntry.fecha.desc()]),
+    "eventos": ("eventos", ["id", "fecha", "horario", "que_ocurrio", "nombre_afectado", "creado"],
+                [EventSeguridad.fecha.desc()]),
+    "duplicidades": ("duplics", ["id", "semana", "fecha", "id_interno", "empresa_contratista",
+                                 "descripcion_problema", "estatus", "creado"],
+                     [DuplicidadEntry.fecha.desc()]),
+    "encuestas": ("encuestas", ["id", "fecha_hora", "q1_puntaje", "q2_puntaje", "q3_puntaje",
+                                "q4_puntaje", "q5_puntaje", "total", "promedio", "creado"],
+                  [EncuestaEntry.fecha_hora.desc()]),
+    "atencion": ("atenciones", ["id", "fecha", "tiempo_promedio_sec", "cantidad", "creado"],
+                 [AtencionEntry.fecha.desc()]),
+    "robos": ("robos", ["id", "fecha", "hora", "modulo", "habitacion", "empresa", "nombre_cliente",
+                        "especies", "recepciona", "creado"],
+              [RoboHurtoEntry.fecha.desc()]),
+    "miscelaneo": ("miscelaneo", ["id", "ot", "division", "area", "lugar", "fecha_creacion",
+                                  "fecha_inicio", "fecha_termino", "estado", "creado"],
+                   [MiscelaneoEntry.fecha_creacion.desc(), MiscelaneoEntry.id.desc()]),
+    "desviaciones": ("desviaciones", ["id", "n_solicitud", "fecha", "id_interno", "empresa_contratista",
+                                      "tipo_riesgo", "tipo_solicitud", "pabellon", "habitacion", "creado"],
+                     [DesviacionEntry.fecha.desc()]),
+    "solicitud_ot": ("solicitudes_ot", ["id", "n_solicitud", "tipo_solicitud", "modulo", "habitacion",
+                                        "fecha_inicio", "estado", "tiempo_respuesta_sec", "creado"],
+                     [SolicitudOTEntry.fecha_inicio.desc().nullslast(), SolicitudOTEntry.id.desc()]),
+    "reclamos": ("reclamos", ["id", "n_solicitud", "fecha", "empresa_contratista", "tipo_solicitud",
+                              "pabellon", "habitacion", "responsable", "estatus", "creado"],
+                 [ReclamoUsuarioEntry.fecha.desc()]),
+    "alarmas": ("alarmas", ["id", "fecha", "modulo", "n_habitacion", "empresa", "tipo_evento",
+                            "tipo_actividad", "hora_reporte_salfa", "creado"],
+                [ActivacionAlarmaEntry.fecha.desc()]),
+    "extensiones": ("extensiones", ["id", "fecha_solicitud", "empresa", "co", "proyecto", "cant_clientes",
+                                    "desde", "hasta", "aprobador", "creado"],
+                    [ExtensionExcepcionEntry.fecha_solicitud.desc()]),
+    "onboarding": ("onboarding", ["id", "fecha_hora", "nombre", "rut", "empresa", "id_interno",
+                                  "archivo_pdf", "creado"],
+                   [OnboardingEntry.fecha_hora.desc()]),
+    "apertura": ("apertura", ["id", "fecha", "habitacion", "hora", "responsable", "estado_chapa", "creado"],
+                 [AperturaHabitacionEntry.fecha.desc()]),
+    "cumplimiento": ("cumplimiento", ["id", "fecha", "empresa", "n_contrato", "co", "id_interno", "turno",
+                                      "correo_electronico", "creado"],
+                     [CumplimientoEECCEntry.fecha.desc(), CumplimientoEECCEntry.id.desc()]),
+}
+
+
 @app.get("/registros")
 def registros():
     d_from, d_to, semana_sel = resolve_filters(request.args)
     vista = request.args.get("vista", "censo")
-    db = SessionLocal()
-    try:
-        if semana_sel:
-            d_from, d_to = week_range(semana_sel)
+    cached = not_modified([vista] if vista in LIST_VIEWS else [])
+    if cached:
+        return cached
+    if semana_sel:
+        d_from, d_to = week_range(semana_sel)
+    d_from, d_to = clamp_range(d_from, d_to)
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    # list.html solo dibuja la tabla de la vista seleccionada: se lee únicamente esa,
+    # de a LIST_PAGE_SIZE filas (se pide una más para saber si hay página siguiente)
+    table_html, n_rows, has_next = render_list_table(vista, d_from, d_to, page)
+
+    args = request.args.to_dict()
+    pager = {
+        "first": (page - 1) * LIST_PAGE_SIZE + 1,
+        "last": (page - 1) * LIST_PAGE_SIZE + n_rows,
+        "prev_url": url_for("registros", **{**args, "page": page - 1}) if page > 1 else None,
+        "next_url": url_for("registros", **{**args, "page": page + 1}) if has_next else None,
+    }
 
-        def between(q, col):
-            if d_from: q = q.filter(col >= d_from)
-            if d_to:   q = q.filter(col <= d_to)
-            return q
+    return render_template(
+        "list.html",
+        semana_sel=semana_sel, d_from=d_from, d_to=d_to, week_map=week_map(),
+        vista=vista,
+        current_tab=None,
+        pager=pager,
+        table_html=Markup(table_html),
+        live={"events": url_for("events") if SSE_MAX_CLIENTS > 0 else None, "vista": vista,
+              "from": d_from.isoformat() if d_from else None, "to": d_to.isoformat() if d_to else None},
+    )
 
-        census = between(db.query(CensusEntry), CensusEntry.fecha).order_by(CensusEntry.fecha.desc()).all()
-        eventos = between(db.query(EventSeguridad), EventSeguridad.fecha).order_by(EventSeguridad.fecha.desc()).all()
-        duplics = between(db.query(DuplicidadEntry), DuplicidadEntry.fecha).order_by(DuplicidadEntry.fecha.desc()).all()
-
-        encuestas = db.query(EncuestaEntry)
-        if d_from: encuestas = encuestas.filter(EncuestaEntry.fecha_hora >= datetime.combine(d_from, time.min))
-        if d_to:   encuestas = encuestas.filter(EncuestaEntry.fecha_hora <= datetime.combine(d_to, time.max))
-        encuestas = encuestas.order_by(EncuestaEntry.fecha_hora.desc()).all()
-
-        atenciones = between(db.query(AtencionEntry), AtencionEntry.fecha).order_by(AtencionEntry.fecha.desc()).all()
-
-        robos = db.query(RoboHurtoEntry)
-        if d_from: robos = robos.filter(RoboHurtoEntry.fecha >= d_from)
-        if d_to:   robos = robos.filter(RoboHurtoEntry.fecha <= d_to)
-        robos = robos.order_by(RoboHurtoEntry.fecha.desc()).all()
-
-        miscelaneo = db.query(MiscelaneoEntry)
-        if d_from: miscelaneo = miscelaneo.filter(MiscelaneoEntry.fecha_creacion >= d_from)
-        if d_to:   miscelaneo = miscelaneo.filter(MiscelaneoEntry.fecha_creacion <= d_to)
-        miscelaneo = miscelaneo.order_by(
-            MiscelaneoEntry.fecha_creacion.desc(),
-            MiscelaneoEntry.id.desc()
-        ).all()
-
-        desviaciones = db.query(DesviacionEntry)
-        if d_from: desviaciones = desviaciones.filter(DesviacionEntry.fecha >= d_from)
-        if d_to:   desviaciones = desviaciones.filter(DesviacionEntry.fecha <= d_to)
-        desviaciones = desviaciones.order_by(DesviacionEntry.fecha.desc()).all()
-
-        solicitudes_ot = db.query(SolicitudOTEntry)
-        if d_from: solicitudes_ot = solicitudes_ot.filter(SolicitudOTEntry.fecha_inicio >= d_from)
-        if d_to:   solicitudes_ot = solicitudes_ot.filter(SolicitudOTEntry.fecha_inicio <= d_to)
-        solicitudes_ot = solicitudes_ot.order_by(
-            SolicitudOTEntry.fecha_inicio.desc().nullslast(),
-            SolicitudOTEntry.id.desc()
-        ).all()
-
-        reclamos = db.query(ReclamoUsuarioEntry)
-        if d_from: reclamos = reclamos.filter(ReclamoUsuarioEntry.fecha >= d_from)
-        if d_to:   reclamos = reclamos.filter(ReclamoUsuarioEntry.fecha <= d_to)
-        reclamos = reclamos.order_by(ReclamoUsuarioEntry.fecha.desc()).all()
-
-        # --------- NUEVOS 5 MÓDULOS ----------
-        alarmas = db.query(ActivacionAlarmaEntry)
-        if d_from: alarmas = alarmas.filter(ActivacionAlarmaEntry.fecha >= d_from)
-        if d_to:   alarmas = alarmas.filter(ActivacionAlarmaEntry.fecha <= d_to)
-        alarmas = alarmas.order_by(ActivacionAlarmaEntry.fecha.desc()).all()
-
-        extensiones = db.query(ExtensionExcepcionEntry)
-        if d_from: extensiones = extensiones.filter(ExtensionExcepcionEntry.fecha_solicitud >= d_from)
-        if d_to:   extensiones = extensiones.filter(ExtensionExcepcionEntry.fecha_solicitud <= d_to)
-        extensiones = extensiones.order_by(ExtensionExcepcionEntry.fecha_solicitud.desc()).all()
-
-        onboarding = db.query(OnboardingEntry)
-        if d_from: onboarding = onboarding.filter(OnboardingEntry.fecha_hora >= datetime.combine(d_from, time.min))
-        if d_to:   onboarding = onboarding.filter(OnboardingEntry.fecha_hora <= datetime.combine(d_to, time.max))
-        onboarding = onboarding.order_by(OnboardingEntry.fecha_hora.desc()).all()
-
-        apertura = db.query(AperturaHabitacionEntry)
-        if d_from: apertura = apertura.filter(AperturaHabitacionEntry.fecha >= d_from)
-        if d_to:   apertura = apertura.filter(AperturaHabitacionEntry.fecha <= d_to)
-        apertura = apertura.order_by(AperturaHabitacionEntry.fecha.desc()).all()
-
-        cumplimiento = db.query(CumplimientoEECCEntry)
-        if d_from: cumplimiento = cumplimiento.filter(CumplimientoEECCEntry.fecha >= d_from)
-        if d_to:   cumplimiento = cumplimiento.filter(CumplimientoEECCEntry.fecha <= d_to)
-        cumplimiento = cumplimiento.order_by(
-            CumplimientoEECCEntry.fecha.desc(),
-            CumplimientoEECCEntry.id.desc()
-        ).all()
-
-        return render_template(
-            "list.html",
-            semana_sel=semana_sel, d_from=d_from, d_to=d_to, week_map=WEEK_MAP,
-            census=census, eventos=eventos, duplics=duplics,
-            encuestas=encuestas, atenciones=atenciones,
-            robos=robos, miscelaneo=miscelaneo, desviaciones=desviaciones,
-            solicitudes_ot=solicitudes_ot, reclamos=reclamos,
-            alarmas=alarmas, extensiones=extensiones, onboarding=onboarding,
-            apertura=apertura, cumplimiento=cumplimiento,
-            vista=vista,
-            current_tab=None
-        )
-    finally:
-        db.close()
+
+# --- Cache de fragmentos: la tabla de /registros ya renderizada, por worker ---
+FRAGMENT_CACHE_MAX = int(os.environ.get("FRAGMENT_CACHE_MAX", "200"))  # tablas guardadas; 0 = sin cache
+
+
+class FragmentCache:
+    """LRU en memoria de fragmentos HTML. La versión del módulo va en la clave: cuando los
+       datos cambian la clave vieja ya no se pide y termina saliendo por LRU."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def get_or_render(self, name, key, render):
+        key = (name,) + key
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+        METRICS.inc("app_fragment_cache_requests_total",
+                    {"fragment": name, "result": "miss" if value is None else "hit"})
+        if value is not None:
+            return value
+        value = render()  # fuera del lock: dos misses simultáneos renderizan los dos
+        if self.maxsize > 0:
+            with self.lock:
+                self.items[key] = value
+                self.items.move_to_end(key)
+                while len(self.items) > self.maxsize:
+                    self.items.popitem(last=False)
+                METRICS.set("app_fragment_cache_entries", {}, len(self.items))
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            METRICS.set("app_fragment_cache_entries", {}, 0)
+
+
+FRAGMENT_CACHE = FragmentCache(FRAGMENT_CACHE_MAX)
+
+
+def render_list_table(vista, d_from, d_to, page):
+    """(html, filas, hay_siguiente) de la tabla de la vista; solo lee la BD si no está en cache."""
+    def render():
+        data = {var: [] for var, _, _ in LIST_VIEWS.values()}
+        has_next = False
+        if vista in LIST_VIEWS:
+            var, names, order = LIST_VIEWS[vista]
+            rows = load_rows(vista, names, d_from, d_to, order,
+                             limit=LIST_PAGE_SIZE + 1, offset=(page - 1) * LIST_PAGE_SIZE)
+            has_next = len(rows) > LIST_PAGE_SIZE
+            data[var] = rows[:LIST_PAGE_SIZE]
+        # URLs armadas con los filtros ya resueltos, no con request: el fragmento solo
+        # depende de la clave y sirve para cualquier query string equivalente
+        args = {k: v for k, v in (("vista", vista), ("from", d_from and d_from.isoformat()),
+                                  ("to", d_to and d_to.isoformat())) if v}
+        html = render_template("_list_table.html", vista=vista, export_args=args,
+                               next_url=url_for("registros", **args, **({"page": page} if page > 1 else {})),
+                               **data)
+        return html, sum(len(v) for v in data.values()), has_next
+
+    if vista not in LIST_VIEWS:
+        return render()
+    row = module_versions([vista]).get(vista)
+    version = row.version if row else None
+    key = (vista, d_from, d_to, page, version)
+    return FRAGMENT_CACHE.get_or_render("registros", key, render)
 
 
 @app.get("/download/<string:entity>.csv")
 def download_entity(entity):
     d_from, d_to, semana_sel = resolve_filters(request.args)
+    if entity in ENTITY_MODEL:
+        cached = not_modified([entity])
+        if cached:
+            return cached
     if semana_sel: d_from, d_to = week_range(semana_sel)
-    db = SessionLocal()
-    try:
-        buf = io.StringIO()
-        w = None
+    d_from, d_to = clamp_range(d_from, d_to)
+    buf = io.StringIO()
+    w = None
+    truncated = False
+
+    def capped_rows(*args, **kwargs):
+        # tope de filas: miscelaneo, solicitud_ot y otros se exportan sin filtro de fechas
+        nonlocal truncated
+        if not DOWNLOAD_MAX_ROWS:
+            return load_rows(*args, **kwargs)
+        rows = load_rows(*args, limit=DOWNLOAD_MAX_ROWS + 1, **kwargs)
+        truncated = len(rows) > DOWNLOAD_MAX_ROWS
+        return rows[:DOWNLOAD_MAX_ROWS]
+
+    if entity == "censo":
+        rows = capped_rows("censo", EXPORT_COLUMNS["censo"], d_from, d_to, [CensusEntry.fecha])
+        w = csv.DictWriter(buf, fieldnames=["fecha", "censo_dia", "censo_noche", "total"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({"fecha": r.fecha.isoformat(), "censo_dia": r.censo_dia, "censo_noche": r.censo_noche, "total": r.total})
+
+    elif entity == "eventos":
+        rows = capped_rows("eventos", EXPORT_COLUMNS["eventos"], d_from, d_to, [EventSeguridad.fecha])
+        w = csv.DictWriter(buf, fieldnames=["fecha","horario","que_ocurrio","nombre_afectado","accion"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({"fecha": r.fecha.isoformat(), "horario": r.horario, "que_ocurrio": r.que_ocurrio,
+                        "nombre_afectado": r.nombre_afectado or "", "accion": r.accion or ""})
+
+    elif entity == "duplicidades":
+        rows = capped_rows("duplicidades", EXPORT_COLUMNS["duplicidades"], d_from, d_to, [DuplicidadEntry.fecha])
+        headers = ["semana","fecha","id","empresa_contratista","descripcion_problema","tipo_riesgo",
+                   "pabellon","habitacion","ingresar_contacto","nombre_usuario","responsable","estatus",
+                   "notificacion_usuario","plan_accion","fecha_cierre"]
+        w = csv.DictWriter(buf, fieldnames=headers)
+        w.writeheader()
+        for r in rows:
+            w.writerow({
+                "semana": r.semana, "fecha": r.fecha.isoformat(), "id": r.id_interno or "",
+                "empresa_contratista": r.empresa_contratista or "", "descripcion_problema": r.descripcion_problema or "",
+                "tipo_riesgo": r.tipo_riesgo or "", "pabellon": r.pabellon or "", "habitacion": r.habitacion or "",
+                "ingresar_contacto": r.ingresar_contacto or "", "nombre_usuario": r.nombre_usuario or "",
+                "responsable": r.responsable or "", "estatus": r.estatus or "",
+                "notificacion_usuario": r.notificacion_usuario or "", "plan_accion": r.plan_accion or "",
+                "fecha_cierre": r.fecha_cierre.isoformat() if r.fecha_cierre else ""
+            })
 
-        if entity == "censo":
-            q = db.query(CensusEntry)
-            if d_from: q = q.filter(CensusEntry.fecha >= d_from)
-            if d_to:   q = q.filter(CensusEntry.fecha <= d_to)
-            rows = q.order_by(CensusEntry.fecha).all()
-            w = csv.DictWriter(buf, fieldnames=["fecha", "censo_dia", "censo_noche", "total"])
-            w.writeheader()
-            for r in rows:
-                w.writerow({"fecha": r.fecha.isoformat(), "censo_dia": r.censo_dia, "censo_noche": r.censo_noche, "total": r.total})
-
-        elif entity == "eventos":
-            q = db.query(EventSeguridad)
-            if d_from: q = q.filter(EventSeguridad.fecha >= d_from)
-            if d_to:   q = q.filter(EventSeguridad.fecha <= d_to)
-            rows = q.order_by(EventSeguridad.fecha).all()
-            w = csv.DictWriter(buf, fieldnames=["fecha","horario","que_ocurrio","nombre_afectado","accion"])
-            w.writeheader()
-            for r in rows:
-                w.writerow({"fecha": r.fecha.isoformat(), "horario": r.horario, "que_ocurrio": r.que_ocurrio,
-                            "nombre_afectado": r.nombre_afectado or "", "accion": r.accion or ""})
-
-        elif entity == "duplicidades":
-            q = db.query(DuplicidadEntry)
-            if d_from: q = q.filter(DuplicidadEntry.fecha >= d_from)
-            if d_to:   q = q.filter(DuplicidadEntry.fecha <= d_to)
-            rows = q.order_by(DuplicidadEntry.fecha).all()
-            headers = ["semana","fecha","id","empresa_contratista","descripcion_problema","tipo_riesgo",
-                       "pabellon","habitacion","ingresar_contacto","nombre_usuario","responsable","estatus",
-                       "notificacion_usuario","plan_accion","fecha_cierre"]
-            w = csv.DictWriter(buf, fieldnames=headers)
-            w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "semana": r.semana, "fecha": r.fecha.isoformat(), "id": r.id_interno or "",
-                    "empresa_contratista": r.empresa_contratista or "", "descripcion_problema": r.descripcion_problema or "",
-                    "tipo_riesgo": r.tipo_riesgo or "", "pabellon": r.pabellon or "", "habitacion": r.habitacion or "",
-                    "ingresar_contacto": r.ingresar_contacto or "", "nombre_usuario": r.nombre_usuario or "",
-                    "responsable": r.responsable or "", "estatus": r.estatus or "",
-                    "notificacion_usuario": r.notificacion_usuario or "", "plan_accion": r.plan_accion or "",
-                    "fecha_cierre": r.fecha_cierre.isoformat() if r.fecha_cierre else ""
-                })
-
-        elif entity == "encuestas":
-            q = db.query(EncuestaEntry)
-            if d_from: q = q.filter(EncuestaEntry.fecha_hora >= datetime.combine(d_from, time.min))
-            if d_to:   q = q.filter(EncuestaEntry.fecha_hora <= datetime.combine(d_to, time.max))
-            rows = q.order_by(EncuestaEntry.fecha_hora).all()
-            headers = ["fecha_hora","q1_respuesta","q1_puntaje","q2_respuesta","q2_puntaje",
-                       "q3_respuesta","q3_puntaje","q4_respuesta","q4_puntaje","q5_respuesta","q5_puntaje",
-                       "total","promedio","comentarios"]
-            w = csv.DictWriter(buf, fieldnames=headers)
-            w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "fecha_hora": r.fecha_hora.isoformat(timespec="minutes"),
-                    "q1_respuesta": r.q1_respuesta or "", "q1_puntaje": r.q1_puntaje or "",
-                    "q2_respuesta": r.q2_respuesta or "", "q2_puntaje": r.q2_puntaje or "",
-                    "q3_respuesta": r.q3_respuesta or "", "q3_puntaje": r.q3_puntaje or "",
-                    "q4_respuesta": r.q4_respuesta or "", "q4_puntaje": r.q4_puntaje or "",
-                    "q5_respuesta": r.q5_respuesta or "", "q5_puntaje": r.q5_puntaje or "",
-                    "total": r.total if r.total is not None else "",
-                    "promedio": r.promedio if r.promedio is not None else "",
-                    "comentarios": r.comentarios or "",
-                })
+    elif entity == "encuestas":
+        rows = capped_rows("encuestas", EXPORT_COLUMNS["encuestas"], d_from, d_to, [EncuestaEntry.fecha_hora])
+        headers = ["fecha_hora","q1_respuesta","q1_puntaje","q2_respuesta","q2_puntaje",
+                   "q3_respuesta","q3_puntaje","q4_respuesta","q4_puntaje","q5_respuesta","q5_puntaje",
+                   "total","promedio","comentarios"]
+        w = csv.DictWriter(buf, fieldnames=headers)
+        w.writeheader()
+        for r in rows:
+            w.writerow({
+                "fecha_hora": r.fecha_hora.isoformat(timespec="minutes"),
+                "q1_respuesta": r.q1_respuesta or "", "q1_puntaje": r.q1_puntaje or "",
+                "q2_respuesta": r.q2_respuesta or "", "q2_puntaje": r.q2_puntaje or "",
+                "q3_respuesta": r.q3_respuesta or "", "q3_puntaje": r.q3_puntaje or "",
+                "q4_respuesta": r.q4_respuesta or "", "q4_puntaje": r.q4_puntaje or "",
+                "q5_respuesta": r.q5_respuesta or "", "q5_puntaje": r.q5_puntaje or "",
+                "total": r.total if r.total is not None else "",
+                "promedio": r.promedio if r.promedio is not None else "",
+                "comentarios": r.comentarios or "",
+            })
 
-        elif entity == "atencion":
-            q = db.query(AtencionEntry)
-            if d_from: q = q.filter(AtencionEntry.fecha >= d_from)
-            if d_to:   q = q.filter(AtencionEntry.fecha <= d_to)
-            rows = q.order_by(AtencionEntry.fecha).all()
-            w = csv.DictWriter(buf, fieldnames=["fecha","tiempo_promedio_mmss","cantidad"])
-            w.writeheader()
-            for r in rows:
-                w.writerow({"fecha": r.fecha.isoformat(), "tiempo_promedio_mmss": seconds_to_mmss(r.tiempo_promedio_sec),
-                            "cantidad": r.cantidad})
-
-        # ---------------- CSV de módulos previos ----------------
-        elif entity == "robos":
-            q = db.query(RoboHurtoEntry)
-            if d_from: q = q.filter(RoboHurtoEntry.fecha >= d_from)
-            if d_to:   q = q.filter(RoboHurtoEntry.fecha <= d_to)
-            rows = q.order_by(RoboHurtoEntry.fecha).all()
-            headers = ["fecha","hora","modulo","habitacion","empresa","nombre_cliente","rut",
-                       "medio_reclamo","especies","observaciones","recepciona"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "fecha": r.fecha.isoformat(),
-                    "hora": r.hora.strftime("%H:%M"),
-                    "modulo": r.modulo or "",
-                    "habitacion": r.habitacion or "",
-                    "empresa": r.empresa or "",
-                    "nombre_cliente": r.nombre_cliente or "",
-                    "rut": r.rut or "",
-                    "medio_reclamo": r.medio_reclamo or "",
-                    "especies": r.especies or "",
-                    "observaciones": r.observaciones or "",
-                    "recepciona": r.recepciona or "",
-                })
-
-        elif entity == "miscelaneo":
-            rows = db.query(MiscelaneoEntry).order_by(MiscelaneoEntry.id).all()
-            headers = ["ot","division","area","lugar","ubicacion","disciplina","especialidad","falla",
-                       "empresa","fecha_creacion","fecha_inicio","fecha_termino","fecha_aprobacion","estado","comentario"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "ot": r.ot or "", "division": r.division or "", "area": r.area or "",
-                    "lugar": r.lugar or "", "ubicacion": r.ubicacion or "", "disciplina": r.disciplina or "",
-                    "especialidad": r.especialidad or "", "falla": r.falla or "", "empresa": r.empresa or "",
-                    "fecha_creacion": r.fecha_creacion.isoformat() if r.fecha_creacion else "",
-                    "fecha_inicio": r.fecha_inicio.isoformat() if r.fecha_inicio else "",
-                    "fecha_termino": r.fecha_termino.isoformat() if r.fecha_termino else "",
-                    "fecha_aprobacion": r.fecha_aprobacion.isoformat() if r.fecha_aprobacion else "",
-                    "estado": r.estado or "", "comentario": r.comentario or "",
-                })
-
-        elif entity == "desviaciones":
-            q = db.query(DesviacionEntry)
-            if d_from: q = q.filter(DesviacionEntry.fecha >= d_from)
-            if d_to:   q = q.filter(DesviacionEntry.fecha <= d_to)
-            rows = q.order_by(DesviacionEntry.fecha).all()
-            headers = ["n_solicitud","fecha","id","empresa_contratista","descripcion_problema","tipo_riesgo",
-                       "tipo_solicitud","pabellon","habitacion","via_solicitud","quien_informa","riesgo_material","correo_destino"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "n_solicitud": r.n_solicitud or "", "fecha": r.fecha.isoformat(),
-                    "id": r.id_interno or "", "empresa_contratista": r.empresa_contratista or "",
-                    "descripcion_problema": r.descripcion_problema or "", "tipo_riesgo": r.tipo_riesgo or "",
-                    "tipo_solicitud": r.tipo_solicitud or "", "pabellon": r.pabellon or "",
-                    "habitacion": r.habitacion or "", "via_solicitud": r.via_solicitud or "",
-                    "quien_informa": r.quien_informa or "", "riesgo_material": r.riesgo_material or "",
-                    "correo_destino": r.correo_destino or "",
-                })
-
-        elif entity == "solicitud_ot":
-            rows = db.query(SolicitudOTEntry).order_by(SolicitudOTEntry.id).all()
-            headers = ["n_solicitud","descripcion_problema","tipo_solicitud","modulo","habitacion","tipo_turno",
-                       "jornada","via_solicitud","correo_usuario","tipo_tarea","ot","fecha_inicio","estado",
-                       "tiempo_respuesta_mmss","satisfaccion_reclamo","motivo","observacion"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "n_solicitud": r.n_solicitud or "", "descripcion_problema": r.descripcion_problema or "",
-                    "tipo_solicitud": r.tipo_solicitud or "", "modulo": r.modulo or "",
-                    "habitacion": r.habitacion or "", "tipo_turno": r.tipo_turno or "",
-                    "jornada": r.jornada or "", "via_solicitud": r.via_solicitud or "",
-                    "correo_usuario": r.correo_usuario or "", "tipo_tarea": r.tipo_tarea or "",
-                    "ot": r.ot or "", "fecha_inicio": r.fecha_inicio.isoformat() if r.fecha_inicio else "",
-                    "estado": r.estado or "",
-                    "tiempo_respuesta_mmss": seconds_to_mmss(r.tiempo_respuesta_sec or 0),
-                    "satisfaccion_reclamo": r.satisfaccion_reclamo or "", "motivo": r.motivo or "",
-                    "observacion": r.observacion or "",
-                })
-
-        elif entity == "reclamos":
-            q = db.query(ReclamoUsuarioEntry)
-            if d_from: q = q.filter(ReclamoUsuarioEntry.fecha >= d_from)
-            if d_to:   q = q.filter(ReclamoUsuarioEntry.fecha <= d_to)
-            rows = q.order_by(ReclamoUsuarioEntry.fecha).all()
-            headers = ["n_solicitud","fecha","id","empresa_contratista","descripcion_problema","tipo_solicitud",
-                       "pabellon","habitacion","via_solicitud","ingresar_contacto","nombre_usuario","responsable",
-                       "estatus","notificacion_usuario","plan_accion"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "n_solicitud": r.n_solicitud or "", "fecha": r.fecha.isoformat(),
-                    "id": r.id_interno or "", "empresa_contratista": r.empresa_contratista or "",
-                    "descripcion_problema": r.descripcion_problema or "", "tipo_solicitud": r.tipo_solicitud or "",
-                    "pabellon": r.pabellon or "", "habitacion": r.habitacion or "",
-                    "via_solicitud": r.via_solicitud or "", "ingresar_contacto": r.ingresar_contacto or "",
-                    "nombre_usuario": r.nombre_usuario or "", "responsable": r.responsable or "",
-                    "estatus": r.estatus or "", "notificacion_usuario": r.notificacion_usuario or "",
-                    "plan_accion": r.plan_accion or "",
-                })
-
-        # --------- CSV NUEVOS 5 ----------
-        elif entity == "alarmas":
-            q = db.query(ActivacionAlarmaEntry)
-            if d_from: q = q.filter(ActivacionAlarmaEntry.fecha >= d_from)
-            if d_to:   q = q.filter(ActivacionAlarmaEntry.fecha <= d_to)
-            rows = q.order_by(ActivacionAlarmaEntry.fecha).all()
-            headers = ["MODULO","N_HABITACION","NOMBRE_RECEPCIONISTA","FECHA","EMPRESA","ID","CO",
-                       "AVISO_MANTENCION_H","LLEGADA_MANTENCION_H","AVISO_LIDER_H","LLEGADA_LIDER_H",
-                       "HORA_REPORTE_SALFA","TIPO_EVENTO","TIPO_ACTIVIDAD","FECHA_REPORTE",
-                       "TURNO_RECEPCION_INGRESOS","OBSERVACIONES"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "MODULO": r.modulo or "", "N_HABITACION": r.n_habitacion or "",
-                    "NOMBRE_RECEPCIONISTA": r.nombre_recepcionista or "",
-                    "FECHA": r.fecha.isoformat(), "EMPRESA": r.empresa or "",
-                    "ID": r.id_interno or "", "CO": r.co or "",
-                    "AVISO_MANTENCION_H": r.aviso_mantencion_h if r.aviso_mantencion_h is not None else "",
-                    "LLEGADA_MANTENCION_H": r.llegada_mantencion_h if r.llegada_mantencion_h is not None else "",
-                    "AVISO_LIDER_H": r.aviso_lider_h if r.aviso_lider_h is not None else "",
-                    "LLEGADA_LIDER_H": r.llegada_lider_h if r.llegada_lider_h is not None else "",
-                    "HORA_REPORTE_SALFA": r.hora_reporte_salfa.strftime("%H:%M") if r.hora_reporte_salfa else "",
-                    "TIPO_EVENTO": r.tipo_evento or "", "TIPO_ACTIVIDAD": r.tipo_actividad or "",
-                    "FECHA_REPORTE": r.fecha_reporte.isoformat() if r.fecha_reporte else "",
-                    "TURNO_RECEPCION_INGRESOS": r.turno_recepcion_ingresos or "",
-                    "OBSERVACIONES": r.observaciones or "",
-                })
-
-        elif entity == "extensiones":
-            q = db.query(ExtensionExcepcionEntry)
-            if d_from: q = q.filter(ExtensionExcepcionEntry.fecha_solicitud >= d_from)
-            if d_to:   q = q.filter(ExtensionExcepcionEntry.fecha_solicitud <= d_to)
-            rows = q.order_by(ExtensionExcepcionEntry.fecha_solicitud).all()
-            headers = ["FECHA_SOLICITUD","ID","EMPRESA","CO","GERENCIA","PROYECTO","CANT_CLIENTES",
-                       "DESDE","HASTA","APROBADOR","OBSERVACION"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "FECHA_SOLICITUD": r.fecha_solicitud.isoformat(), "ID": r.id_interno or "",
-                    "EMPRESA": r.empresa or "", "CO": r.co or "", "GERENCIA": r.gerencia or "",
-                    "PROYECTO": r.proyecto or "", "CANT_CLIENTES": r.cant_clientes if r.cant_clientes is not None else "",
-                    "DESDE": r.desde.isoformat() if r.desde else "",
-                    "HASTA": r.hasta.isoformat() if r.hasta else "",
-                    "APROBADOR": r.aprobador or "", "OBSERVACION": r.observacion or "",
-                })
-
-        elif entity == "onboarding":
-            q = db.query(OnboardingEntry)
-            if d_from: q = q.filter(OnboardingEntry.fecha_hora >= datetime.combine(d_from, time.min))
-            if d_to:   q = q.filter(OnboardingEntry.fecha_hora <= datetime.combine(d_to, time.max))
-            rows = q.order_by(OnboardingEntry.fecha_hora).all()
-            headers = ["FECHA_HORA","NOMBRE","RUT","EMPRESA","ID","ARCHIVO_PDF"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "FECHA_HORA": r.fecha_hora.isoformat(timespec="minutes"),
-                    "NOMBRE": r.nombre or "", "RUT": r.rut or "", "EMPRESA": r.empresa or "",
-                    "ID": r.id_interno or "", "ARCHIVO_PDF": r.archivo_pdf or "",
-                })
-
-        elif entity == "apertura":
-            q = db.query(AperturaHabitacionEntry)
-            if d_from: q = q.filter(AperturaHabitacionEntry.fecha >= d_from)
-            if d_to:   q = q.filter(AperturaHabitacionEntry.fecha <= d_to)
-            rows = q.order_by(AperturaHabitacionEntry.fecha).all()
-            headers = ["FECHA","HABITACION","HORA","RESPONSABLE","ESTADO_CHAPA"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "FECHA": r.fecha.isoformat(),
-                    "HABITACION": r.habitacion or "",
-                    "HORA": r.hora.strftime("%H:%M") if r.hora else "",
-                    "RESPONSABLE": r.responsable or "",
-                    "ESTADO_CHAPA": r.estado_chapa or "",
-                })
-
-        elif entity == "cumplimiento":
-            rows = db.query(CumplimientoEECCEntry).order_by(CumplimientoEECCEntry.fecha, CumplimientoEECCEntry.id).all()
-            headers = ["FECHA","EMPRESA","N_CONTRATO","CO","CORREO_ELECTRONICO","ID","TURNO"]
-            w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
-            for r in rows:
-                w.writerow({
-                    "FECHA": r.fecha.isoformat() if r.fecha else "",
-                    "EMPRESA": r.empresa or "",
-                    "N_CONTRATO": r.n_contrato or "",
-                    "CO": r.co or "",
-                    "CORREO_ELECTRONICO": r.correo_electronico or "",
-                    "ID": r.id_interno or "",
-                    "TURNO": r.turno or "",
-                })
+    elif entity == "atencion":
+        rows = capped_rows("atencion", EXPORT_COLUMNS["atencion"], d_from, d_to, [AtencionEntry.fecha])
+        w = csv.DictWriter(buf, fieldnames=["fecha","tiempo_promedio_mmss","cantidad"])
+        w.writeheader()
+        for r in rows:
+            w.writerow({"fecha": r.fecha.isoformat(), "tiempo_promedio_mmss": seconds_to_mmss(r.tiempo_promedio_sec),
+                        "cantidad": r.cantidad})
+
+    # ---------------- CSV de módulos previos ----------------
+    elif entity == "robos":
+        rows = capped_rows("robos", EXPORT_COLUMNS["robos"], d_from, d_to, [RoboHurtoEntry.fecha])
+        headers = ["fecha","hora","modulo","habitacion","empresa","nombre_cliente","rut",
+                   "medio_reclamo","especies","observaciones","recepciona"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "fecha": r.fecha.isoformat(),
+                "hora": r.hora.strftime("%H:%M"),
+                "modulo": r.modulo or "",
+                "habitacion": r.habitacion or "",
+                "empresa": r.empresa or "",
+                "nombre_cliente": r.nombre_cliente or "",
+                "rut": r.rut or "",
+                "medio_reclamo": r.medio_reclamo or "",
+                "especies": r.especies or "",
+                "observaciones": r.observaciones or "",
+                "recepciona": r.recepciona or "",
+            })
 
-        else:
-            flash("Entidad no válida.")
-            return redirect(url_for("registros"))
-
-        return send_file(
-            io.BytesIO(buf.getvalue().encode("utf-8-sig")),
-            mimetype="text/csv",
-            as_attachment=True,
-            download_name=f"{entity}.csv"
-        )
-    finally:
-        db.close()
+    elif entity == "miscelaneo":
+        rows = capped_rows("miscelaneo", EXPORT_COLUMNS["miscelaneo"], order_by=[MiscelaneoEntry.id])
+        headers = ["ot","division","area","lugar","ubicacion","disciplina","especialidad","falla",
+                   "empresa","fecha_creacion","fecha_inicio","fecha_termino","fecha_aprobacion","estado","comentario"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "ot": r.ot or "", "division": r.division or "", "area": r.area or "",
+                "lugar": r.lugar or "", "ubicacion": r.ubicacion or "", "disciplina": r.disciplina or "",
+                "especialidad": r.especialidad or "", "falla": r.falla or "", "empresa": r.empresa or "",
+                "fecha_creacion": r.fecha_creacion.isoformat() if r.fecha_creacion else "",
+                "fecha_inicio": r.fecha_inicio.isoformat() if r.fecha_inicio else "",
+                "fecha_termino": r.fecha_termino.isoformat() if r.fecha_termino else "",
+                "fecha_aprobacion": r.fecha_aprobacion.isoformat() if r.fecha_aprobacion else "",
+                "estado": r.estado or "", "comentario": r.comentario or "",
+            })
+
+    elif entity == "desviaciones":
+        rows = capped_rows("desviaciones", EXPORT_COLUMNS["desviaciones"], d_from, d_to, [DesviacionEntry.fecha])
+        headers = ["n_solicitud","fecha","id","empresa_contratista","descripcion_problema","tipo_riesgo",
+                   "tipo_solicitud","pabellon","habitacion","via_solicitud","quien_informa","riesgo_material","correo_destino"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "n_solicitud": r.n_solicitud or "", "fecha": r.fecha.isoformat(),
+                "id": r.id_interno or "", "empresa_contratista": r.empresa_contratista or "",
+                "descripcion_problema": r.descripcion_problema or "", "tipo_riesgo": r.tipo_riesgo or "",
+                "tipo_solicitud": r.tipo_solicitud or "", "pabellon": r.pabellon or "",
+                "habitacion": r.habitacion or "", "via_solicitud": r.via_solicitud or "",
+                "quien_informa": r.quien_informa or "", "riesgo_material": r.riesgo_material or "",
+                "correo_destino": r.correo_destino or "",
+            })
+
+    elif entity == "solicitud_ot":
+        rows = capped_rows("solicitud_ot", EXPORT_COLUMNS["solicitud_ot"], order_by=[SolicitudOTEntry.id])
+        headers = ["n_solicitud","descripcion_problema","tipo_solicitud","modulo","habitacion","tipo_turno",
+                   "jornada","via_solicitud","correo_usuario","tipo_tarea","ot","fecha_inicio","estado",
+                   "tiempo_respuesta_mmss","satisfaccion_reclamo","motivo","observacion"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "n_solicitud": r.n_solicitud or "", "descripcion_problema": r.descripcion_problema or "",
+                "tipo_solicitud": r.tipo_solicitud or "", "modulo": r.modulo or "",
+                "habitacion": r.habitacion or "", "tipo_turno": r.tipo_turno or "",
+                "jornada": r.jornada or "", "via_solicitud": r.via_solicitud or "",
+                "correo_usuario": r.correo_usuario or "", "tipo_tarea": r.tipo_tarea or "",
+                "ot": r.ot or "", "fecha_inicio": r.fecha_inicio.isoformat() if r.fecha_inicio else "",
+                "estado": r.estado or "",
+                "tiempo_respuesta_mmss": seconds_to_mmss(r.tiempo_respuesta_sec or 0),
+                "satisfaccion_reclamo": r.satisfaccion_reclamo or "", "motivo": r.motivo or "",
+                "observacion": r.observacion or "",
+            })
+
+    elif entity == "reclamos":
+        rows = capped_rows("reclamos", EXPORT_COLUMNS["reclamos"], d_from, d_to, [ReclamoUsuarioEntry.fecha])
+        headers = ["n_solicitud","fecha","id","empresa_contratista","descripcion_problema","tipo_solicitud",
+                   "pabellon","habitacion","via_solicitud","ingresar_contacto","nombre_usuario","responsable",
+                   "estatus","notificacion_usuario","plan_accion"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "n_solicitud": r.n_solicitud or "", "fecha": r.fecha.isoformat(),
+                "id": r.id_interno or "", "empresa_contratista": r.empresa_contratista or "",
+                "descripcion_problema": r.descripcion_problema or "", "tipo_solicitud": r.tipo_solicitud or "",
+                "pabellon": r.pabellon or "", "habitacion": r.habitacion or "",
+                "via_solicitud": r.via_solicitud or "", "ingresar_contacto": r.ingresar_contacto or "",
+                "nombre_usuario": r.nombre_usuario or "", "responsable": r.responsable or "",
+                "estatus": r.estatus or "", "notificacion_usuario": r.notificacion_usuario or "",
+                "plan_accion": r.plan_accion or "",
+            })
+
+    # --------- CSV NUEVOS 5 ----------
+    elif entity == "alarmas":
+        rows = capped_rows("alarmas", EXPORT_COLUMNS["alarmas"], d_from, d_to, [ActivacionAlarmaEntry.fecha])
+        headers = ["MODULO","N_HABITACION","NOMBRE_RECEPCIONISTA","FECHA","EMPRESA","ID","CO",
+                   "AVISO_MANTENCION_H","LLEGADA_MANTENCION_H","AVISO_LIDER_H","LLEGADA_LIDER_H",
+                   "HORA_REPORTE_SALFA","TIPO_EVENTO","TIPO_ACTIVIDAD","FECHA_REPORTE",
+                   "TURNO_RECEPCION_INGRESOS","OBSERVACIONES"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "MODULO": r.modulo or "", "N_HABITACION": r.n_habitacion or "",
+                "NOMBRE_RECEPCIONISTA": r.nombre_recepcionista or "",
+                "FECHA": r.fecha.isoformat(), "EMPRESA": r.empresa or "",
+                "ID": r.id_interno or "", "CO": r.co or "",
+                "AVISO_MANTENCION_H": r.aviso_mantencion_h if r.aviso_mantencion_h is not None else "",
+                "LLEGADA_MANTENCION_H": r.llegada_mantencion_h if r.llegada_mantencion_h is not None else "",
+                "AVISO_LIDER_H": r.aviso_lider_h if r.aviso_lider_h is not None else "",
+                "LLEGADA_LIDER_H": r.llegada_lider_h if r.llegada_lider_h is not None else "",
+                "HORA_REPORTE_SALFA": r.hora_reporte_salfa.strftime("%H:%M") if r.hora_reporte_salfa else "",
+                "TIPO_EVENTO": r.tipo_evento or "", "TIPO_ACTIVIDAD": r.tipo_actividad or "",
+                "FECHA_REPORTE": r.fecha_reporte.isoformat() if r.fecha_reporte else "",
+                "TURNO_RECEPCION_INGRESOS": r.turno_recepcion_ingresos or "",
+                "OBSERVACIONES": r.observaciones or "",
+            })
+
+    elif entity == "extensiones":
+        rows = capped_rows("extensiones", EXPORT_COLUMNS["extensiones"], d_from, d_to, [ExtensionExcepcionEntry.fecha_solicitud])
+        headers = ["FECHA_SOLICITUD","ID","EMPRESA","CO","GERENCIA","PROYECTO","CANT_CLIENTES",
+                   "DESDE","HASTA","APROBADOR","OBSERVACION"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "FECHA_SOLICITUD": r.fecha_solicitud.isoformat(), "ID": r.id_interno or "",
+                "EMPRESA": r.empresa or "", "CO": r.co or "", "GERENCIA": r.gerencia or "",
+                "PROYECTO": r.proyecto or "", "CANT_CLIENTES": r.cant_clientes if r.cant_clientes is not None else "",
+                "DESDE": r.desde.isoformat() if r.desde else "",
+                "HASTA": r.hasta.isoformat() if r.hasta else "",
+                "APROBADOR": r.aprobador or "", "OBSERVACION": r.observacion or "",
+            })
+
+    elif entity == "onboarding":
+        rows = capped_rows("onboarding", EXPORT_COLUMNS["onboarding"], d_from, d_to, [OnboardingEntry.fecha_hora])
+        headers = ["FECHA_HORA","NOMBRE","RUT","EMPRESA","ID","ARCHIVO_PDF"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "FECHA_HORA": r.fecha_hora.isoformat(timespec="minutes"),
+                "NOMBRE": r.nombre or "", "RUT": r.rut or "", "EMPRESA": r.empresa or "",
+                "ID": r.id_interno or "", "ARCHIVO_PDF": r.archivo_pdf or "",
+            })
+
+    elif entity == "apertura":
+        rows = capped_rows("apertura", EXPORT_COLUMNS["apertura"], d_from, d_to, [AperturaHabitacionEntry.fecha])
+        headers = ["FECHA","HABITACION","HORA","RESPONSABLE","ESTADO_CHAPA"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "FECHA": r.fecha.isoformat(),
+                "HABITACION": r.habitacion or "",
+                "HORA": r.hora.strftime("%H:%M") if r.hora else "",
+                "RESPONSABLE": r.responsable or "",
+                "ESTADO_CHAPA": r.estado_chapa or "",
+            })
+
+    elif entity == "cumplimiento":
+        rows = capped_rows("cumplimiento", EXPORT_COLUMNS["cumplimiento"], order_by=[CumplimientoEECCEntry.fecha, CumplimientoEECCEntry.id])
+        headers = ["FECHA","EMPRESA","N_CONTRATO","CO","CORREO_ELECTRONICO","ID","TURNO"]
+        w = csv.DictWriter(buf, fieldnames=headers); w.writeheader()
+        for r in rows:
+            w.writerow({
+                "FECHA": r.fecha.isoformat() if r.fecha else "",
+                "EMPRESA": r.empresa or "",
+                "N_CONTRATO": r.n_contrato or "",
+                "CO": r.co or "",
+                "CORREO_ELECTRONICO": r.correo_electronico or "",
+                "ID": r.id_interno or "",
+                "TURNO": r.turno or "",
+            })
+
+    else:
+        flash("Entidad no válida.")
+        return redirect(url_for("registros"))
+
+    if truncated:
+        flash(f"La descarga de {entity} se cortó en {DOWNLOAD_MAX_ROWS} filas. Acote el rango de fechas o elija una semana.")
+    response = send_file(
+        io.BytesIO(buf.getvalue().encode("utf-8-sig")),
+        mimetype="text/csv",
+        as_attachment=True,
+        download_name=f"{entity}.csv"
+    )
+    if truncated:
+        response.headers["X-Export-Truncated"] = str(DOWNLOAD_MAX_ROWS)
+    return response
         
-# --- Mapa entidad → Modelo para eliminar ---
-ENTITY_MODEL = {
-    "censo": CensusEntry,
-    "eventos": EventSeguridad,
-    "duplicidades": DuplicidadEntry,
-    "encuestas": EncuestaEntry,
-    "atencion": AtencionEntry,
-    "robos": RoboHurtoEntry,
-    "miscelaneo": MiscelaneoEntry,
-    "desviaciones": DesviacionEntry,
-    "solicitud_ot": SolicitudOTEntry,
-    "reclamos": ReclamoUsuarioEntry,
-    # nuevos
-    "alarmas": ActivacionAlarmaEntry,
-    "extensiones": ExtensionExcepcionEntry,
-    "onboarding": OnboardingEntry,
-    "apertura": AperturaHabitacionEntry,
-    "cumplimiento": CumplimientoEECCEntry,
-}
+# Borrado lógico por defecto (SOFT_DELETE=1): marca deleted_at en vez de borrar la fila
+SOFT_DELETE = os.environ.get("SOFT_DELETE", "0") == "1"
+BULK_DELETE_MAX_IDS = 10000
+
+
+def delete_rows(db, Model, criteria, soft):
+    """Un solo DELETE (o UPDATE deleted_at) por conjunto; devuelve las filas afectadas.
+       RETURNING trae el día de cada fila para el aviso en vivo (/events)."""
+    if soft:
+        stmt = update(Model).where(Model.deleted_at.is_(None), *criteria).values(deleted_at=datetime.utcnow())
+    else:
+        stmt = delete(Model).where(*criteria)
+    entity = TABLE_ENTITY[Model.__tablename__]
+    stmt = stmt.returning(ENTITY_DATE_COLUMN[entity], Model.creado)
+    rows = db.execute(stmt.execution_options(synchronize_session=False)).all()
+    record_changes(db, entity, [dashboard_day(f, c) for f, c in rows], -1)
+    return len(rows)
+
 
 @app.post("/delete/<string:entity>/<int:rid>")
 def delete_record(entity, rid):
@@ -1376,24 +2805,72 @@ def delete_record(entity, rid):
         flash("Entidad inválida.")
         return redirect(url_for("registros"))
 
-    db = SessionLocal()
+    db = get_db()
     try:
-        obj = db.get(Model, rid)
-        if not obj:
+        if not delete_rows(db, Model, [Model.id == rid], SOFT_DELETE):
             flash("Registro no encontrado.")
         else:
-            db.delete(obj)
             db.commit()
             flash("Registro eliminado.")
     except Exception as e:
         db.rollback()
         flash(f"No se pudo eliminar: {e}")
-    finally:
-        db.close()
 
     nxt = request.form.get("next")
     return redirect(nxt or url_for("registros"))
 
+
+@app.post("/delete/<string:entity>")
+def delete_bulk(entity):
+    """Eliminación masiva por rango de fechas (from/to o semana) y/o lista de ids.
+       Acepta formulario (redirige con flash) o JSON (responde JSON). modo=soft|hard;
+       por defecto el de SOFT_DELETE."""
+    as_json = request.is_json
+    def done(msg, status=200, **extra):
+        if as_json:
+            return json_response({"entity": entity, "message": msg, **extra}, status)
+        flash(msg)
+        return redirect(request.form.get("next") or url_for("registros", vista=entity))
+
+    Model = ENTITY_MODEL.get(entity)
+    if not Model:
+        return done("Entidad inválida.", 404)
+
+    if as_json:
+        body = request.get_json(silent=True) or {}
+        ids = body.get("ids") or []
+        params = MultiDict({k: str(body[k]) for k in ("from", "to", "semana") if body.get(k)})
+        modo = body.get("modo")
+    else:
+        ids = [x for x in re.split(r"[,\s]+", request.form.get("ids", "")) if x]
+        params = request.form
+        modo = request.form.get("modo")
+
+    try:
+        ids = [int(x) for x in ids]
+        d_from, d_to, _ = resolve_filters(params)
+    except (ValueError, TypeError) as e:
+        return done(f"Parámetros inválidos: {e}", 400)
+    if len(ids) > BULK_DELETE_MAX_IDS:
+        return done(f"Máximo {BULK_DELETE_MAX_IDS} ids por solicitud.", 413)
+    if not ids and not d_from and not d_to:
+        return done("Indique un rango de fechas o una lista de ids.", 400)
+
+    criteria = date_criteria(ENTITY_DATE_COLUMN[entity], d_from, d_to)
+    if ids:
+        criteria.append(Model.id.in_(ids))
+    soft = SOFT_DELETE if modo not in ("soft", "hard") else modo == "soft"
+
+    db = get_db()
+    try:
+        n = delete_rows(db, Model, criteria, soft)
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        return done(f"No se pudo eliminar: {e}", 500)
+    return done(f"{n} registro(s) eliminado(s).", deleted=n, modo="soft" if soft else "hard")
+
+
 # -----------------------------------------------------------------------------
 # PLANTILLAS EXCEL + IMPORTACIÓN POR MÓDULO
 # -----------------------------------------------------------------------------
@@ -1545,7 +3022,7 @@ def import_xlsx(entity):
             return redirect(url_for("panel", tab=entity if entity != "eventos" else "eventos"))
 
         inserted = 0
-        db = SessionLocal()
+        db = get_db()
         try:
             def to_int(v, default=0):
                 try:
@@ -1806,8 +3283,6 @@ def import_xlsx(entity):
         except Exception as e:
             db.rollback()
             flash(f"Error importando {entity}: {e}")
-        finally:
-            db.close()
 
     except Exception as e:
         flash(f"No se pudo leer el Excel: {e}")
@@ -1819,226 +3294,652 @@ def import_xlsx(entity):
 # -----------------------------------------------------------------------------
 # DASHBOARD (actualizado para mostrar estadísticas de todos los módulos)
 # -----------------------------------------------------------------------------
+# Serie del dashboard en la que suma cada entidad (el resto usa el nombre de la entidad)
+DASHBOARD_SERIES = {"atencion": "atencion_cant", "solicitud_ot": "solicitudes_ot"}
+DASHBOARD_POLL_S = int(os.environ.get("DASHBOARD_POLL_S", "60"))  # refresco de la página; 0 = nunca
+# Puntos por serie: sobre esto se agrupa por semana y, si no alcanza, por mes
+DASHBOARD_MAX_POINTS = int(os.environ.get("DASHBOARD_MAX_POINTS", "120"))
+DASHBOARD_BUCKETS = ("day", "week", "month")
+# Margen al leer ?since=: una fila con creado un poco anterior puede confirmarse después de la lectura
+DASHBOARD_SINCE_MARGIN_S = int(os.environ.get("DASHBOARD_SINCE_MARGIN_S", "120"))
+
+
+def dashboard_day(fecha, creado):
+    """Día (ISO) en que cuenta la fila: su fecha de negocio; si viene nula, la de creación."""
+    fecha = fecha or creado
+    return (fecha.date() if isinstance(fecha, datetime) else fecha).isoformat()
+
+
+def dashboard_bucket(db, d_from, d_to):
+    """day / week / month según el largo del rango, para no pasar de DASHBOARD_MAX_POINTS
+       puntos por serie. Sin rango se mira el rango de fechas con datos."""
+    if not (d_from and d_to):
+        # sin tipo: el UNION mezcla columnas date y datetime (en SQLite, texto)
+        bounds = [select(type_coerce(func.min(col), String), type_coerce(func.max(col), String))
+                  .where(ENTITY_MODEL[e].deleted_at.is_(None)) for e, col in ENTITY_DATE_COLUMN.items()]
+        lo, hi = [], []
+        for mn, mx in db.execute(union_all(*bounds)).all():
+            if mn is not None:
+                lo.append(to_date(mn)); hi.append(to_date(mx))
+        if not lo:
+            return "day"
+        d_from, d_to = d_from or min(lo), d_to or max(hi)
+    span = (d_to - d_from).days + 1
+    if span <= DASHBOARD_MAX_POINTS:
+        return "day"
+    return "week" if span <= DASHBOARD_MAX_POINTS * 7 else "month"
+
+
+def to_date(v):
+    """date a partir de lo que devuelve el driver (date, datetime o texto ISO en SQLite)."""
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, str):
+        return date.fromisoformat(v[:10])
+    return v
+
+
+def bucket_start(day, bucket):
+    """Inicio del bucket (date) que contiene day; las semanas parten el lunes, como las de
+       week_of() (WEEK_ANCHOR es lunes)."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_end(start, bucket):
+    if bucket == "week":
+        return start + timedelta(days=6)
+    if bucket == "month":
+        return (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start
+
+
+def bucket_expr(dialect, bucket, value):
+    """Expresión SQL con el día de inicio del bucket de value (date_trunc en Postgres)."""
+    if dialect == "postgresql":
+        return cast(func.date_trunc(bucket, value), Date)
+    modifiers = {"day": (), "week": ("weekday 0", "-6 days"), "month": ("start of month",)}[bucket]
+    return func.date(value, *modifiers)
+
+
+def compute_dashboard(db, d_from, d_to, bucket="day", keys=None):
+    """Acumuladores por bucket (día, semana o mes; clave = día ISO de inicio) de todos los
+       módulos en [d_from, d_to], agregados en SQL: una fila por bucket y módulo. Con keys
+       (conjunto de claves) solo se leen y devuelven esos buckets: es el refresco incremental."""
+    if keys:
+        lo = date.fromisoformat(min(keys))
+        hi = bucket_end(date.fromisoformat(max(keys)), bucket)
+        d_from = max(d_from, lo) if d_from else lo
+        d_to = min(d_to, hi) if d_to else hi
+    dialect = db.get_bind().dialect.name
+    per_day = {}
+    def acc(dkey):
+        return per_day.setdefault(dkey, {
+            "censo": 0,
+            "eventos": 0,
+            "duplicidades": 0,
+            "encuestas": 0,
+            "atencion_cant": 0,
+            "atencion_prom_s": None,
+            "robos": 0,
+            "miscelaneo": 0,
+            "desviaciones": 0,
+            "solicitudes_ot": 0,
+            "reclamos": 0,
+            "alarmas": 0,
+            "extensiones": 0,
+            "onboarding": 0,
+            "apertura": 0,
+            "cumplimiento": 0
+        })
+
+    for entity, Model in ENTITY_MODEL.items():
+        col = ENTITY_DATE_COLUMN[entity]
+        key = bucket_expr(dialect, bucket, func.coalesce(col, Model.creado)).label("k")
+        if entity == "censo":
+            aggs = [func.sum(func.coalesce(func.nullif(CensusEntry.total, 0),
+                                           CensusEntry.censo_dia + CensusEntry.censo_noche))]
+        elif entity == "atencion":
+            aggs = [func.sum(AtencionEntry.cantidad), func.avg(AtencionEntry.tiempo_promedio_sec)]
+        else:
+            aggs = [func.count()]
+        q = filter_dates(vigentes(db, Model).with_entities(key, *aggs), col, d_from, d_to).group_by(key)
+        serie = DASHBOARD_SERIES.get(entity, entity)
+        for r in q.all():
+            dkey = to_date(r[0]).isoformat()
+            if keys is not None and dkey not in keys:
+                continue
+            b = acc(dkey)
+            b[serie] += int(r[1] or 0)
+            if entity == "atencion" and r[2] is not None:
+                b["atencion_prom_s"] = int(r[2])
+    return per_day
+
+
+def changed_days(db, since, d_from, d_to):
+    """Días con filas creadas o dadas de baja (borrado lógico) desde since, en los módulos
+       cuya versión cambió desde entonces. None si alguno tuvo un DELETE físico: esas
+       filas ya no están y no se sabe qué días tocaban."""
+    days = set()
+    for entity, row in module_versions(ENTITY_MODEL).items():
+        if row.actualizado < since:
+            continue
+        if row.ultimo_borrado is not None and row.ultimo_borrado >= since:
+            return None
+        Model, col = ENTITY_MODEL[entity], ENTITY_DATE_COLUMN[entity]
+        q = db.query(col, Model.creado).filter(or_(Model.creado >= since, Model.deleted_at >= since))
+        days.update(dashboard_day(f, c) for f, c in filter_dates(q, col, d_from, d_to).all())
+    return days
+
+
+def dashboard_payload(per_day, bucket="day"):
+    """labels / series / cards para el template y para /api/dashboard; cada label es el
+       día en que empieza su bucket."""
+    ordered_days = sorted(per_day.keys())
+    series_data = {
+        "censo": [],
+        "eventos": [],
+        "duplicidades": [],
+        "encuestas": [],
+        "atencion_cant": [],
+        "atencion_min": [],
+        "robos": [],
+        "miscelaneo": [],
+        "desviaciones": [],
+        "solicitudes_ot": [],
+        "reclamos": [],
+        "alarmas": [],
+        "extensiones": [],
+        "onboarding": [],
+        "apertura": [],
+        "cumplimiento": []
+    }
+
+    for k in ordered_days:
+        g = per_day[k]
+        series_data["censo"].append(g["censo"])
+        series_data["eventos"].append(g["eventos"])
+        series_data["duplicidades"].append(g["duplicidades"])
+        series_data["encuestas"].append(g["encuestas"])
+        series_data["atencion_cant"].append(g["atencion_cant"])
+        series_data["robos"].append(g["robos"])
+        series_data["miscelaneo"].append(g["miscelaneo"])
+        series_data["desviaciones"].append(g["desviaciones"])
+        series_data["solicitudes_ot"].append(g["solicitudes_ot"])
+        series_data["reclamos"].append(g["reclamos"])
+        series_data["alarmas"].append(g["alarmas"])
+        series_data["extensiones"].append(g["extensiones"])
+        series_data["onboarding"].append(g["onboarding"])
+        series_data["apertura"].append(g["apertura"])
+        series_data["cumplimiento"].append(g["cumplimiento"])
+        
+        prom_s = g["atencion_prom_s"] or 0
+        series_data["atencion_min"].append(round(prom_s/60.0, 2))
+
+    # Calcular totales para las tarjetas (dashboard.html repite la cuenta al refrescar)
+    cards = {
+        "censo_total": sum(series_data["censo"]),
+        "eventos_total": sum(series_data["eventos"]),
+        "duplicidades_total": sum(series_data["duplicidades"]),
+        "encuestas_total": sum(series_data["encuestas"]),
+        "atencion_cant_total": sum(series_data["atencion_cant"]),
+        "robos_total": sum(series_data["robos"]),
+        "miscelaneo_total": sum(series_data["miscelaneo"]),
+        "desviaciones_total": sum(series_data["desviaciones"]),
+        "solicitudes_ot_total": sum(series_data["solicitudes_ot"]),
+        "reclamos_total": sum(series_data["reclamos"]),
+        "alarmas_total": sum(series_data["alarmas"]),
+        "extensiones_total": sum(series_data["extensiones"]),
+        "onboarding_total": sum(series_data["onboarding"]),
+        "apertura_total": sum(series_data["apertura"]),
+        "cumplimiento_total": sum(series_data["cumplimiento"]),
+        "atencion_tiempo_prom_global": (
+            seconds_to_mmss(int(mean([int(x*60) for x in series_data["atencion_min"] if x>0])))
+            if any(x>0 for x in series_data["atencion_min"]) else "00:00"
+        ),
+    }
+    payload = {"labels": ordered_days, "series": series_data, "cards": cards, "bucket": bucket}
+    if bucket == "week":
+        payload["weeks"] = [week_of(date.fromisoformat(d)) for d in ordered_days]
+    return payload
+
+
 @app.get("/dashboard")
 def dashboard():
     d_from, d_to, semana_sel = resolve_filters(request.args)
+    cached = not_modified(ENTITY_MODEL)
+    if cached:
+        return cached
     if semana_sel: d_from, d_to = week_range(semana_sel)
-    db = SessionLocal()
+    d_from, d_to = clamp_range(d_from, d_to)
+    as_of = datetime.utcnow()
+    db = get_read_db()
+    bucket = request.args.get("bucket")
+    if bucket not in DASHBOARD_BUCKETS:
+        bucket = dashboard_bucket(db, d_from, d_to)
+    per_day = compute_dashboard(db, d_from, d_to, bucket)
+    release_db()  # lo que sigue (agregar y renderizar) no necesita la conexión
+
+    # el refresco pide el mismo bucket aunque el rango con datos crezca mientras tanto
+    refresh = {"url": url_for("api_dashboard", **{**request.args, "bucket": bucket}),
+               "as_of": as_of.isoformat(timespec="seconds"), "poll_s": DASHBOARD_POLL_S,
+               "events": url_for("events") if SSE_MAX_CLIENTS > 0 else None,
+               "from": d_from.isoformat() if d_from else None, "to": d_to.isoformat() if d_to else None}
+    if not per_day:
+        return render_template("dashboard.html", have_data=False, week_map=week_map(), refresh=refresh,
+                               d_from=d_from, d_to=d_to, semana_sel=semana_sel, current_tab=None)
+
+    return render_template("dashboard.html",
+                           have_data=True,
+                           week_map=week_map(),
+                           refresh=refresh,
+                           **dashboard_payload(per_day, bucket),
+                           week_anchor={"start": WEEK_ANCHOR.isoformat(), "week": WEEK_FIRST},
+                           d_from=d_from, d_to=d_to, semana_sel=semana_sel,
+                           current_tab=None)
+
+
+@app.get("/api/dashboard")
+def api_dashboard():
+    """Las mismas labels / series / cards del dashboard en JSON. Con ?since=<fecha o
+       fecha-hora UTC> (el as_of de la respuesta anterior) devuelve solo los días que
+       cambiaron desde entonces y en removed los que quedaron sin filas; la página los
+       mezcla con lo que ya tiene y recalcula las tarjetas. ?bucket=day|week|month fija la
+       agrupación (por defecto, la que corresponde al largo del rango)."""
     try:
-        per_day = {}
-        def bucket(dkey):
-            return per_day.setdefault(dkey, {
-                "censo": 0,
-                "eventos": 0,
-                "duplicidades": 0,
-                "encuestas": 0,
-                "atencion_cant": 0,
-                "atencion_tiempos": [],
-                "robos": 0,
-                "miscelaneo": 0,
-                "desviaciones": 0,
-                "solicitudes_ot": 0,
-                "reclamos": 0,
-                "alarmas": 0,
-                "extensiones": 0,
-                "onboarding": 0,
-                "apertura": 0,
-                "cumplimiento": 0
-            })
+        d_from, d_to, semana_sel = resolve_filters(request.args)
+    except ValueError as e:
+        return api_error(str(e))
+    try:
+        since = request.args.get("since")
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return api_error("since debe ser una fecha ISO (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS, UTC).")
+    if since is not None and since.tzinfo is not None:  # creado / deleted_at se guardan en UTC sin zona
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    bucket = request.args.get("bucket")
+    if bucket is not None and bucket not in DASHBOARD_BUCKETS:
+        return api_error(f"bucket debe ser uno de: {', '.join(DASHBOARD_BUCKETS)}.")
+    cached = not_modified(ENTITY_MODEL)
+    if cached:
+        return cached
+    if semana_sel: d_from, d_to = week_range(semana_sel)
+    d_from, d_to = clamp_range(d_from, d_to, notify=False)
+    as_of = datetime.utcnow()
+    db = get_read_db()
+    bucket = bucket or dashboard_bucket(db, d_from, d_to)
+
+    days = None
+    if since is not None:
+        days = changed_days(db, since - timedelta(seconds=DASHBOARD_SINCE_MARGIN_S), d_from, d_to)
+    if since is not None and days is not None:
+        keys = {bucket_start(date.fromisoformat(d), bucket).isoformat() for d in days}
+        per_day = compute_dashboard(db, d_from, d_to, bucket, keys) if keys else {}
+        payload = dashboard_payload(per_day, bucket)
+        del payload["cards"]
+        payload.update(full=False, removed=sorted(keys - set(per_day)))
+    else:
+        payload = dashboard_payload(compute_dashboard(db, d_from, d_to, bucket), bucket)
+        payload.update(full=True, removed=[])
+    release_db()
+    payload["as_of"] = as_of.isoformat(timespec="seconds")
+    return json_response(payload)
 
-        # Censo
-        q = db.query(CensusEntry)
-        if d_from: q = q.filter(CensusEntry.fecha >= d_from)
-        if d_to:   q = q.filter(CensusEntry.fecha <= d_to)
-        for r in q.all():
-            b = bucket(r.fecha.isoformat())
-            b["censo"] += (r.total or (r.censo_dia + r.censo_noche))
 
-        # Eventos
-        q = db.query(EventSeguridad)
-        if d_from: q = q.filter(EventSeguridad.fecha >= d_from)
-        if d_to:   q = q.filter(EventSeguridad.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["eventos"] += 1
+# -----------------------------------------------------------------------------
+# SCORECARD POR EMPRESA (contratistas, cruzando los módulos que registran empresa)
+# -----------------------------------------------------------------------------
+def compute_scorecard(db, d_from, d_to, empresa=None):
+    """Registros por empresa (clave normalizada) y módulo en [d_from, d_to], en una sola
+       sentencia: un GROUP BY por módulo unidos con UNION ALL. share es la fracción del
+       total del módulo en el rango que corresponde a la empresa. Con empresa (clave
+       normalizada) solo esa, y los totales siguen siendo los del módulo."""
+    parts = []
+    for entity, col in EMPRESA_COLUMN.items():
+        Model = ENTITY_MODEL[entity]
+        crit = [Model.deleted_at.is_(None), *date_criteria(ENTITY_DATE_COLUMN[entity], d_from, d_to)]
+        parts.append(
+            select(Model.empresa_norm.label("empresa"), literal(entity).label("modulo"),
+                   func.count().label("n"), func.min(col).label("nombre"))
+            .where(Model.empresa_norm == empresa if empresa else Model.empresa_norm != "", *crit)
+            .group_by(Model.empresa_norm))
+        if empresa:
+            parts.append(select(literal("").label("empresa"), literal(entity).label("modulo"),
+                                func.count().label("n"), literal("").label("nombre"))
+                         .where(Model.empresa_norm != "", *crit))
+
+    totals = dict.fromkeys(EMPRESA_COLUMN, 0)
+    empresas = {}
+    for r in db.execute(union_all(*parts)).all():
+        if r.empresa == "":  # total del módulo (solo se pide con empresa)
+            totals[r.modulo] = r.n
+            continue
+        e = empresas.setdefault(r.empresa, {"empresa": r.empresa, "nombre": r.nombre,
+                                            "counts": dict.fromkeys(EMPRESA_COLUMN, 0)})
+        e["nombre"] = min(e["nombre"], r.nombre)  # un nombre estable entre las variantes
+        e["counts"][r.modulo] = r.n
+        if not empresa:
+            totals[r.modulo] += r.n
+    for e in empresas.values():
+        e["total"] = sum(e["counts"].values())
+        e["share"] = {m: round(n / totals[m], 4) if totals[m] else 0.0 for m, n in e["counts"].items()}
+    ranking = sorted(empresas.values(), key=lambda e: (-e["total"], e["empresa"]))
+    return {"modules": list(EMPRESA_COLUMN), "totals": totals, "empresas": ranking}
+
+
+@app.get("/api/scorecard")
+def api_scorecard():
+    """Scorecard de empresas para el rango (semana / from / to); ?empresa= (cualquier variante
+       del nombre) deja solo esa. Sin filtros es la semana en curso: se calcula una vez por
+       versión de los módulos y queda en cache."""
+    try:
+        d_from, d_to, semana_sel = resolve_filters(request.args)
+    except ValueError as e:
+        return api_error(str(e))
+    empresa = normalize_empresa(request.args.get("empresa")) or None
+    current = not (semana_sel or d_from or d_to or empresa)
+    if current:
+        semana_sel = week_of(date.today())
+        d_from, d_to = week_range(semana_sel)
+    else:
+        # la semana en curso cambia sin que cambien los datos: sin filtros no hay 304
+        cached = not_modified(EMPRESA_COLUMN)
+        if cached:
+            return cached
+    d_from, d_to = clamp_range(d_from, d_to, notify=False)
+
+    if current:
+        versions = tuple(r.version for r in module_versions(EMPRESA_COLUMN).values())
+        payload = FRAGMENT_CACHE.get_or_render(
+            "scorecard", (d_from, versions), lambda: compute_scorecard(get_read_db(), d_from, d_to))
+    else:
+        payload = compute_scorecard(get_read_db(), d_from, d_to, empresa)
+    release_db()
+    return json_response({"from": d_from, "to": d_to, "semana": semana_sel, **payload})
 
-        # Duplicidades
-        q = db.query(DuplicidadEntry)
-        if d_from: q = q.filter(DuplicidadEntry.fecha >= d_from)
-        if d_to:   q = q.filter(DuplicidadEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["duplicidades"] += 1
 
-        # Encuestas
-        q = db.query(EncuestaEntry)
-        if d_from: q = q.filter(EncuestaEntry.fecha_hora >= datetime.combine(d_from, time.min))
-        if d_to:   q = q.filter(EncuestaEntry.fecha_hora <= datetime.combine(d_to, time.max))
-        for r in q.all():
-            bucket(r.fecha_hora.date().isoformat())["encuestas"] += 1
+# -----------------------------------------------------------------------------
+# BÚSQUEDA DE PERSONAS (RUT / ID interno en todos los módulos)
+# -----------------------------------------------------------------------------
+PERSON_HISTORY_MAX = int(os.environ.get("PERSON_HISTORY_MAX", "500"))  # registros por respuesta
+# Columna con el nombre de la persona, en los módulos que lo registran
+PERSON_NAME_FIELD = {"onboarding": "nombre", "robos": "nombre_cliente",
+                     "duplicidades": "nombre_usuario", "reclamos": "nombre_usuario"}
+
+
+def person_history(db, rut=None, id_norm=None):
+    """(registros, truncado): filas vigentes de todos los módulos con ese RUT o ID interno
+       (claves normalizadas), de la más reciente a la más antigua. Un UNION ALL arma la
+       línea de tiempo desde los índices (clave, fecha) y después se leen completas solo
+       las filas encontradas, una consulta por módulo con resultados."""
+    parts = []
+    for entity, Model in ENTITY_MODEL.items():
+        crit = []
+        if rut and entity in RUT_COLUMN:
+            crit.append(Model.rut_norm == rut)
+        if id_norm and entity in ID_COLUMN:
+            crit.append(Model.id_norm == id_norm)
+        if crit:
+            parts.append(select(literal(entity).label("entidad"), Model.id.label("id"),
+                                cast(ENTITY_DATE_COLUMN[entity], String).label("fecha"))
+                         .where(Model.deleted_at.is_(None), or_(*crit)))
+    if not parts:
+        return [], False
+    u = union_all(*parts).subquery()
+    timeline = db.execute(select(u).order_by(u.c.fecha.desc(), u.c.entidad, u.c.id.desc())
+                          .limit(PERSON_HISTORY_MAX + 1)).all()
+    truncated = len(timeline) > PERSON_HISTORY_MAX
+    timeline = timeline[:PERSON_HISTORY_MAX]
+
+    ids = {}
+    for r in timeline:
+        ids.setdefault(r.entidad, []).append(r.id)
+    rows = {}
+    for entity, id_list in ids.items():
+        Model = ENTITY_MODEL[entity]
+        for r in db.execute(select(*api_columns(Model, None)).where(Model.id.in_(id_list))).mappings():
+            # la entidad va en su propia clave: robos, alarmas y solicitud_ot tienen columna modulo
+            rows[(entity, r["id"])] = {"entidad": entity, **r}
+    return [rows[(r.entidad, r.id)] for r in timeline if (r.entidad, r.id) in rows], truncated
+
+
+@app.get("/api/personas")
+def api_personas():
+    """Historial de una persona en todos los módulos: ?rut= (con o sin puntos; se valida el
+       dígito verificador) y/o ?id= (ID interno). Con los dos basta que coincida uno."""
+    rut_arg = request.args.get("rut", "").strip()
+    id_arg = request.args.get("id", "").strip()
+    if not rut_arg and not id_arg:
+        return api_error("Indique rut y/o id.")
+    rut = normalize_rut(rut_arg) if rut_arg else None
+    if rut_arg and not rut:
+        return api_error(f"RUT inválido: {rut_arg} (revise el dígito verificador).")
+    id_norm = normalize_id_interno(id_arg) if id_arg else None
+    if id_arg and not id_norm:
+        return api_error(f"ID interno inválido: {id_arg}.")
+    cached = not_modified(set(RUT_COLUMN if rut else ()) | set(ID_COLUMN if id_norm else ()))
+    if cached:
+        return cached
+
+    history, truncated = person_history(get_read_db(), rut, id_norm)
+    release_db()
+    modules = {}
+    for h in history:
+        modules[h["entidad"]] = modules.get(h["entidad"], 0) + 1
+    nombres = sorted({h[PERSON_NAME_FIELD[h["entidad"]]] for h in history
+                      if h.get(PERSON_NAME_FIELD.get(h["entidad"]))})
+    return json_response({"rut": rut, "id": id_norm, "nombres": nombres, "count": len(history),
+                          "truncated": truncated, "modules": modules, "history": history})
 
-        # Atención
-        q = db.query(AtencionEntry)
-        if d_from: q = q.filter(AtencionEntry.fecha >= d_from)
-        if d_to:   q = q.filter(AtencionEntry.fecha <= d_to)
-        for r in q.all():
-            b = bucket(r.fecha.isoformat())
-            b["atencion_cant"] += r.cantidad
-            b["atencion_tiempos"].append(r.tiempo_promedio_sec)
-
-        # Robos
-        q = db.query(RoboHurtoEntry)
-        if d_from: q = q.filter(RoboHurtoEntry.fecha >= d_from)
-        if d_to:   q = q.filter(RoboHurtoEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["robos"] += 1
 
-        # Miscelaneo (filtrar por fecha de negocio)
-        q = db.query(MiscelaneoEntry)
-        if d_from: q = q.filter(MiscelaneoEntry.fecha_creacion >= d_from)
-        if d_to:   q = q.filter(MiscelaneoEntry.fecha_creacion <= d_to)
-        for r in q.all():
-            # Agrupar por la fecha de negocio; si viene nula, caer al timestamp de creación
-            key_date = r.fecha_creacion or r.creado.date()
-            bucket(key_date.isoformat())["miscelaneo"] += 1
+# -----------------------------------------------------------------------------
+# API JSON (lectura paginada por entidad)
+# -----------------------------------------------------------------------------
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+API_STREAM_BATCH = 500   # filas por fetch del cursor de servidor en /api/<entidad>.ndjson
+API_BULK_MAX = 1000      # registros por POST /api/<entidad>/bulk
 
+# entidad de la API → pestaña del panel (solo difiere encuestas/encuesta)
+ENTITY_TAB = {entity: ("encuesta" if entity == "encuestas" else entity) for entity in ENTITY_MODEL}
 
-        # Desviaciones
-        q = db.query(DesviacionEntry)
-        if d_from: q = q.filter(DesviacionEntry.fecha >= d_from)
-        if d_to:   q = q.filter(DesviacionEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["desviaciones"] += 1
 
-        # Solicitudes OT
-        # Solicitudes OT (filtrar por fecha de negocio)
-        q = db.query(SolicitudOTEntry)
-        if d_from: q = q.filter(SolicitudOTEntry.fecha_inicio >= d_from)
-        if d_to:   q = q.filter(SolicitudOTEntry.fecha_inicio <= d_to)
-        for r in q.all():
-            # Agrupar por la fecha de negocio; si viene nula, caer al timestamp de creación
-            key_date = r.fecha_inicio or r.creado.date()
-            bucket(key_date.isoformat())["solicitudes_ot"] += 1
+def json_default(v):
+    """Serializa fechas/horas en ISO 8601 (jsonify usaría formato HTTP)."""
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    raise TypeError(f"No serializable: {type(v).__name__}")
 
 
-        # Reclamos
-        q = db.query(ReclamoUsuarioEntry)
-        if d_from: q = q.filter(ReclamoUsuarioEntry.fecha >= d_from)
-        if d_to:   q = q.filter(ReclamoUsuarioEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["reclamos"] += 1
+def json_response(payload, status=200):
+    """JSON compacto (sin espacios) para las respuestas de la API."""
+    body = json.dumps(payload, default=json_default, separators=(",", ":"), ensure_ascii=False)
+    return Response(body, status=status, mimetype="application/json")
 
-        # Alarmas
-        q = db.query(ActivacionAlarmaEntry)
-        if d_from: q = q.filter(ActivacionAlarmaEntry.fecha >= d_from)
-        if d_to:   q = q.filter(ActivacionAlarmaEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["alarmas"] += 1
 
-        # Extensiones
-        q = db.query(ExtensionExcepcionEntry)
-        if d_from: q = q.filter(ExtensionExcepcionEntry.fecha_solicitud >= d_from)
-        if d_to:   q = q.filter(ExtensionExcepcionEntry.fecha_solicitud <= d_to)
-        for r in q.all():
-            bucket(r.fecha_solicitud.isoformat())["extensiones"] += 1
+def json_line(obj):
+    return json.dumps(obj, default=json_default, separators=(",", ":"), ensure_ascii=False) + "\n"
 
-        # Onboarding
-        q = db.query(OnboardingEntry)
-        if d_from: q = q.filter(OnboardingEntry.fecha_hora >= datetime.combine(d_from, time.min))
-        if d_to:   q = q.filter(OnboardingEntry.fecha_hora <= datetime.combine(d_to, time.max))
-        for r in q.all():
-            bucket(r.fecha_hora.date().isoformat())["onboarding"] += 1
 
-        # Apertura
-        q = db.query(AperturaHabitacionEntry)
-        if d_from: q = q.filter(AperturaHabitacionEntry.fecha >= d_from)
-        if d_to:   q = q.filter(AperturaHabitacionEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["apertura"] += 1
+def api_error(msg, status=400):
+    return json_response({"error": msg}, status)
 
-        # Cumplimiento
-        q = db.query(CumplimientoEECCEntry)
-        if d_from: q = q.filter(CumplimientoEECCEntry.fecha >= d_from)
-        if d_to:   q = q.filter(CumplimientoEECCEntry.fecha <= d_to)
-        for r in q.all():
-            bucket(r.fecha.isoformat())["cumplimiento"] += 1
-
-        if not per_day:
-            return render_template("dashboard.html", have_data=False, week_map=WEEK_MAP,
-                                   d_from=d_from, d_to=d_to, semana_sel=semana_sel, current_tab=None)
-
-        ordered_days = sorted(per_day.keys())
-        series_data = {
-            "censo": [],
-            "eventos": [],
-            "duplicidades": [],
-            "encuestas": [],
-            "atencion_cant": [],
-            "atencion_min": [],
-            "robos": [],
-            "miscelaneo": [],
-            "desviaciones": [],
-            "solicitudes_ot": [],
-            "reclamos": [],
-            "alarmas": [],
-            "extensiones": [],
-            "onboarding": [],
-            "apertura": [],
-            "cumplimiento": []
-        }
-
-        for k in ordered_days:
-            g = per_day[k]
-            series_data["censo"].append(g["censo"])
-            series_data["eventos"].append(g["eventos"])
-            series_data["duplicidades"].append(g["duplicidades"])
-            series_data["encuestas"].append(g["encuestas"])
-            series_data["atencion_cant"].append(g["atencion_cant"])
-            series_data["robos"].append(g["robos"])
-            series_data["miscelaneo"].append(g["miscelaneo"])
-            series_data["desviaciones"].append(g["desviaciones"])
-            series_data["solicitudes_ot"].append(g["solicitudes_ot"])
-            series_data["reclamos"].append(g["reclamos"])
-            series_data["alarmas"].append(g["alarmas"])
-            series_data["extensiones"].append(g["extensiones"])
-            series_data["onboarding"].append(g["onboarding"])
-            series_data["apertura"].append(g["apertura"])
-            series_data["cumplimiento"].append(g["cumplimiento"])
-            
-            prom_s = int(mean(g["atencion_tiempos"])) if g["atencion_tiempos"] else 0
-            series_data["atencion_min"].append(round(prom_s/60.0, 2))
-
-        # Calcular totales para las tarjetas
-        cards = {
-            "censo_total": sum(series_data["censo"]),
-            "eventos_total": sum(series_data["eventos"]),
-            "duplicidades_total": sum(series_data["duplicidades"]),
-            "encuestas_total": sum(series_data["encuestas"]),
-            "atencion_cant_total": sum(series_data["atencion_cant"]),
-            "robos_total": sum(series_data["robos"]),
-            "miscelaneo_total": sum(series_data["miscelaneo"]),
-            "desviaciones_total": sum(series_data["desviaciones"]),
-            "solicitudes_ot_total": sum(series_data["solicitudes_ot"]),
-            "reclamos_total": sum(series_data["reclamos"]),
-            "alarmas_total": sum(series_data["alarmas"]),
-            "extensiones_total": sum(series_data["extensiones"]),
-            "onboarding_total": sum(series_data["onboarding"]),
-            "apertura_total": sum(series_data["apertura"]),
-            "cumplimiento_total": sum(series_data["cumplimiento"]),
-            "atencion_tiempo_prom_global": (
-                seconds_to_mmss(int(mean([int(x*60) for x in series_data["atencion_min"] if x>0])))
-                if any(x>0 for x in series_data["atencion_min"]) else "00:00"
-            ),
-        }
-
-        return render_template("dashboard.html",
-                               have_data=True,
-                               week_map=WEEK_MAP,
-                               labels=ordered_days,
-                               series=series_data,
-                               cards=cards,
-                               d_from=d_from, d_to=d_to, semana_sel=semana_sel,
-                               current_tab=None)
-    finally:
-        db.close()
+
+def api_columns(Model, fields_arg):
+    """Resuelve ?fields=a,b,c contra las columnas del modelo. 'id' siempre va incluido
+       porque es la llave del cursor."""
+    available = Model.__table__.columns
+    if not fields_arg:
+        return [c for c in available if c.name != "deleted_at" and c.name not in NORM_COLUMN_NAMES]
+    names = [f.strip() for f in fields_arg.split(",") if f.strip()]
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return [available[n] for n in dict.fromkeys(names)]
+
+
+def api_select(entity, args):
+    """Construye el SELECT (solo columnas pedidas) con los filtros de fecha de resolve_filters()."""
+    Model = ENTITY_MODEL[entity]
+    cols = api_columns(Model, args.get("fields"))
+    d_from, d_to, _ = resolve_filters(args)
+    stmt = select(*cols).where(Model.deleted_at.is_(None))
+    stmt = filter_dates(stmt, ENTITY_DATE_COLUMN[entity], d_from, d_to)
+    return stmt.order_by(Model.id), cols
+
+
+@app.get("/api/<string:entity>")
+def api_list(entity):
+    if entity not in ENTITY_MODEL:
+        return api_error("Entidad no válida.", 404)
+    try:
+        stmt, cols = api_select(entity, request.args)
+        limit = min(max(request.args.get("limit", API_DEFAULT_LIMIT, type=int), 1), API_MAX_LIMIT)
+        cursor = request.args.get("cursor")
+        after = int(cursor) if cursor else None
+    except ValueError as e:
+        return api_error(str(e))
+    cached = not_modified([entity])
+    if cached:
+        return cached
+
+    Model = ENTITY_MODEL[entity]
+    # Keyset: id > último id entregado; se pide uno extra para saber si hay más páginas
+    if after is not None:
+        stmt = stmt.where(Model.id > after)
+    rows = get_read_db().execute(stmt.limit(limit + 1)).all()
+    release_db()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    names = [c.name for c in cols]
+    return json_response({
+        "entity": entity,
+        "count": len(rows),
+        "next_cursor": str(rows[-1].id) if has_more else None,
+        "data": [dict(zip(names, r)) for r in rows],
+    })
+
+
+@app.get("/api/<string:entity>.ndjson")
+def api_stream(entity):
+    """Descarga completa en NDJSON (una fila JSON por línea, sin BOM ni comillas CSV).
+       Usa cursor de servidor (yield_per) y genera la respuesta por lotes, así la
+       memoria no crece con el tamaño de la tabla."""
+    if entity not in ENTITY_MODEL:
+        return api_error("Entidad no válida.", 404)
+    try:
+        stmt, cols = api_select(entity, request.args)
+    except ValueError as e:
+        return api_error(str(e))
+    cached = not_modified([entity])
+    if cached:
+        return cached
+    names = [c.name for c in cols]
+    make_session = read_session_factory()  # se decide dentro del request (usa la cookie de sesión)
+
+    def generate():
+        db = make_session()
+        try:
+            result = db.execute(stmt.execution_options(yield_per=API_STREAM_BATCH))
+            for part in result.partitions():
+                yield "".join(json_line(dict(zip(names, r))) for r in part)
+        finally:
+            db.close()
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no",
+                             "Content-Disposition": f'inline; filename="{entity}.ndjson"'})
+
+
+def bulk_item(Model, build, rec):
+    """Valida un registro con el mismo parser del panel. Devuelve (obj, error)."""
+    if not isinstance(rec, dict):
+        return None, "Se esperaba un objeto JSON."
+    form = {k: ("" if v is None else str(v)) for k, v in rec.items()}
+    try:
+        obj = build(form)
+    except KeyError as e:
+        return None, f"Falta el campo {e.args[0]}."
+    except (ValueError, TypeError) as e:
+        return None, str(e)
+    missing = [c.name for c in Model.__table__.columns
+               if not c.nullable and not c.primary_key and c.default is None
+               and getattr(obj, c.name) is None]
+    if missing:
+        return None, f"Campos obligatorios vacíos: {', '.join(missing)}."
+    return obj, None
+
+
+@app.post("/api/<string:entity>/bulk")
+def api_bulk(entity):
+    """Inserta un arreglo de registros en una sola transacción. Cada ítem se valida
+       por separado; los válidos se insertan y la respuesta trae el resultado por ítem.
+       Con el header Idempotency-Key, un reenvío devuelve la respuesta original."""
+    if entity not in ENTITY_MODEL:
+        return api_error("Entidad no válida.", 404)
+    payload = request.get_json(silent=True)
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        return api_error("Se esperaba un arreglo JSON de registros (o {\"records\": [...]}).")
+    if len(records) > API_BULK_MAX:
+        return api_error(f"Máximo {API_BULK_MAX} registros por solicitud.", 413)
+
+    key = (request.headers.get("Idempotency-Key") or "").strip()[:200] or None
+    Model = ENTITY_MODEL[entity]
+    build, _ = PANEL_FORMS[ENTITY_TAB[entity]]
+
+    db = get_db()
+    if key:
+        prev = db.get(ApiIdempotencia, key)
+        if prev:
+            return bulk_replay(prev, entity)
+
+    results, objs = [], []
+    for i, rec in enumerate(records):
+        obj, err = bulk_item(Model, build, rec)
+        if err:
+            results.append({"index": i, "status": "error", "error": err})
+        else:
+            results.append({"index": i, "status": "ok"})
+            objs.append((i, obj))
+
+    db.add_all([obj for _, obj in objs])
+    db.flush()  # un INSERT por lotes; asigna ids
+    for i, obj in objs:
+        results[i]["id"] = obj.id
+
+    inserted = len(objs)
+    status = 201 if inserted == len(records) else (207 if inserted else 422)
+    body = {"entity": entity, "inserted": inserted,
+            "errors": len(records) - inserted, "results": results}
+    if key:
+        db.add(ApiIdempotencia(clave=key, entidad=entity,
+                               respuesta=json.dumps({"status": status, "body": body})))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otro reenvío con la misma clave ganó la carrera: devolver su respuesta
+        db.rollback()
+        prev = db.get(ApiIdempotencia, key) if key else None
+        if not prev:
+            raise
+        return bulk_replay(prev, entity)
+    return json_response(body, status)
+
+
+def bulk_replay(prev, entity):
+    if prev.entidad != entity:
+        return api_error("Idempotency-Key ya usada para otra entidad.", 409)
+    saved = json.loads(prev.respuesta)
+    resp = json_response(saved["body"], saved["status"])
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
 
 
 # -----------------------------------------------------------------------------
@@ -0,0 +1 @@
+"""Benchmarks locales de la app (usar SIEMPRE contra una BD de pruebas, nunca la de producción)."""
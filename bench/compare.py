@@ -0,0 +1,48 @@
+"""Compara dos reportes de bench.routes (antes → después) y marca las regresiones.
+
+    python -m bench.compare bench-abc1234.json bench-def5678.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def metric(r):
+    """Tiempo representativo de un resultado: mediana de rutas GET o tiempo del import."""
+    return r.get("ms_median", r.get("ms"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("before")
+    ap.add_argument("after")
+    ap.add_argument("--threshold", type=float, default=10.0,
+                    help="porcentaje de empeoramiento a partir del cual se marca (y sale con código 1)")
+    args = ap.parse_args()
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} → {after.get('commit')}")
+
+    regressions = 0
+    for key in sorted(set(before["results"]) | set(after["results"])):
+        a, b = before["results"].get(key), after["results"].get(key)
+        if a is None or b is None:
+            print(f"  {key:<40} {'solo antes' if b is None else 'solo después'}")
+            continue
+        ta, tb = metric(a), metric(b)
+        pct = (tb - ta) / ta * 100 if ta else 0.0
+        flag = ""
+        if pct > args.threshold:
+            flag, regressions = "  << REGRESIÓN", regressions + 1
+        stmts = ""
+        if a.get("statements") != b.get("statements"):
+            stmts = f"  sql {a.get('statements')}→{b.get('statements')}"
+        print(f"  {key:<40} {ta:>10.1f} → {tb:>10.1f} ms  {pct:+7.1f}%{stmts}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
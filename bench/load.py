@@ -0,0 +1,268 @@
+"""Prueba de carga concurrente con la misma configuración de gunicorn que producción.
+
+Levanta la app con el startCommand de render.yaml (gthread, 2 workers × 8 hilos) contra la BD
+de DATABASE_URL, y N clientes concurrentes repiten una mezcla ponderada de altas por el panel,
+listados, dashboards, exportaciones CSV e importaciones xlsx. Informa throughput, latencia
+p50/p95/p99 por tipo de request y la espera por conexiones del pool (si /metrics la expone).
+
+    DATABASE_URL=postgresql://localhost/cinco_bench python -m bench.load --reset --seed-rows 5000 \\
+        --concurrency 32 --duration 60 --out load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+import app as m
+from bench import seed as seeder
+from bench.routes import cell, git_commit, workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = {"panel": 20, "registros": 25, "dashboard": 20, "download": 15, "import": 5}
+PANEL_TABS = ["censo", "eventos", "duplicidades", "atencion", "robos", "apertura", "cumplimiento"]
+POOL_WAIT_METRIC = "app_db_pool_wait_seconds"
+
+
+def start_command(port, workers=None, threads=None, path=os.path.join(ROOT, "render.yaml")):
+    """startCommand de render.yaml con $PORT resuelto (y -w/--threads si se indican)."""
+    with open(path, encoding="utf-8") as f:
+        line = next(l for l in f if l.strip().startswith("startCommand:"))
+    args = shlex.split(line.split(":", 1)[1].strip().strip('"'))
+    args = [a.replace("0.0.0.0:$PORT", f"127.0.0.1:{port}").replace("$PORT", str(port)) for a in args]
+    for flag, value in (("-w", workers), ("--threads", threads)):
+        if value is not None:
+            args[args.index(flag) + 1] = str(value)
+    if args[0] == "gunicorn":
+        args = [sys.executable, "-m", "gunicorn"] + args[1:]
+    return args
+
+
+def wait_ready(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn terminó con código {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("gunicorn no respondió /health a tiempo")
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            "Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n"
+            ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Mix:
+    """Genera los requests de cada tipo: (tipo, método, url, cuerpo, headers)."""
+
+    def __init__(self, weights, import_rows, seed):
+        self.kinds = [k for k, w in weights.items() if w > 0]
+        self.weights = [weights[k] for k in self.kinds]
+        self.weeks = list(seeder.WEEKS)
+        self.entities = list(m.ENTITY_MODEL)
+        self.forms = {t: [self.panel_form(t, row) for row in seeder.generate(t, 200, seed)]
+                      for t in PANEL_TABS}
+        self.imports = {}
+        if "import" in self.kinds:
+            for e in ("censo", "eventos", "atencion", "apertura"):
+                tab = m.ENTITY_TAB[e]
+                self.imports[tab] = multipart("file", f"{tab}.xlsx", workbook(e, import_rows, seed))
+
+    @staticmethod
+    def panel_form(entity, row):
+        # los campos del panel son los encabezados del template en minúscula (…_MMSS sin sufijo)
+        return {h.lower().removesuffix("_mmss"): cell(h, row) or ""
+                for h in m.TEMPLATES[m.ENTITY_TAB[entity]]}
+
+    def semana(self, rng):
+        return {"semana": rng.choice(self.weeks)} if rng.random() < 0.5 else {}
+
+    def next(self, rng):
+        kind = rng.choices(self.kinds, self.weights)[0]
+        if kind == "panel":
+            tab = rng.choice(PANEL_TABS)
+            body = urlencode(rng.choice(self.forms[tab])).encode()
+            return kind, "POST", f"/panel?tab={tab}", body, {"Content-Type": "application/x-www-form-urlencoded"}
+        if kind == "registros":
+            q = {"vista": rng.choice(self.entities), **self.semana(rng)}
+            return kind, "GET", "/registros?" + urlencode(q), None, {}
+        if kind == "dashboard":
+            q = self.semana(rng)
+            return kind, "GET", "/dashboard" + ("?" + urlencode(q) if q else ""), None, {}
+        if kind == "download":
+            return kind, "GET", f"/download/{rng.choice(self.entities)}.csv", None, {}
+        tab = rng.choice(list(self.imports))
+        body, ctype = self.imports[tab]
+        return kind, "POST", f"/import/{tab}", body, {"Content-Type": ctype}
+
+
+def client(port, mix, deadline, warmup_until, samples, seed):
+    """Un usuario: conexión keep-alive propia, requests seguidos hasta el deadline."""
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    while time.time() < deadline:
+        kind, method, url, body, headers = mix.next(rng)
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, url, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            status = 0
+        if time.time() >= warmup_until:
+            samples.append((kind, time.perf_counter() - t0, status))
+    conn.close()
+
+
+def pool_wait(port, workers, tries=20):
+    """Suma de POOL_WAIT_METRIC (_sum, _count) de todos los workers; None si no se expone.
+       Cada scrape cae en un worker cualquiera: se repite hasta ver todos."""
+    rx = re.compile(rf'^{POOL_WAIT_METRIC}_(sum|count)\{{.*worker="(\d+)".*\}} (\S+)$')
+    seen = {}
+    for _ in range(tries):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.request("GET", "/metrics", headers={"Connection": "close"})
+        text = conn.getresponse().read().decode()
+        conn.close()
+        per_worker = {}
+        for line in text.splitlines():
+            mt = rx.match(line)
+            if mt:
+                acc = per_worker.setdefault(mt.group(2), [0.0, 0])
+                if mt.group(1) == "sum":
+                    acc[0] += float(mt.group(3))
+                else:
+                    acc[1] += int(float(mt.group(3)))
+        seen.update(per_worker)
+        if len(seen) >= workers:
+            break
+    if not seen:
+        return None
+    return sum(v[0] for v in seen.values()), sum(v[1] for v in seen.values())
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, seconds):
+    def stats(rows):
+        lat = sorted(r[1] * 1000 for r in rows)
+        return {"requests": len(rows), "rps": round(len(rows) / seconds, 2),
+                "errors": sum(1 for r in rows if r[2] == 0 or r[2] >= 500),
+                "p50_ms": round(percentile(lat, 50), 1) if lat else None,
+                "p95_ms": round(percentile(lat, 95), 1) if lat else None,
+                "p99_ms": round(percentile(lat, 99), 1) if lat else None,
+                "max_ms": round(lat[-1], 1) if lat else None}
+    out = {"total": stats(samples)}
+    for kind in sorted({s[0] for s in samples}):
+        out[kind] = stats([s for s in samples if s[0] == kind])
+    return out
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (value or "").split(",")):
+        k, _, w = part.partition("=")
+        if k not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"tipo desconocido: {k}")
+        mix[k] = int(w)
+    return mix
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--concurrency", type=int, default=32, help="clientes simultáneos")
+    ap.add_argument("--duration", type=float, default=60, help="segundos medidos")
+    ap.add_argument("--warmup", type=float, default=5, help="segundos iniciales que no se cuentan")
+    ap.add_argument("--port", type=int, default=8055)
+    ap.add_argument("--workers", type=int, help="sobrescribe -w de render.yaml")
+    ap.add_argument("--threads", type=int, help="sobrescribe --threads de render.yaml")
+    ap.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                    help="pesos, p.ej. panel=20,registros=25,dashboard=20,download=15,import=5")
+    ap.add_argument("--import-rows", type=int, default=200, help="filas de cada xlsx importado")
+    ap.add_argument("--seed-rows", type=int, default=0, help="si > 0, re-siembra las tablas (requiere --reset)")
+    ap.add_argument("--reset", action="store_true", help="confirma que se pueden vaciar las tablas")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="archivo del reporte JSON (por defecto, stdout)")
+    args = ap.parse_args()
+
+    if args.seed_rows:
+        if not args.reset:
+            ap.error("--seed-rows vacía las tablas de DATABASE_URL: agregue --reset para confirmarlo")
+        seeder.seed({e: args.seed_rows for e in m.ENTITY_MODEL}, args.seed, clear=True)
+    mix = Mix(args.mix, args.import_rows, args.seed)
+
+    cmd = start_command(args.port, args.workers, args.threads)
+    workers = int(cmd[cmd.index("-w") + 1])
+    print("$ " + " ".join(cmd), file=sys.stderr)
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=dict(os.environ, PORT=str(args.port)))
+    try:
+        wait_ready(args.port, proc)
+        before = pool_wait(args.port, workers)
+        samples = []  # list.append es atómico: los hilos cliente comparten la lista
+        start = time.time()
+        warmup_until = start + args.warmup
+        deadline = warmup_until + args.duration
+        threads = [threading.Thread(target=client, daemon=True,
+                                    args=(args.port, mix, deadline, warmup_until, samples, args.seed + i))
+                   for i in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        measured = time.time() - warmup_until
+        after = pool_wait(args.port, workers)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    wait = None
+    if before is not None and after is not None:
+        total_s, count = after[0] - before[0], after[1] - before[1]
+        wait = {"checkouts": count, "total_s": round(total_s, 3),
+                "mean_ms": round(total_s / count * 1000, 2) if count else None}
+    report = {
+        "commit": git_commit(),
+        "command": cmd[2:] if cmd[1] == "-m" else cmd,
+        "dialect": m.ENGINE.dialect.name,
+        "concurrency": args.concurrency,
+        "duration_s": round(measured, 1),
+        "mix": args.mix,
+        "latency": summarize(samples, measured),
+        "pool_wait": wait,
+    }
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compara la lectura ORM (entidades completas) con la lectura por tuplas de read_rows().
+
+Inserta N filas sintéticas en una tabla, mide filas/segundo y memoria pico de ambos caminos
+para las columnas del listado y las del CSV, y deshace la inserción al terminar.
+
+    DATABASE_URL=postgresql://localhost/cinco_bench python -m bench.read_path --rows 20000
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+import app as m
+
+
+def synthetic_rows(n):
+    base = date(2025, 10, 13)
+    texto = "Descripción larga del problema reportado en terreno. " * 10
+    for i in range(n):
+        yield {
+            "semana": 42 + (i % 50), "fecha": base + timedelta(days=i % 350),
+            "id_interno": f"ID{i:06d}", "empresa_contratista": f"Empresa {i % 40}",
+            "descripcion_problema": texto, "tipo_riesgo": "Medio", "pabellon": "P1",
+            "habitacion": str(100 + i % 300), "ingresar_contacto": "contacto@ejemplo.cl",
+            "nombre_usuario": "Usuario", "responsable": "Responsable", "estatus": "Abierto",
+            "notificacion_usuario": "Sí", "plan_accion": texto, "fecha_cierre": None,
+        }
+
+
+def measure(fn, repeat):
+    """Mejor tiempo de N corridas (sin tracemalloc, que distorsiona el tiempo)
+       y memoria pico en una corrida aparte."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        n = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": n, "seconds": round(best, 4),
+            "rows_per_sec": round(n / best) if best else None,
+            "peak_mib": round(peak / 2**20, 2)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=3, help="se informa la mejor de N corridas")
+    args = ap.parse_args()
+
+    entity = "duplicidades"
+    Model = m.ENTITY_MODEL[entity]
+    _, list_cols, order = m.LIST_VIEWS[entity]
+    export_cols = m.EXPORT_COLUMNS[entity]
+
+    db = m.SessionLocal()
+    try:
+        db.execute(insert(Model), list(synthetic_rows(args.rows)))
+        db.flush()
+
+        def orm(cols):
+            def run():
+                db.expunge_all()
+                n = 0
+                for r in db.query(Model).order_by(*order).all():
+                    for c in cols:
+                        getattr(r, c)
+                    n += 1
+                return n
+            return run
+
+        def tuples(cols):
+            def run():
+                n = 0
+                for r in m.read_rows(db, entity, cols, order_by=order):
+                    for c in cols:
+                        getattr(r, c)
+                    n += 1
+                return n
+            return run
+
+        report = {"entity": entity, "rows": args.rows, "results": {}}
+        for label, cols in (("listado", list_cols), ("export", export_cols)):
+            for path, fn in (("orm", orm(cols)), ("tuplas", tuples(cols))):
+                report["results"][f"{label}/{path}"] = measure(fn, args.repeat)
+        print(json.dumps(report, indent=2))
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
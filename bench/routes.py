@@ -0,0 +1,187 @@
+"""Mide las rutas pesadas (dashboard, registros, download, import) a distintos volúmenes.
+
+Por cada volumen vacía y re-siembra las 15 tablas (bench.seed), y con el cliente de pruebas
+de Flask mide dashboard(), registros() por vista, download_entity() por entidad e
+import_xlsx() con libros generados del mismo tamaño. registros() se mide en frío (vaciando
+FRAGMENT_CACHE antes de cada corrida: consulta + render) y, aparte, con la tabla ya en cache. Escribe un reporte JSON con el commit
+actual para comparar entre versiones con bench.compare.
+
+    DATABASE_URL=postgresql://localhost/cinco_bench python -m bench.routes --reset \\
+        --volumes 1000 10000 100000 --out bench-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, time as dtime
+
+from openpyxl import Workbook
+from sqlalchemy import delete, event, func, select
+
+import app as m
+from bench import seed as seeder
+
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"]) != 0
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StatementCounter:
+    """Cuenta las sentencias SQL que emite la app durante una medición."""
+
+    def __init__(self, engine):
+        self.n = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.n += 1
+
+
+def cell(header, row):
+    """Valor de la celda del template a partir de una fila generada."""
+    name = header.lower()
+    if name == "id":
+        name = "id_interno"
+    if name.endswith("_mmss"):
+        secs = row[name[:-len("_mmss")] + "_sec"]
+        return m.seconds_to_mmss(secs) if secs is not None else None
+    v = row.get(name)
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M")
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, dtime):
+        return v.strftime("%H:%M")
+    return v
+
+
+def workbook(entity, n, seed=0):
+    """Libro .xlsx con los encabezados de TEMPLATES y n filas sintéticas."""
+    headers = m.TEMPLATES[m.ENTITY_TAB[entity]]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(entity)
+    ws.append(headers)
+    for row in seeder.generate(entity, n, seed):
+        ws.append([cell(h, row) for h in headers])
+    bio = io.BytesIO()
+    wb.save(bio)
+    return bio.getvalue()
+
+
+def timed(client, counter, method, url, repeat, before=None, **kw):
+    """Mide repeat corridas (más una de calentamiento); devuelve ms y sentencias por request.
+       before() corre antes de cada corrida, fuera de la medición (p.ej. vaciar un cache)."""
+    times, size, status, stmts = [], 0, None, 0
+    for i in range(repeat + 1):
+        if before is not None:
+            before()
+        counter.n = 0
+        t0 = time.perf_counter()
+        resp = client.open(url, method=method, **kw)
+        body = resp.get_data()
+        elapsed = time.perf_counter() - t0
+        status, size, stmts = resp.status_code, len(body), counter.n
+        if i:
+            times.append(elapsed * 1000)
+    return {"status": status, "bytes": size, "statements": stmts,
+            "ms_min": round(min(times), 2), "ms_median": round(statistics.median(times), 2),
+            "ms_max": round(max(times), 2), "runs": repeat}
+
+
+def bench_import(client, counter, entity, n, seed):
+    """Importa un libro de n filas y deja la tabla como estaba (borra lo importado)."""
+    Model = m.ENTITY_MODEL[entity]
+    tab = m.ENTITY_TAB[entity]
+    data = workbook(entity, n, seed + 1)
+    with m.ENGINE.connect() as conn:
+        last_id = conn.execute(select(func.coalesce(func.max(Model.id), 0))).scalar()
+    counter.n = 0
+    t0 = time.perf_counter()
+    resp = client.post(f"/import/{tab}", data={"file": (io.BytesIO(data), f"{tab}.xlsx")},
+                       content_type="multipart/form-data")
+    elapsed = time.perf_counter() - t0
+    with client.session_transaction() as s:
+        flashes = [msg for _, msg in s.pop("_flashes", [])]
+    with m.ENGINE.begin() as conn:
+        imported = conn.execute(delete(Model).where(Model.id > last_id)).rowcount
+    result = {"status": resp.status_code, "rows": imported, "xlsx_bytes": len(data),
+              "statements": counter.n, "ms": round(elapsed * 1000, 2),
+              "rows_per_sec": round(imported / elapsed) if elapsed else None}
+    if imported != n:
+        result["error"] = "; ".join(flashes)
+    return result
+
+
+def run(volumes, entities, repeat, import_entities, seed=0):
+    client = m.app.test_client()
+    counter = StatementCounter(m.ENGINE)
+    results = {}
+    for volume in volumes:
+        t0 = time.perf_counter()
+        seeder.seed({e: volume for e in entities}, seed, clear=True)
+        print(f"[{volume}] sembrado en {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        semana = seeder.WEEKS[len(seeder.WEEKS) // 2]
+        results[f"dashboard@{volume}"] = timed(client, counter, "GET", "/dashboard", repeat)
+        results[f"dashboard?semana@{volume}"] = timed(
+            client, counter, "GET", f"/dashboard?semana={semana}", repeat)
+        for e in entities:
+            results[f"registros/{e}@{volume}"] = timed(
+                client, counter, "GET", f"/registros?vista={e}", repeat, before=m.FRAGMENT_CACHE.clear)
+            results[f"registros-cache/{e}@{volume}"] = timed(
+                client, counter, "GET", f"/registros?vista={e}", repeat)
+        for e in entities:
+            results[f"download/{e}@{volume}"] = timed(
+                client, counter, "GET", f"/download/{e}.csv", repeat)
+        for e in import_entities:
+            results[f"import/{e}@{volume}"] = bench_import(client, counter, e, volume, seed)
+        print(f"[{volume}] medido en {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--volumes", type=int, nargs="+", default=[1000, 10000, 100000],
+                    help="filas por entidad sembradas (y filas por libro importado)")
+    ap.add_argument("--entities", nargs="*", choices=sorted(m.ENTITY_MODEL), help="por defecto, todas")
+    ap.add_argument("--import-entities", nargs="*", choices=sorted(m.ENTITY_MODEL),
+                    help="entidades a importar (por defecto las mismas de --entities)")
+    ap.add_argument("--repeat", type=int, default=3, help="corridas por ruta (más una de calentamiento)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="archivo del reporte JSON (por defecto, stdout)")
+    ap.add_argument("--reset", action="store_true",
+                    help="obligatorio: confirma que se pueden vaciar las tablas de DATABASE_URL")
+    args = ap.parse_args()
+    if not args.reset:
+        ap.error("--reset es obligatorio: el benchmark vacía las tablas de la BD de DATABASE_URL")
+
+    entities = args.entities or list(m.ENTITY_MODEL)
+    import_entities = entities if args.import_entities is None else args.import_entities
+    report = {
+        "commit": git_commit(),
+        "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "dialect": m.ENGINE.dialect.name,
+        "repeat": args.repeat,
+        "volumes": args.volumes,
+        "results": run(args.volumes, entities, args.repeat, import_entities, args.seed),
+    }
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Genera datos sintéticos realistas para los 15 modelos, repartidos en las semanas 42 a 96.
+
+    DATABASE_URL=postgresql://localhost/cinco_bench python -m bench.seed --rows 10000 --reset
+
+--rows es por entidad (o --rows-<entidad> para ajustar una sola). Con --reset se vacían antes
+las tablas de las entidades; sin él se agregan filas a lo que haya.
+"""
+import argparse
+import json
+import random
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, insert, text
+
+import app as m
+
+BATCH = 5000
+# semanas fijas (no las del selector, que avanza con la fecha): misma semilla → mismos datos
+WEEKS = range(m.WEEK_FIRST, 97)
+
+EMPRESAS = [
+    "Salfa Montajes", "SALFA MONTAJES S.A.", "Sodexo Chile", "Aramark", "Komatsu Cummins",
+    "Finning Chile", "Geovita", "Tecno Fast", "Orbit Garant", "Besalco", "Sigdo Koppers",
+    "Ingeniería Ebco", "Constructora Conpax", "Emin", "Transportes CCU", "Verisure",
+] + [f"Contratista {i:02d} Ltda." for i in range(24)]
+NOMBRES = ["Juan", "María", "Pedro", "Camila", "Luis", "Francisca", "Jorge", "Valentina",
+           "Carlos", "Daniela", "José", "Catalina", "Felipe", "Constanza", "Matías", "Javiera"]
+APELLIDOS = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+             "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Hernández"]
+MODULOS = [f"M{i}" for i in range(1, 13)]
+PABELLONES = [f"P{i}" for i in range(1, 21)]
+ESTATUS = ["Abierto", "En proceso", "Cerrado"]
+RIESGOS = ["Bajo", "Medio", "Alto"]
+VIAS = ["Correo", "Teléfono", "Presencial", "WhatsApp"]
+TURNOS = ["Día", "Noche", "7x7", "4x3"]
+FRASES = [
+    "Cliente reporta que la llave no abre la puerta de la habitación.",
+    "Se detecta doble asignación de cama en el sistema de reservas.",
+    "Ruido excesivo en pasillo durante horario de descanso.",
+    "Falla de calefacción en módulo; se deriva a mantención.",
+    "Usuario solicita cambio de habitación por problemas de convivencia.",
+    "Filtración de agua en baño compartido del pabellón.",
+]
+
+
+def rut(rng):
+    """RUT chileno con dígito verificador válido (módulo 11), formato 12.345.678-5."""
+    n = rng.randint(5_000_000, 26_000_000)
+    s, mul = 0, 2
+    for d in reversed(str(n)):
+        s += int(d) * mul
+        mul = 2 if mul == 7 else mul + 1
+    dv = 11 - s % 11
+    dv = "0" if dv == 11 else "K" if dv == 10 else str(dv)
+    return f"{n:,}".replace(",", ".") + f"-{dv}"
+
+
+class Gen:
+    """Valores aleatorios reproducibles (misma semilla → mismos datos)."""
+
+    def __init__(self, seed):
+        self.r = random.Random(seed)
+        self.weeks = [m.week_range(w) for w in WEEKS]
+
+    def fecha(self):
+        d_from, _ = self.r.choice(self.weeks)
+        return d_from + timedelta(days=self.r.randrange(7))
+
+    def fecha_hora(self):
+        return datetime.combine(self.fecha(), time(self.r.randrange(24), self.r.randrange(60)))
+
+    def hora(self):
+        return time(self.r.randrange(24), self.r.randrange(0, 60, 5))
+
+    def pick(self, seq):
+        return self.r.choice(seq)
+
+    def nombre(self):
+        return f"{self.pick(NOMBRES)} {self.pick(APELLIDOS)} {self.pick(APELLIDOS)}"
+
+    def texto(self, frases=2):
+        return " ".join(self.r.choice(FRASES) for _ in range(self.r.randint(1, frases)))
+
+    def id_interno(self):
+        return f"ID{self.r.randrange(1, 20000):05d}"
+
+    def empresa(self):
+        return self.pick(EMPRESAS)
+
+    def habitacion(self):
+        return str(self.r.randrange(100, 500))
+
+    def correo(self):
+        return f"{self.pick(NOMBRES).lower()}.{self.pick(APELLIDOS).lower()}@ejemplo.cl"
+
+    def n_solicitud(self):
+        return f"SOL-{self.r.randrange(1, 10**6):06d}"
+
+
+def _censo(g):
+    cd, cn = g.r.randint(200, 900), g.r.randint(100, 600)
+    return dict(fecha=g.fecha(), censo_dia=cd, censo_noche=cn, total=cd + cn)
+
+
+def _eventos(g):
+    return dict(fecha=g.fecha(), horario=g.pick(TURNOS), que_ocurrio=g.texto(),
+                nombre_afectado=g.nombre(), accion=g.texto(1))
+
+
+def _duplicidades(g):
+    fecha = g.fecha()
+    return dict(semana=(fecha - date(2025, 10, 13)).days // 7 + 42, fecha=fecha,
+                id_interno=g.id_interno(), empresa_contratista=g.empresa(),
+                descripcion_problema=g.texto(3), tipo_riesgo=g.pick(RIESGOS),
+                pabellon=g.pick(PABELLONES), habitacion=g.habitacion(), ingresar_contacto=g.correo(),
+                nombre_usuario=g.nombre(), responsable=g.nombre(), estatus=g.pick(ESTATUS),
+                notificacion_usuario=g.pick(["Sí", "No"]), plan_accion=g.texto(),
+                fecha_cierre=g.fecha() if g.r.random() < 0.5 else None)
+
+
+def _encuestas(g):
+    row = dict(fecha_hora=g.fecha_hora(), comentarios=g.texto(1))
+    puntajes = [g.r.randint(1, 5) for _ in range(5)]
+    for i, p in enumerate(puntajes, 1):
+        row[f"q{i}_respuesta"] = ["Muy malo", "Malo", "Regular", "Bueno", "Muy bueno"][p - 1]
+        row[f"q{i}_puntaje"] = p
+    row["total"] = sum(puntajes)
+    row["promedio"] = round(sum(puntajes) / 5, 2)
+    return row
+
+
+def _atencion(g):
+    return dict(fecha=g.fecha(), tiempo_promedio_sec=g.r.randint(30, 900), cantidad=g.r.randint(1, 200))
+
+
+def _robos(g):
+    return dict(fecha=g.fecha(), hora=g.hora(), modulo=g.pick(MODULOS), habitacion=g.habitacion(),
+                empresa=g.empresa(), nombre_cliente=g.nombre(), rut=rut(g.r),
+                medio_reclamo=g.pick(VIAS), especies="Notebook, celular", observaciones=g.texto(),
+                recepciona=g.nombre())
+
+
+def _miscelaneo(g):
+    inicio = g.fecha()
+    return dict(ot=f"OT-{g.r.randrange(10**6):06d}", division="Chuquicamata", area="Hotelería",
+                lugar=g.pick(PABELLONES), ubicacion=g.habitacion(), disciplina="Mantención",
+                especialidad=g.pick(["Eléctrica", "Gasfitería", "Carpintería"]), falla=g.texto(1),
+                empresa=g.empresa(), fecha_creacion=inicio - timedelta(days=g.r.randrange(3)),
+                fecha_inicio=inicio, fecha_termino=inicio + timedelta(days=g.r.randrange(10)),
+                fecha_aprobacion=inicio, estado=g.pick(ESTATUS), comentario=g.texto(1))
+
+
+def _desviaciones(g):
+    return dict(n_solicitud=g.n_solicitud(), fecha=g.fecha(), id_interno=g.id_interno(),
+                empresa_contratista=g.empresa(), descripcion_problema=g.texto(3),
+                tipo_riesgo=g.pick(RIESGOS), tipo_solicitud=g.pick(["Reclamo", "Sugerencia"]),
+                pabellon=g.pick(PABELLONES), habitacion=g.habitacion(), via_solicitud=g.pick(VIAS),
+                quien_informa=g.nombre(), riesgo_material=g.pick(["Sí", "No"]),
+                correo_destino=g.correo())
+
+
+def _solicitud_ot(g):
+    return dict(n_solicitud=g.n_solicitud(), descripcion_problema=g.texto(2),
+                tipo_solicitud=g.pick(["Correctiva", "Preventiva"]), modulo=g.pick(MODULOS),
+                habitacion=g.habitacion(), tipo_turno=g.pick(TURNOS), jornada=g.pick(["AM", "PM"]),
+                via_solicitud=g.pick(VIAS), correo_usuario=g.correo(), tipo_tarea="Reparación",
+                ot=f"OT-{g.r.randrange(10**6):06d}",
+                fecha_inicio=g.fecha() if g.r.random() < 0.95 else None, estado=g.pick(ESTATUS),
+                tiempo_respuesta_sec=g.r.randint(60, 7200), satisfaccion_reclamo=g.pick(["Sí", "No"]),
+                motivo=g.texto(1), observacion=g.texto(1))
+
+
+def _reclamos(g):
+    return dict(n_solicitud=g.n_solicitud(), fecha=g.fecha(), id_interno=g.id_interno(),
+                empresa_contratista=g.empresa(), descripcion_problema=g.texto(3),
+                tipo_solicitud=g.pick(["Reclamo", "Sugerencia"]), pabellon=g.pick(PABELLONES),
+                habitacion=g.habitacion(), via_solicitud=g.pick(VIAS), ingresar_contacto=g.correo(),
+                nombre_usuario=g.nombre(), responsable=g.nombre(), estatus=g.pick(ESTATUS),
+                notificacion_usuario=g.pick(["Sí", "No"]), plan_accion=g.texto())
+
+
+def _alarmas(g):
+    fecha = g.fecha()
+    return dict(modulo=g.pick(MODULOS), n_habitacion=g.habitacion(), nombre_recepcionista=g.nombre(),
+                fecha=fecha, empresa=g.empresa(), id_interno=g.id_interno(), co=f"CO{g.r.randrange(999)}",
+                aviso_mantencion_h=round(g.r.uniform(0, 2), 2), llegada_mantencion_h=round(g.r.uniform(0, 3), 2),
+                aviso_lider_h=round(g.r.uniform(0, 2), 2), llegada_lider_h=round(g.r.uniform(0, 3), 2),
+                hora_reporte_salfa=g.hora(), tipo_evento=g.pick(["Humo", "Puerta", "Pánico"]),
+                tipo_actividad=g.pick(["Falsa alarma", "Real"]), fecha_reporte=fecha,
+                turno_recepcion_ingresos=g.pick(TURNOS), observaciones=g.texto(1))
+
+
+def _extensiones(g):
+    desde = g.fecha()
+    return dict(fecha_solicitud=desde - timedelta(days=g.r.randrange(5)), id_interno=g.id_interno(),
+                empresa=g.empresa(), co=f"CO{g.r.randrange(999)}", gerencia="GSC", proyecto="Proyecto RT",
+                cant_clientes=g.r.randint(1, 50), desde=desde,
+                hasta=desde + timedelta(days=g.r.randint(1, 30)), aprobador=g.nombre(), observacion=g.texto(1))
+
+
+def _onboarding(g):
+    return dict(fecha_hora=g.fecha_hora(), nombre=g.nombre(), rut=rut(g.r), empresa=g.empresa(),
+                id_interno=g.id_interno(), archivo_pdf=f"onboarding_{g.r.randrange(10**6)}.pdf")
+
+
+def _apertura(g):
+    return dict(fecha=g.fecha(), habitacion=g.habitacion(), hora=g.hora(), responsable=g.nombre(),
+                estado_chapa=g.pick(["Operativa", "Con falla", "Reemplazada"]))
+
+
+def _cumplimiento(g):
+    return dict(fecha=g.fecha(), empresa=g.empresa(), n_contrato=f"C-{g.r.randrange(10**5):05d}",
+                co=f"CO{g.r.randrange(999)}", correo_electronico=g.correo(), id_interno=g.id_interno(),
+                turno=g.pick(TURNOS))
+
+
+GENERATORS = {
+    "censo": _censo, "eventos": _eventos, "duplicidades": _duplicidades, "encuestas": _encuestas,
+    "atencion": _atencion, "robos": _robos, "miscelaneo": _miscelaneo, "desviaciones": _desviaciones,
+    "solicitud_ot": _solicitud_ot, "reclamos": _reclamos, "alarmas": _alarmas,
+    "extensiones": _extensiones, "onboarding": _onboarding, "apertura": _apertura,
+    "cumplimiento": _cumplimiento,
+}
+
+
+def generate(entity, n, seed=0):
+    """n filas (dicts columna → valor) para la entidad."""
+    g = Gen(f"{seed}:{entity}")
+    make = GENERATORS[entity]
+    return (make(g) for _ in range(n))
+
+
+def reset(conn, entities):
+    """Vacía las tablas de las entidades indicadas."""
+    tables = [m.ENTITY_MODEL[e].__tablename__ for e in entities]
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY"))
+    else:
+        for e in entities:
+            conn.execute(delete(m.ENTITY_MODEL[e]))
+
+
+def seed(volumes, seed=0, clear=False, engine=None):
+    """Inserta volumes[entidad] filas por entidad en lotes de BATCH; devuelve filas por entidad."""
+    engine = engine or m.ENGINE
+    with engine.begin() as conn:
+        if clear:
+            reset(conn, list(volumes))
+        for entity, n in volumes.items():
+            rows = generate(entity, n, seed)
+            stmt = insert(m.ENTITY_MODEL[entity])
+            norms = m.NORM_COLUMNS.get(m.ENTITY_MODEL[entity], [])
+            batch = []
+            for row in rows:
+                for source, norm, fn, _ in norms:  # el INSERT de Core no pasa por los eventos del modelo
+                    row[norm] = fn(row.get(source))
+                batch.append(row)
+                if len(batch) == BATCH:
+                    conn.execute(stmt, batch)
+                    batch = []
+            if batch:
+                conn.execute(stmt, batch)
+        m.touch_modules(conn, set(volumes), deleted=clear)  # invalida ETag y refresco incremental
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE"))
+    return dict(volumes)
+
+
+def volumes_from_args(args):
+    return {e: getattr(args, f"rows_{e}") if getattr(args, f"rows_{e}") is not None else args.rows
+            for e in (args.entities or m.ENTITY_MODEL)}
+
+
+def add_volume_args(ap, default):
+    ap.add_argument("--rows", type=int, default=default, help="filas por entidad")
+    ap.add_argument("--entities", nargs="*", choices=sorted(m.ENTITY_MODEL), help="por defecto, todas")
+    for e in m.ENTITY_MODEL:
+        ap.add_argument(f"--rows-{e}", type=int, default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_volume_args(ap, 10000)
+    ap.add_argument("--reset", action="store_true", help="vaciar las tablas antes de sembrar")
+    args = ap.parse_args()
+    print(json.dumps(seed(volumes_from_args(args), args.seed, args.reset), indent=2))
+
+
+if __name__ == "__main__":
+    main()
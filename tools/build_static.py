@@ -0,0 +1,94 @@
+"""Copia static/ a static/dist/ con el hash del contenido en el nombre, más variantes .br/.gz.
+
+    python tools/build_static.py
+
+Escribe static/dist/manifest.json ({"Aramark.png": "dist/Aramark.1a2b3c4d5e.png", ...}); la app
+lo lee al arrancar y static_url() resuelve cada asset a su versión con hash, que se sirve con
+Cache-Control inmutable. Los formatos de texto (css, js, svg, ...) se guardan además comprimidos
+para no comprimirlos en cada request; las imágenes ya vienen comprimidas. En los .css, los url()
+relativos (fuentes de static/vendor/) se reescriben a los nombres con hash.
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se generan las variantes .gz
+    brotli = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC = os.path.join(ROOT, "static")
+DIST = os.path.join(STATIC, "dist")
+COMPRESSIBLE = {".css", ".js", ".mjs", ".map", ".svg", ".json", ".txt", ".html", ".ico", ".ttf", ".eot"}
+MIN_SAVING = 0.9  # se descarta la variante si no baja al menos un 10%
+CSS_URL = re.compile(r"url\((['\"]?)([^'\")]+)\1\)")
+
+
+def sources():
+    for base, dirs, files in os.walk(STATIC):
+        if base == STATIC and "dist" in dirs:
+            dirs.remove("dist")
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(base, name)
+            yield os.path.relpath(path, STATIC).replace(os.sep, "/"), path
+
+
+def write_variants(path, data):
+    variants = []
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    variants.append((".gz", gzip.compress(data, compresslevel=9, mtime=0)))
+    for ext, body in variants:
+        if len(body) <= len(data) * MIN_SAVING:
+            with open(path + ext, "wb") as f:
+                f.write(body)
+
+
+def rewrite_css(rel, data, manifest):
+    """url(../webfonts/x.woff2) → url(../webfonts/x.<hash>.woff2), relativo al .css ya copiado a dist/."""
+    def repl(match):
+        target = match.group(2)
+        if re.match(r"^(data:|https?:|/|#)", target):
+            return match.group(0)
+        path, _, suffix = target.partition("?")
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(rel), path))
+        if resolved not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[resolved], posixpath.dirname("dist/" + rel))
+        return f"url({match.group(1)}{hashed}{'?' + suffix if suffix else ''}{match.group(1)})"
+    return CSS_URL.sub(repl, data.decode("utf-8")).encode("utf-8")
+
+
+def build():
+    shutil.rmtree(DIST, ignore_errors=True)
+    manifest = {}
+    # los .css al final: sus url() apuntan a assets que ya tienen que estar en el manifest
+    for rel, path in sorted(sources(), key=lambda s: s[0].endswith(".css")):
+        with open(path, "rb") as f:
+            data = f.read()
+        if rel.endswith(".css"):
+            data = rewrite_css(rel, data, manifest)
+        stem, ext = os.path.splitext(rel)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+        out = os.path.join(DIST, hashed)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, "wb") as f:
+            f.write(data)
+        if ext.lower() in COMPRESSIBLE:
+            write_variants(out, data)
+        manifest[rel] = f"dist/{hashed}"
+    with open(os.path.join(DIST, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+if __name__ == "__main__":
+    manifest = build()
+    print(f"{len(manifest)} assets → static/dist (brotli: {'sí' if brotli else 'no'})", file=sys.stderr)
@@ -0,0 +1,157 @@
+"""Descarga a static/vendor/ las librerías de front-end, con versión fija, para no depender de CDNs.
+
+    python tools/vendor.py
+    python tools/vendor.py --base-url https://mirror.interno/npm
+    python tools/vendor.py --update-lock   # solo al agregar o subir una versión en PACKAGES
+
+Cada archivo se verifica contra su hash en tools/vendor.lock.json; un archivo sin hash hace
+fallar la descarga (también en el build de Render). Al subir una versión en PACKAGES se corre
+con --update-lock desde una máquina de confianza, se revisan los hashes nuevos y se commitea el lock.
+Font Awesome se recorta a los íconos que aparecen en templates/: solo esas reglas de CSS y, con
+fontTools instalado, solo esos glifos en la fuente. Después corre tools/build_static.py, que le
+pone el hash a los nombres.
+"""
+import argparse
+import base64
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VENDOR = os.path.join(ROOT, "static", "vendor")
+LOCK = os.path.join(ROOT, "tools", "vendor.lock.json")
+CDN = "https://cdn.jsdelivr.net/npm"
+
+# paquete npm -> (versión, {archivo del paquete: destino en static/vendor})
+PACKAGES = {
+    "bootstrap": ("5.3.2", {
+        "dist/css/bootstrap.min.css": "css/bootstrap.min.css",
+        "dist/js/bootstrap.bundle.min.js": "js/bootstrap.bundle.min.js",
+    }),
+    "chart.js": ("4.4.1", {
+        "dist/chart.umd.js": "js/chart.umd.js",
+    }),
+    "@fortawesome/fontawesome-free": ("6.4.0", {
+        "css/fontawesome.min.css": None,  # se recortan en fontawesome()
+        "css/solid.min.css": None,
+        "webfonts/fa-solid-900.woff2": None,
+    }),
+}
+FA_ICON_RULE = re.compile(r'([^{}]+)\{content:"\\([0-9a-f]+)"\}')
+SOURCE_MAP = re.compile(rb"\n?/[*/]# sourceMappingURL=\S+( \*/)?\s*$")
+
+
+def sri(data):
+    return "sha384-" + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def fetch(base_url, package, version, path, lock, update_lock=False):
+    key = f"{package}@{version}/{path}"
+    with urllib.request.urlopen(f"{base_url}/{key}", timeout=60) as resp:
+        data = resp.read()
+    digest = sri(data)
+    if key not in lock:
+        if not update_lock:
+            raise SystemExit(f"{key}: sin hash en vendor.lock.json (agréguelo con --update-lock y commitee el lock)")
+        print(f"  nuevo en el lock: {key} {digest}", file=sys.stderr)
+        lock[key] = digest
+    elif lock[key] != digest:
+        raise SystemExit(f"{key}: el hash no coincide con vendor.lock.json ({digest})")
+    return data
+
+
+def write(dest, data):
+    path = os.path.join(VENDOR, dest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def used_icons():
+    """Clases fa-* que aparecen en los templates (incluye modificadores como fa-2x)."""
+    names = set()
+    for path in glob.glob(os.path.join(ROOT, "templates", "*.html")):
+        with open(path, encoding="utf-8") as f:
+            names.update(re.findall(r"\bfa-([a-z0-9-]+)", f.read()))
+    return names
+
+
+def fontawesome(files):
+    """CSS con las reglas base y solo los íconos usados; la fuente solid, recortada si hay fontTools."""
+    icons = used_icons()
+    codepoints = set()
+
+    def keep(match):
+        selectors = match.group(1).split(",")
+        if any(s.strip().removeprefix(".fa-").removesuffix(":before") in icons for s in selectors):
+            codepoints.add(int(match.group(2), 16))
+            return match.group(0)
+        return ""
+
+    css = FA_ICON_RULE.sub(keep, files["css/fontawesome.min.css"].decode("utf-8"))
+    missing = {i for i in icons if not re.search(rf"\.fa-{re.escape(i)}\b", css)}
+    if missing:
+        print(f"  Font Awesome: clases sin regla {sorted(missing)}", file=sys.stderr)
+    # solo woff2: los navegadores de los sitios lo soportan todos, el .ttf no se vendoriza
+    solid = files["css/solid.min.css"].decode("utf-8").replace(
+        ',url(../webfonts/fa-solid-900.ttf) format("truetype")', "")
+    write("css/fontawesome.min.css", (css + "\n" + solid).encode("utf-8"))
+
+    font = files["webfonts/fa-solid-900.woff2"]
+    try:
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+    except ImportError:
+        print("  fontTools no está instalado: se copia la fuente completa", file=sys.stderr)
+    else:
+        tt = TTFont(io.BytesIO(font))
+        subsetter = subset.Subsetter(subset.Options(flavor="woff2", layout_features=["*"]))
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(tt)
+        out = io.BytesIO()
+        tt.flavor = "woff2"
+        tt.save(out)
+        print(f"  fa-solid-900.woff2: {len(font)} → {len(out.getvalue())} bytes "
+              f"({len(codepoints)} íconos)", file=sys.stderr)
+        font = out.getvalue()
+    write("webfonts/fa-solid-900.woff2", font)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--base-url", default=CDN, help="raíz estilo jsDelivr: <base>/<paquete>@<versión>/<archivo>")
+    ap.add_argument("--update-lock", action="store_true",
+                    help="registra en el lock los archivos que no tienen hash (en vez de fallar)")
+    args = ap.parse_args()
+
+    try:
+        with open(LOCK, encoding="utf-8") as f:
+            lock = json.load(f)
+    except FileNotFoundError:
+        lock = {}
+    before = dict(lock)
+
+    for package, (version, files) in PACKAGES.items():
+        print(f"{package}@{version}", file=sys.stderr)
+        data = {path: fetch(args.base_url.rstrip("/"), package, version, path, lock, args.update_lock)
+                for path in files}
+        if package == "@fortawesome/fontawesome-free":
+            fontawesome(data)
+            continue
+        for path, dest in files.items():
+            write(dest, SOURCE_MAP.sub(b"", data[path]))  # los .map no se vendorizan
+
+    if lock != before:
+        with open(LOCK, "w", encoding="utf-8") as f:
+            json.dump(lock, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("tools/vendor.lock.json actualizado: commitéelo", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()